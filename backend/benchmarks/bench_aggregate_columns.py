@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+"""
+Aggregate computed columns (AVG, MAX, STDEV, ...): the join
+with one derived table per aggregate against the aggregates
+computed once, when the query plan is made (and cached).
+
+Usage:
+
+    python benchmarks/bench_aggregate_columns.py --rows 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import kangas as kg
+from kangas.server.queries import get_database_connection, get_query_plan
+
+COMPUTED_COLUMNS = {
+    "Above average": {"expr": "{'Score'} > AVG({'Score'})"},
+    "Scaled": {"expr": "{'Score'} / MAX({'Score'})"},
+    "Z": {"expr": "({'Score'} - AVG({'Score'})) / STDEV({'Score'})"},
+}
+WHERE_EXPR = "{'Z'} > 1"
+
+
+def make_datagrid(filename, rows):
+    dg = kg.DataGrid(columns=["Score", "Label"])
+    dg.extend(
+        [
+            [random.random() * 100, "label-%s" % random.randint(0, 9)]
+            for i in range(rows)
+        ]
+    )
+    dg.save(filename)
+
+
+def derived_tables_sql(query):
+    # The previous implementation: a comma join with one derived
+    # table per aggregate
+    aggregates = {
+        "avg_score": "AVG(column_1)",
+        "max_score": "MAX(column_1)",
+        "stdev_score": "STDEV(column_1)",
+    }
+    databases = ["datagrid"] + [
+        "(SELECT rowid, %s AS %s FROM datagrid)" % (expr, name)
+        for name, expr in aggregates.items()
+    ]
+    select_expr_as = [
+        "column_0",
+        "column_1",
+        "column_2",
+        "column_1 > avg_score AS cc0",
+        "(column_1 / max_score) AS cc1",
+        "((column_1 - avg_score) / stdev_score) AS cc2",
+    ]
+    return query.format(
+        select_expr_as=", ".join(select_expr_as),
+        databases=", ".join(databases),
+        where="cc2 > 1",
+    )
+
+
+def query_plan_sql(conn, dgid, query):
+    plan = get_query_plan(conn, dgid, COMPUTED_COLUMNS, WHERE_EXPR)
+    metadata, columns, select_expr_as, databases = plan.unpack()
+    return query.format(
+        select_expr_as=", ".join(select_expr_as),
+        databases=", ".join(databases),
+        where=plan.where_sql,
+    )
+
+
+def timeit(conn, sql, repeat):
+    start_time = time.perf_counter()
+    for i in range(repeat):
+        conn.execute(sql).fetchall()
+    return (time.perf_counter() - start_time) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", nargs="+", type=int, default=[100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    queries = {
+        "count": "SELECT COUNT() FROM (SELECT {select_expr_as} FROM {databases} WHERE {where})",
+        "page": "SELECT {select_expr_as} FROM {databases} WHERE {where} ORDER BY cc1 DESC LIMIT 10",
+    }
+    print(
+        "%10s %10s %18s %18s %10s"
+        % ("rows", "query", "derived (ms)", "plan (ms)", "speedup")
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            dgid = os.path.join(directory, "aggregates-%s.datagrid" % rows)
+            make_datagrid(dgid, rows)
+            conn = get_database_connection(dgid)
+            for name, query in queries.items():
+                before_sql = derived_tables_sql(query)
+                after_sql = query_plan_sql(conn, dgid, query)
+                assert (
+                    conn.execute(before_sql).fetchall()
+                    == conn.execute(after_sql).fetchall()
+                )
+                before = timeit(conn, before_sql, args.repeat)
+                after = timeit(conn, after_sql, args.repeat)
+                print(
+                    "%10s %10s %18.1f %18.1f %9.1fx"
+                    % (rows, name, before * 1000, after * 1000, before / after)
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+"""
+Single-asset lookup latency against the number of assets,
+with and without the unique index on assets.asset_id.
+
+Usage:
+
+    python benchmarks/bench_asset_lookup.py --counts 1000 10000 100000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from kangas.datatypes.datagrid import CREATE_ASSET_INDEX_SQL
+from kangas.datatypes.utils import generate_guid
+
+LOOKUP_SQL = (
+    "SELECT asset_data, asset_type, asset_thumbnail FROM assets WHERE asset_id = ?;"
+)
+
+
+def make_assets(filename, count, asset_size):
+    conn = sqlite3.connect(filename)
+    conn.execute(
+        "CREATE TABLE assets (asset_id TEXT, asset_type TEXT, asset_data BLOB, asset_metadata JSON, asset_thumbnail BLOB);"
+    )
+    asset_ids = [generate_guid() for i in range(count)]
+    blob = os.urandom(asset_size)
+    conn.executemany(
+        "INSERT INTO assets VALUES (?, 'Image', ?, '{}', NULL);",
+        ((asset_id, blob) for asset_id in asset_ids),
+    )
+    conn.commit()
+    conn.close()
+    return asset_ids
+
+
+def time_lookups(filename, asset_ids, lookups):
+    conn = sqlite3.connect(filename)
+    sample = random.sample(asset_ids, min(lookups, len(asset_ids)))
+    start_time = time.perf_counter()
+    for asset_id in sample:
+        conn.execute(LOOKUP_SQL, (asset_id,)).fetchone()
+    elapsed = time.perf_counter() - start_time
+    conn.close()
+    return elapsed / len(sample)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--asset-size", type=int, default=2048)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    print("%10s %15s %15s %10s" % ("assets", "no index (ms)", "index (ms)", "speedup"))
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.counts:
+            filename = os.path.join(directory, "assets-%s.datagrid" % count)
+            asset_ids = make_assets(filename, count, args.asset_size)
+            before = time_lookups(filename, asset_ids, args.lookups)
+
+            conn = sqlite3.connect(filename)
+            conn.execute(CREATE_ASSET_INDEX_SQL)
+            conn.commit()
+            conn.close()
+            after = time_lookups(filename, asset_ids, args.lookups)
+
+            print(
+                "%10s %15.3f %15.3f %9.1fx"
+                % (count, before * 1000, after * 1000, before / after)
+            )
+
+
+if __name__ == "__main__":
+    main()
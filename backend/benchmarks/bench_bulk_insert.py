@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+"""
+Rows per second written by DataGrid.save(), for rows of scalars
+and rows with an image, at different insert batch sizes.
+
+Usage:
+
+    python benchmarks/bench_bulk_insert.py --scalar-rows 1000000 --image-rows 100000
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import PIL.Image
+
+import kangas as kg
+import kangas.datatypes.datagrid
+
+
+def make_scalar_rows(rows):
+    return [
+        [i, random.random(), "label-%s" % random.randint(0, 9)] for i in range(rows)
+    ]
+
+
+def make_image_rows(rows):
+    # Small, distinct images, so that each is a new asset:
+    pixels = np.random.randint(0, 256, (8, 8, 3), dtype=np.uint8)
+    data = []
+    for i in range(rows):
+        pixels[0, 0] = [i % 256, (i // 256) % 256, (i // 65536) % 256]
+        data.append([i, kg.Image(PIL.Image.fromarray(pixels)), random.random()])
+    return data
+
+
+def save(filename, columns, rows):
+    dg = kg.DataGrid(columns=columns)
+    dg.extend(rows)
+    # Don't count the progress bars:
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        dg.save(filename)
+        return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scalar-rows", type=int, default=1000000)
+    parser.add_argument("--image-rows", type=int, default=100000)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 10000])
+    args = parser.parse_args()
+
+    print(
+        "%10s %10s %12s %12s %15s"
+        % ("rows", "kind", "batch size", "time (s)", "rows/second")
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for kind, columns, make_rows, rows in [
+            ("scalar", ["ID", "Score", "Label"], make_scalar_rows, args.scalar_rows),
+            ("image", ["ID", "Image", "Score"], make_image_rows, args.image_rows),
+        ]:
+            for batch_size in args.batch_sizes:
+                kangas.datatypes.datagrid.INSERT_BATCH_SIZE = batch_size
+                filename = os.path.join(
+                    directory, "%s-%s.datagrid" % (kind, batch_size)
+                )
+                seconds = save(filename, columns, make_rows(rows))
+                print(
+                    "%10s %10s %12s %12.1f %15.0f"
+                    % (rows, kind, batch_size, seconds, rows / seconds)
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+"""
+Group cell aggregation (histogram and category counts): the
+GROUP_CONCAT string path against the SQL/streamed path.
+
+Usage:
+
+    python benchmarks/bench_group_aggregation.py --rows 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+import kangas as kg
+from kangas.server.queries import (
+    get_column_value,
+    get_database_connection,
+    get_field_expr,
+    get_field_name,
+    get_group_by_rows,
+    get_query_plan,
+    histogram,
+    parse_comma_separated_values,
+    select_category,
+    select_histogram,
+)
+
+
+def make_datagrid(filename, rows, groups):
+    dg = kg.DataGrid(columns=["Group", "Score", "Label"])
+    dg.extend(
+        [
+            [
+                "group-%s" % (i % groups),
+                random.random() * 100,
+                "label-%s" % random.randint(0, 9),
+            ]
+            for i in range(rows)
+        ]
+    )
+    dg.save(filename)
+
+
+def group_concat_path(dgid, column_name, group_value):
+    # The previous implementation: one string per group, parsed in Python
+    conn = get_database_connection(dgid)
+    cur = conn.cursor()
+    plan = get_query_plan(conn, dgid, None, None)
+    metadata, columns, select_expr_as, databases = plan.unpack()
+    rows = get_group_by_rows(
+        cur,
+        get_field_name("Group", metadata),
+        get_field_expr("Group", metadata),
+        get_field_name(column_name, metadata),
+        get_field_expr(column_name, metadata),
+        get_column_value(group_value, "Group", metadata),
+        "1",
+        databases,
+        select_expr_as,
+    )
+    raw_value = rows[0][0]
+    if column_name == "Score":
+        return histogram(
+            cur, metadata, parse_comma_separated_values(raw_value), "Score"
+        )
+    else:
+        return Counter(v.replace("&comma;", ",") for v in raw_value.split(","))
+
+
+def timeit(function, repeat):
+    start_time = time.perf_counter()
+    for i in range(repeat):
+        function()
+    return (time.perf_counter() - start_time) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", nargs="+", type=int, default=[100000, 1000000])
+    parser.add_argument("--groups", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        "%10s %10s %18s %18s %10s"
+        % ("rows", "cell", "GROUP_CONCAT (ms)", "SQL (ms)", "speedup")
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            dgid = os.path.join(directory, "groups-%s.datagrid" % rows)
+            make_datagrid(dgid, rows, args.groups)
+            for column_name, select in [
+                ("Score", select_histogram),
+                ("Label", select_category),
+            ]:
+                before = timeit(
+                    lambda: group_concat_path(dgid, column_name, "group-0"),
+                    args.repeat,
+                )
+                after = timeit(
+                    lambda: select(
+                        dgid, "Group", None, column_name, "group-0", None, None, None
+                    ),
+                    args.repeat,
+                )
+                print(
+                    "%10s %10s %18.1f %18.1f %9.1fx"
+                    % (rows, column_name, before * 1000, after * 1000, before / after)
+                )
+
+
+if __name__ == "__main__":
+    main()
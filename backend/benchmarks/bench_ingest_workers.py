@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+"""
+Images per second added to a saved DataGrid (with thumbnails) by
+DataGrid.extend(), with the PNG encoding and thumbnails made in
+different numbers of worker processes.
+
+Usage:
+
+    python benchmarks/bench_ingest_workers.py --rows 10000 --workers 1 4 8
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import PIL.Image
+
+import kangas as kg
+
+
+def make_rows(rows, size):
+    pixels = np.random.randint(0, 256, (size, size, 3), dtype=np.uint8)
+    data = []
+    for i in range(rows):
+        # Distinct images, so that each is a new asset:
+        image = PIL.Image.fromarray(np.roll(pixels, i, axis=1))
+        data.append([i, image])
+    return data
+
+
+def extend(filename, rows, workers):
+    # The first row sets the column types:
+    dg = kg.DataGrid(columns=["ID", "Image"])
+    dg.extend(rows[:1])
+    # Don't count the progress bars:
+    with contextlib.redirect_stdout(io.StringIO()):
+        dg.save(filename, create_thumbnails=True)
+        start_time = time.perf_counter()
+        dg.extend(rows[1:], workers=workers)
+        return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 4])
+    args = parser.parse_args()
+
+    print("%10s %10s %12s %15s" % ("rows", "workers", "time (s)", "rows/second"))
+    with tempfile.TemporaryDirectory() as directory:
+        for workers in args.workers:
+            filename = os.path.join(directory, "workers-%s.datagrid" % workers)
+            seconds = extend(filename, make_rows(args.rows, args.size), workers)
+            print(
+                "%10s %10s %12.1f %15.0f"
+                % (args.rows - 1, workers, seconds, (args.rows - 1) / seconds)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+"""
+Functions on JSON columns (len, sum, any, keys, in, ...): the
+Python SQL functions against the SQLite JSON SQL.
+
+Usage:
+
+    python benchmarks/bench_json_functions.py --rows 100000
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import time
+
+from kangas.server.computed_columns import JSON_FUNCTIONS, json_function
+from kangas.server.queries import add_python_functions
+
+
+def make_table(conn, rows):
+    conn.execute("CREATE TABLE datagrid (column_1 TEXT, column_2 TEXT, column_3 TEXT);")
+    data = []
+    for i in range(rows):
+        values = [random.randint(0, 9) for j in range(random.randint(1, 10))]
+        labels = {"label-%s" % j: random.random() for j in range(random.randint(0, 5))}
+        data.append((json.dumps(values), json.dumps(labels), json.dumps([values] * 3)))
+    conn.executemany("INSERT INTO datagrid VALUES (?, ?, ?);", data)
+
+
+def timeit(conn, sql, repeat):
+    start_time = time.perf_counter()
+    for i in range(repeat):
+        conn.execute(sql).fetchall()
+    return (time.perf_counter() - start_time) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(":memory:")
+    add_python_functions(conn)
+    make_table(conn, args.rows)
+
+    print(
+        "%15s %18s %18s %10s" % ("function", "Python (ms)", "JSON SQL (ms)", "speedup")
+    )
+    for function_name in JSON_FUNCTIONS:
+        # A list of numbers, a dict, or a list of lists:
+        if function_name in ["KEYS_OF", "VALUES_OF"]:
+            column = "column_2"
+        elif function_name == "FLATTEN":
+            column = "column_3"
+        else:
+            column = "column_1"
+        if function_name == "IN_OBJ":
+            python_sql = "SELECT IN_OBJ(5, %s) FROM datagrid" % column
+            json_sql = json_function(function_name, "{'x'}", "5")
+        else:
+            python_sql = "SELECT %s(%s) FROM datagrid" % (function_name, column)
+            json_sql = json_function(function_name, "{'x'}")
+        json_sql = "SELECT %s FROM datagrid" % json_sql.format(**{"'x'": column})
+
+        before = timeit(conn, python_sql, args.repeat)
+        after = timeit(conn, json_sql, args.repeat)
+        print(
+            "%15s %18.1f %18.1f %9.1fx"
+            % (function_name, before * 1000, after * 1000, before / after)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -71,6 +71,8 @@ class Asset:
 
         NOTE: will only log an asset once in each datagrid db.
         """
+        if datagrid.content_asset_ids:
+            datagrid._set_content_asset_id(self)
         datagrid._log(
             self.asset_id, self.ASSET_TYPE, self.asset_data, self.metadata, row_id
         )
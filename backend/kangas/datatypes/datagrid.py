@@ -11,16 +11,21 @@
 #    All rights reserved                             #
 ######################################################
 
+import concurrent.futures
+import contextlib
 import csv
 import io
+import itertools
 import json
 import logging
 import math
 import os
 import sqlite3
 import tempfile
+import threading
 import urllib
-from collections import defaultdict
+import urllib.request
+from collections import defaultdict, deque
 
 import numpy as np
 
@@ -32,6 +37,13 @@ from ..utils import (
 )
 from .base import Asset
 from .serialize import ASSET_TYPE_MAP, DATAGRID_TYPES
+from .sketches import (
+    HyperLogLog,
+    QuantileSketch,
+    TopK,
+    get_histogram,
+    update_text_sketches,
+)
 from .utils import (
     RESERVED_NAMES,
     _verify_box,
@@ -43,6 +55,7 @@ from .utils import (
     create_columns,
     download_filename,
     expand_mask,
+    generate_content_id,
     get_annotations_from_layers,
     get_labels_from_annotations,
     get_mask_from_annotations,
@@ -55,11 +68,268 @@ from .utils import (
 
 LOGGER = logging.getLogger(__name__)
 VERSION = 1
+INSERT_BATCH_SIZE = 10000
+NUMERIC_TYPES = ["FLOAT", "INTEGER", "ROW_ID"]
+STATS_WORKERS = int(os.environ.get("KANGAS_STATS_WORKERS", min(4, os.cpu_count() or 1)))
+INGEST_WORKERS = int(os.environ.get("KANGAS_INGEST_WORKERS", 1))
+ENCODE_CHUNK_SIZE = 64
+CREATE_ASSET_INDEX_SQL = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS assets_asset_id ON assets (asset_id);"
+)
+
+
+def create_column_index(conn, column_name, field_name):
+    """
+    Create an index on a datagrid column, and record it in
+    the "indexes" setting.
+
+    Args:
+        conn: a writable connection to the datagrid
+        column_name: (str) the name of the column
+        field_name: (str) the column's field_name (column_N)
+
+    Returns: the dict of indexes, column_name to index name
+    """
+    index_name = "datagrid_%s" % field_name
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS %s ON datagrid (%s);" % (index_name, field_name)
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT);"
+    )
+    row = conn.execute("SELECT value FROM settings WHERE name = 'indexes';").fetchone()
+    indexes = json.loads(row[0]) if row and row[0] else {}
+    indexes[column_name] = index_name
+    conn.execute(
+        "INSERT OR REPLACE INTO settings (name, value) VALUES ('indexes', ?);",
+        [json.dumps(indexes)],
+    )
+    conn.commit()
+    return indexes
+
+
+def get_numeric_aggregates(conn, field_names, where="1"):
+    """
+    Get the aggregates of numeric columns in one pass. The variance
+    is from sums of the values shifted by one of them, which keeps
+    it accurate when the mean is large compared to the spread.
+
+    Args:
+        conn: a connection to the datagrid
+        field_names: (list of str) the columns' field names
+        where: (optional, str) SQL for the rows to include
+
+    Returns: a dict of field_name to (min, max, avg, total, count,
+        variance)
+    """
+    selections = []
+    for field_name in field_names:
+        shifted = "({field_name} - (SELECT {field_name} FROM datagrid WHERE {field_name} IS NOT NULL LIMIT 1))".format(
+            field_name=field_name
+        )
+        selections += [
+            "MIN(%s)" % field_name,
+            "MAX(%s)" % field_name,
+            "AVG(%s)" % field_name,
+            "TOTAL(%s)" % field_name,
+            "COUNT(%s)" % field_name,
+            "TOTAL(%s)" % shifted,
+            "TOTAL(%s * %s)" % (shifted, shifted),
+        ]
+    row = conn.execute(
+        "SELECT %s FROM datagrid WHERE %s;" % (", ".join(selections), where)
+    ).fetchone()
+
+    results = {}
+    for i, field_name in enumerate(field_names):
+        minimum, maximum, avg, total, count, sum1, sum2 = row[i * 7 : (i + 1) * 7]
+        # The population variance:
+        variance = max(0.0, (sum2 - sum1 * sum1 / count) / count) if count else None
+        results[field_name] = (
+            minimum,
+            maximum,
+            avg,
+            total,
+            count,
+            variance,
+        )
+    return results
+
+
+def get_count_unique(conn, field_names):
+    """
+    Get the exact number of distinct values of columns, in one pass.
+
+    Args:
+        conn: a connection to the datagrid
+        field_names: (list of str) the columns' field names
+
+    Returns: a dict of field_name to count_unique
+    """
+    row = conn.execute(
+        "SELECT %s FROM datagrid;"
+        % ", ".join("COUNT(DISTINCT %s)" % field_name for field_name in field_names)
+    ).fetchone()
+    return dict(zip(field_names, row))
+
+
+def can_merge_stats(column_type, stats):
+    """
+    Can the stats of new rows be merged with these saved stats?
+
+    Args:
+        column_type: (str) the column type
+        stats: [min, max, avg, variance, total, stddev, other, name]
+            from the metadata table
+    """
+    if column_type not in ["FLOAT", "INTEGER", "ROW_ID", "TEXT", "JSON", "DATETIME"]:
+        return False
+    # Saved by this version, so has what is needed to merge:
+    other = json.loads(stats[6]) if stats[6] else {}
+    return "count" in other and (column_type != "TEXT" or "top" in other)
+
+
+def merge_stats(column_type, stats, new_stats):
+    """
+    Merge the saved stats of a column with the stats of rows
+    added to it.
+
+    Args:
+        column_type: (str) the column type
+        stats: [min, max, avg, variance, total, stddev, other, name]
+            from the metadata table
+        new_stats: the same, for just the new rows, with a numeric
+            column's histogram over the saved min and max
+
+    Returns: the merged [min, max, avg, variance, total, stddev, other, name]
+    """
+    minimum, maximum, average, variance, total, stddev, other, name = stats
+    new_minimum, new_maximum, new_average, new_variance, new_total = new_stats[:5]
+    other = json.loads(other)
+    new_other = json.loads(new_stats[6])
+    count = other["count"]
+    new_count = new_other["count"]
+    merged = dict(other, count=count + new_count)
+    if new_count == 0 and column_type != "TEXT":
+        return list(stats)
+
+    if minimum is None or (new_minimum is not None and new_minimum < minimum):
+        minimum = new_minimum
+    if maximum is None or (new_maximum is not None and new_maximum > maximum):
+        maximum = new_maximum
+
+    if column_type in ["FLOAT", "INTEGER", "ROW_ID"]:
+        if count == 0:
+            return list(new_stats[:6]) + [new_stats[6], name]
+        # Combine the means and sums of squared deviations:
+        delta = new_average - average
+        m2 = variance * count + new_variance * new_count
+        m2 += delta**2 * count * new_count / (count + new_count)
+        average += delta * new_count / (count + new_count)
+        variance = m2 / (count + new_count)
+        stddev = math.sqrt(variance)
+        total += new_total
+        # Distinct values can't be merged; at most (see
+        # DataGrid._update_stats(), which counts them):
+        merged["count_unique"] = min(
+            count + new_count, other["count_unique"] + new_other["count_unique"]
+        )
+        merged["count_unique_exact"] = False
+        sketch = QuantileSketch.from_dict(other["quantiles"])
+        sketch.merge(QuantileSketch.from_dict(new_other["quantiles"]))
+        merged["quantiles"] = sketch.to_dict()
+        # The histogram bins are only the same if the range is:
+        merged.pop("histogram", None)
+        if (
+            (minimum, maximum) == tuple(stats[:2])
+            and "histogram" in other
+            and "histogram" in new_other
+        ):
+            merged["histogram"] = {
+                "bins": [
+                    a + b
+                    for a, b in zip(
+                        other["histogram"]["bins"], new_other["histogram"]["bins"]
+                    )
+                ],
+                "labels": other["histogram"]["labels"],
+            }
+    elif column_type == "TEXT":
+        top = TopK.from_dict(other["top"])
+        top.merge(TopK.from_dict(new_other["top"]))
+        distinct = HyperLogLog.from_dict(other["distinct"])
+        distinct.merge(HyperLogLog.from_dict(new_other["distinct"]))
+        merged["count"] = top.n
+        merged["nulls"] = other["nulls"] + new_other["nulls"]
+        merged["top"] = top.to_dict()
+        merged["distinct"] = distinct.to_dict()
+        merged["count_unique"] = len(top.counts) if top.exact else distinct.count()
+        merged["count_unique_exact"] = top.exact
+    elif column_type == "JSON":
+        completions = defaultdict(set)
+        for key, value in list(other["completions"].items()) + list(
+            new_other["completions"].items()
+        ):
+            completions[key].update(value)
+        merged["completions"] = {key: list(value) for key, value in completions.items()}
+    elif column_type == "DATETIME":
+        total += new_total
+
+    return [
+        minimum,
+        maximum,
+        average,
+        variance,
+        total,
+        stddev,
+        json.dumps(merged),
+        name,
+    ]
+
+
+def encode_assets(rows, image_columns, create_thumbnails):
+    """
+    Encode the PIL images of rows as Images, and make the thumbnails
+    of their assets. This runs in a worker process; see
+    DataGrid.extend(workers=...).
+
+    Args:
+        rows: a list of dicts of column name to PIL image or asset
+        image_columns: (set) the names of columns whose PIL images
+            become Images
+        create_thumbnails: (bool) if True, make the thumbnails
+
+    Returns: a list of (values, thumbnails) for each row, where values
+        is a dict of column name to new value, and thumbnails is a dict
+        of asset_id to thumbnail
+    """
+    import PIL.Image
+
+    from .image import Image
+
+    results = []
+    for row in rows:
+        values = {}
+        thumbnails = {}
+        for column_name, value in row.items():
+            if isinstance(value, PIL.Image.Image):
+                if column_name not in image_columns:
+                    continue
+                value = values[column_name] = Image(value)
+            asset_class = ASSET_TYPE_MAP.get(value.ASSET_TYPE.lower())
+            if create_thumbnails and hasattr(asset_class, "generate_thumbnail"):
+                thumbnails[value.asset_id] = asset_class.generate_thumbnail(
+                    value.asset_data, value.metadata
+                )
+        results.append((values, thumbnails))
+    return results
 
 
 def _convert_setting(value, desired_type):
     if value is None:
         return None
+    elif desired_type == dict:
+        return json.loads(value)
     elif desired_type == int:
         return int(value)
     elif desired_type == bool:
@@ -189,10 +459,18 @@ class DataGrid:
         self.heuristics = heuristics
         self.about = ""
         self.create_thumbnails = False
+        self.content_asset_ids = False
+        self.indexes = {}
         self.name = name
         self._data = []
         self._columns = {}
         self._on_disk = False
+        # Assets logged, but not yet inserted:
+        self._asset_rows = []
+        # Thumbnails made by workers, by asset_id; see _encode_assets():
+        self._thumbnails = {}
+        # Columns whose stats need updating; see _mark_dirty():
+        self._dirty_columns = {}
         # Cached:
         self._schema = None
 
@@ -1004,10 +1282,16 @@ class DataGrid:
             dg.filename = filename + ".datagrid"
         return dg
 
-    def info(self):
+    def info(self, exact=False):
         """
         Display information about the DataGrid.
 
+        Args:
+            exact: (optional, bool) if True, count the non-null values
+                of each column, and their size in bytes, in one query
+                over the data; otherwise, use the counts saved with
+                the statistics where there are some
+
         Example:
         ```python
         >>> dg.info()
@@ -1026,37 +1310,73 @@ class DataGrid:
         7   Category 10                      500 TEXT
         ```
         """
+        columns = self.get_columns()
+        sizes = None
+        if not self._on_disk:
+            not_null_counts = {column: 0 for column in columns}
+            for row in self._data:
+                for column in columns:
+                    if column in row and not is_null(row[column]):
+                        not_null_counts[column] += 1
+        else:
+            not_null_counts, sizes = self._get_column_counts(columns, exact)
+
         widths = (3, 20, 15, 20)
         line_format = "%%-%ss %%-%ss %%%ss %%-%ss" % widths
+        headings = ("#", "Column", "Non-Null Count", "DataGrid Type")
+        if sizes is not None:
+            widths += (15,)
+            line_format += " %%%ss" % widths[-1]
+            headings += ("Size (bytes)",)
         print("DataGrid (%s)" % tuple(["on disk" if self._on_disk else "in memory"]))
         print("    Name   :", self.name)
         print("    Rows   :", format(self.nrows, ","))
-        print("    Columns:", format(len(self.get_columns()), ","))
-        print(line_format % ("#", "Column", "Non-Null Count", "DataGrid Type"))
-        print(
-            line_format
-            % ("-" * widths[0], "-" * widths[1], "-" * widths[2], "-" * widths[3])
-        )
-        for c, column in enumerate(self.get_columns()):
-            if not self._on_disk:
-                not_null_count = len(
-                    [
-                        1
-                        for row in self._data
-                        if column in row and not is_null(row[column])
-                    ]
-                )
-            else:
-                not_null_count = self.select_count(where="{'%s'} is not None" % column)
-            print(
-                line_format
-                % (
-                    c + 1,
-                    column[: widths[1]],
-                    format(not_null_count, ","),
-                    self._columns[column],
-                )
+        print("    Columns:", format(len(columns), ","))
+        print(line_format % headings)
+        print(line_format % tuple("-" * width for width in widths))
+        for c, column in enumerate(columns):
+            values = (
+                c + 1,
+                column[: widths[1]],
+                format(not_null_counts[column], ","),
+                self._columns[column],
             )
+            if sizes is not None:
+                values += (format(sizes[column], ","),)
+            print(line_format % values)
+
+    def _get_column_counts(self, columns, exact=False):
+        """
+        Get the non-null counts of saved columns, from the saved
+        statistics unless exact, and the rest with one query.
+
+        Returns: (counts, sizes), where sizes is None unless exact
+        """
+        schema = self.get_schema()
+        counts = {}
+        if not exact:
+            for name, other in self.conn.execute("SELECT name, other FROM metadata;"):
+                other = json.loads(other) if other else {}
+                if name in columns and "count" in other:
+                    counts[name] = other["count"]
+
+        missing = [column for column in columns if column not in counts]
+        selections = ["COUNT(%s)" % schema[column]["field_name"] for column in missing]
+        if exact:
+            selections += [
+                "TOTAL(LENGTH(CAST(%s AS BLOB)))" % schema[column]["field_name"]
+                for column in missing
+            ]
+        if not selections:
+            return counts, None
+
+        row = self.conn.execute(
+            "SELECT %s FROM datagrid;" % ", ".join(selections)
+        ).fetchone()
+        counts.update(zip(missing, row))
+        if exact:
+            return counts, dict(zip(missing, map(int, row[len(missing) :])))
+        return counts, None
 
     def head(self, n=5):
         """
@@ -1357,8 +1677,73 @@ class DataGrid:
         result = cursor.rowcount
         self.conn.commit()
         if result > 0:
+            # The stats are only of used assets, so don't change
             print("Deleted %s unused assets" % result)
-            self._compute_stats()
+
+    def dedupe_assets(self):
+        """
+        Store identical assets once. Assets with the same type, data,
+        and metadata as an earlier asset are deleted, and the rows that
+        used them use the earlier asset.
+
+        Returns: the number of assets deleted
+
+        Example:
+        ```python
+        >>> dg = DataGrid("augmented.datagrid")
+        >>> dg.dedupe_assets()
+        ```
+        """
+        if not self._on_disk:
+            raise Exception("an in-memory DataGrid doesn't have assets; save first")
+
+        # Map each duplicate to the first asset with its content:
+        first_asset_ids = {}
+        asset_map = []
+        for asset_id, asset_type, asset_data, asset_metadata in self.conn.execute(
+            "SELECT asset_id, asset_type, asset_data, asset_metadata FROM assets ORDER BY rowid;"
+        ):
+            metadata = json.loads(asset_metadata) if asset_metadata else None
+            content_id = generate_content_id(asset_type, asset_data, metadata)
+            if content_id in first_asset_ids:
+                asset_map.append([asset_id, first_asset_ids[content_id]])
+            else:
+                first_asset_ids[content_id] = asset_id
+        if not asset_map:
+            return 0
+
+        schema = self.get_schema()
+        columns = {
+            column_name: column
+            for column_name, column in schema.items()
+            if column["type"].endswith("-ASSET")
+        }
+        with self._bulk_load():
+            # All, or none, of the changes:
+            self.conn.execute("BEGIN;")
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "CREATE TEMP TABLE asset_map (asset_id TEXT PRIMARY KEY, new_asset_id TEXT);"
+            )
+            cursor.executemany("INSERT INTO temp.asset_map VALUES (?, ?);", asset_map)
+            for column in columns.values():
+                cursor.execute(
+                    "UPDATE datagrid SET {field_name} = (SELECT new_asset_id FROM temp.asset_map WHERE asset_id = datagrid.{field_name}) WHERE {field_name} IN (SELECT asset_id FROM temp.asset_map);".format(
+                        field_name=column["field_name"]
+                    )
+                )
+            cursor.execute(
+                "DELETE FROM assets WHERE asset_id IN (SELECT asset_id FROM temp.asset_map);"
+            )
+            cursor.execute("DROP TABLE temp.asset_map;")
+
+        print("Deleted %s duplicate assets" % len(asset_map))
+        # Give the space back:
+        self.conn.execute("""VACUUM""")
+        # Fewer distinct assets:
+        self._mark_dirty(columns)
+        self._update_stats()
+        return len(asset_map)
 
     def remove_select(
         self,
@@ -1413,6 +1798,9 @@ class DataGrid:
                 self.conn.execute("""UPDATE datagrid SET column_0 = rowid""")
                 self.conn.commit()
                 self.remove_unused_assets()
+                # Removed values can't be taken out of the stats:
+                self._mark_dirty(self.get_schema())
+                self._update_stats()
         else:
             raise Exception("unable to delete rows from in-memory data")
 
@@ -1434,6 +1822,11 @@ class DataGrid:
             schema = self.get_schema()
             columns = [column_name for column_name in column_names]
             columns += [column_name + "--metadata" for column_name in column_names]
+            # Indexes may have been made by the server, too:
+            try:
+                self._load_settings()
+            except sqlite3.OperationalError:
+                pass
             cursor = self.conn.cursor()
             for column_name in columns:
                 if column_name in schema:
@@ -1457,20 +1850,26 @@ class DataGrid:
                         )
                         self.conn.commit()
 
-                    # 2. Remove column
-                    del self._columns[column_name]
+                    # 2. Drop its index, as an indexed column can't be dropped:
+                    cursor.execute("DROP INDEX IF EXISTS datagrid_%s;" % column_field)
+                    if column_name in self.indexes:
+                        del self.indexes[column_name]
+                        self._save_settings(indexes=json.dumps(self.indexes))
 
-                    # 4. Update and clear cache:
+                    # 3. Remove column
                     delete_column_sql = (
                         """ALTER TABLE datagrid DROP COLUMN {column_field};""".format(
                             column_field=column_field,
                         )
                     )
                     cursor.execute(delete_column_sql)
+                    del self._columns[column_name]
+                    cursor.execute(
+                        "DELETE FROM metadata WHERE name = ?;", [column_name]
+                    )
                     self.conn.commit()
-            # 3. re-create the schema, drops all metadata/stats
-            self._create_schema(self._columns)
-            self._compute_stats()
+            # 4. The other columns, and their stats, don't change
+            self._schema = None
         else:
             raise Exception("unable to delete column from in-memory data")
 
@@ -1621,10 +2020,20 @@ class DataGrid:
         else:
             raise Exception("an in-memory DataGrid doesn't have assets; save first")
 
-    def extend(self, rows, verify=True):
+    def extend(self, rows, verify=True, batch_size=None, workers=None):
         """
         Extend the datagrid with the given rows.
 
+        Args:
+            rows: a list of rows (lists or dicts)
+            verify: (optional, bool) if True, check the type of each value
+            batch_size: (optional, int) on disk, the number of rows written
+                to the database at a time; default is INSERT_BATCH_SIZE
+            workers: (optional, int) if more than 1, the number of processes
+                that encode PIL images and make thumbnails, while this one
+                writes the rows in order; default is INGEST_WORKERS. Rows
+                with assets must be picklable.
+
         Example:
         ```python
         >>> dg.extend([
@@ -1659,45 +2068,54 @@ class DataGrid:
             field_name_map = {
                 column_name: schema[column_name]["field_name"] for column_name in schema
             }
+            column_names = list(field_name_map)
+            insert_sql = "INSERT INTO datagrid (%s) VALUES (%s)" % (
+                ", ".join(field_name_map.values()),
+                ", ".join(["?"] * len(column_names)),
+            )
+            batch_size = batch_size if batch_size else INSERT_BATCH_SIZE
             index = self.nrows + 1
+            first_rowid = self.conn.execute(
+                "SELECT IFNULL(MAX(rowid), 0) + 1 FROM datagrid;"
+            ).fetchone()[0]
             # Get datagrid ready to append:
             self._asset_id_cache = set(self.get_asset_ids())
             self.cursor = self.conn.cursor()
             print("Extending data...")
-            for row in ProgressBar(rows):
-                if not isinstance(row, (dict,)):
-                    row_dict = {
-                        column_name: value
-                        for column_name, value in zip(self.get_columns(), row)
-                    }
-                else:
-                    row_dict = {
-                        column_name: value for column_name, value in row.items()
-                    }
-                if verify:
-                    # verify each and every row
-                    self._convert_values_row_dict(row_dict)
-                    column_types = self._verify_row_dict(row_dict)
-                    self._check_column_types(column_types)
-
-                self._append_row_dict_to_db(index, row_dict, field_name_map)
-                index += 1
-            self.conn.commit()
+            row_dicts = self._encode_assets(
+                (self._get_row_dict(row) for row in ProgressBar(rows)),
+                workers,
+                verify,
+            )
+            with self._bulk_load():
+                batch = []
+                for row_dict in row_dicts:
+                    if verify:
+                        # verify each and every row
+                        self._convert_values_row_dict(row_dict)
+                        column_types = self._verify_row_dict(row_dict)
+                        self._check_column_types(column_types)
+
+                    batch.append(self._get_row_values(index, row_dict, column_names))
+                    index += 1
+                    if len(batch) >= batch_size:
+                        self._flush_assets()
+                        self.cursor.executemany(insert_sql, batch)
+                        batch = []
+                self._flush_assets()
+                self.cursor.executemany(insert_sql, batch)
             self._asset_id_cache = None
+            self._thumbnails = {}
 
-            # Deletes and recomputes metadata:
-            self._compute_stats()
+            # Only the new rows change the stats:
+            self._mark_dirty(schema, first_rowid)
+            self._update_stats()
         else:
             ## Append to memory
-            for row in rows:
-                if not isinstance(row, (dict,)):
-                    # public columns will create columns, if it doesn't exist
-                    row_dict = {
-                        column_name: item
-                        for column_name, item in zip(self.get_columns(), row)
-                    }
-                else:
-                    row_dict = row.copy()
+            row_dicts = self._encode_assets(
+                (self._get_row_dict(row) for row in rows), workers, verify
+            )
+            for row_dict in row_dicts:
                 if verify:
                     # verify each and every row
                     self._convert_values_row_dict(row_dict)
@@ -1708,7 +2126,87 @@ class DataGrid:
                 row_dict["row-id"] = len(self._data) + 1
                 self._data.append(row_dict)
 
+    def _get_row_dict(self, row):
+        if not isinstance(row, (dict,)):
+            # public columns will create columns, if it doesn't exist
+            return {
+                column_name: item for column_name, item in zip(self.get_columns(), row)
+            }
+        else:
+            return row.copy()
+
+    def _encode_assets(self, row_dicts, workers, verify):
+        """
+        Encode the PIL images, and make the thumbnails, of row_dicts in
+        worker processes, ENCODE_CHUNK_SIZE rows at a time. The rows are
+        yielded in order, with at most 2 * workers chunks in flight.
+
+        Args:
+            row_dicts: an iterator of row dicts
+            workers: (int) the number of processes; if None, then
+                INGEST_WORKERS. If 1, or there is nothing to do, the
+                rows are yielded as they are.
+            verify: (bool) if True, convert PIL images into Images, as
+                _convert_values_row_dict() would
+        """
+        import PIL.Image
+
+        workers = workers if workers else INGEST_WORKERS
+        image_columns = set(
+            column_name
+            for column_name, column_type in self._columns.items()
+            if verify
+            and column_type in [None, "IMAGE-ASSET"]
+            and column_name not in self.converters
+        )
+        if workers < 2 or not (image_columns or self.create_thumbnails):
+            yield from row_dicts
+            return
+
+        def get_assets(row_dict):
+            # Only what the worker needs to see:
+            return {
+                column_name: value
+                for column_name, value in row_dict.items()
+                if isinstance(value, PIL.Image.Image)
+                or (isinstance(value, Asset) and value._unserialize is None)
+            }
+
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            pending = deque()
+            while True:
+                chunk = list(itertools.islice(row_dicts, ENCODE_CHUNK_SIZE))
+                if chunk:
+                    future = executor.submit(
+                        encode_assets,
+                        [get_assets(row_dict) for row_dict in chunk],
+                        image_columns,
+                        self.create_thumbnails,
+                    )
+                    pending.append((chunk, future))
+                if not pending:
+                    break
+                if chunk and len(pending) < 2 * workers:
+                    continue
+                chunk, future = pending.popleft()
+                for row_dict, (values, thumbnails) in zip(chunk, future.result()):
+                    row_dict.update(values)
+                    self._thumbnails.update(thumbnails)
+                    yield row_dict
+
     def _append_col_to_db(self, column_name, rows, verify=True):
+        columns = dict(self._columns)
+        try:
+            self._write_col_to_db(column_name, rows, verify)
+        except Exception:
+            # The database is unchanged (see _bulk_load()), so undo the rest:
+            self._columns = columns
+            self._asset_rows = []
+            self._asset_id_cache = None
+            self._schema = None
+            raise
+
+    def _write_col_to_db(self, column_name, rows, verify):
         # Get datagrid ready to append:
         self._asset_id_cache = set(self.get_asset_ids())
         self.cursor = self.conn.cursor()
@@ -1717,10 +2215,15 @@ class DataGrid:
         self._columns[column_name] = None
         new_column_names = set([column_name])
 
-        # 2. Log all new data:
+        # 2. Log all new data, in row-id order:
+        row_ids = [
+            row[0]
+            for row in self.conn.execute(
+                "SELECT column_0 FROM datagrid ORDER BY column_0;"
+            )
+        ]
         data = []
-        for index, item in enumerate(rows):
-            # Join on rowid:
+        for row_id, item in zip(row_ids, rows):
             row_dict = {column_name: item}
             if verify:
                 # verify each and every row
@@ -1737,7 +2240,7 @@ class DataGrid:
 
             # Now we replace assets with asset_id:
             row_dict[column_name] = self._log_and_serialize_item(
-                item, column_name, row_id=index + 1
+                item, column_name, row_id=row_id
             )
             data.append(row_dict)
 
@@ -1746,11 +2249,6 @@ class DataGrid:
             column_name: (ctype if ctype is not None else "TEXT")
             for column_name, ctype in self._columns.items()
         }
-
-        # 4. re-create the schema; clears all metadata/stats
-        self._create_schema(self._columns)
-
-        # 5. create a temp in-memory table with data
         new_columns = {}  # DG type
         new_columns.update(
             {
@@ -1759,36 +2257,71 @@ class DataGrid:
                 if column_name in new_column_names
             }
         )
-
-        cursor = self.conn.cursor()
-        # use all columns to get proper field_name (eg, column_16):
-        field_names = self._get_fields(self._columns)[-len(new_columns) :]
+        # after the last field_name (eg, column_16), as removed
+        # columns keep theirs:
+        next_field = 1 + max(
+            int(column["field_name"].split("_")[1])
+            for column in self.get_schema().values()
+        )
+        field_names = [
+            "column_%s" % i for i in range(next_field, next_field + len(new_columns))
+        ]
         field_types = self._sql_types(new_columns.values())
-        for (field_name, field_type) in zip(field_names, field_types):
-            add_column_sql = (
-                """ALTER TABLE datagrid ADD COLUMN {field_name} {field_type}""".format(
+
+        with self._bulk_load():
+            # All, or none, of the changes:
+            self.conn.execute("BEGIN;")
+            self._flush_assets()
+
+            # 4. add the new columns to the table
+            cursor = self.conn.cursor()
+            for (field_name, field_type) in zip(field_names, field_types):
+                add_column_sql = """ALTER TABLE datagrid ADD COLUMN {field_name} {field_type}""".format(
                     field_name=field_name, field_type=field_type
                 )
+                cursor.execute(add_column_sql)
+
+            # 5. create a temp table with the data, keyed by row-id
+            cursor.execute(
+                "CREATE TEMP TABLE new_columns (row_id INTEGER PRIMARY KEY, %s);"
+                % ", ".join(field_names)
+            )
+            cursor.executemany(
+                "INSERT INTO temp.new_columns VALUES (?, %s);"
+                % ", ".join(["?"] * len(field_names)),
+                (
+                    [row_id] + [row.get(column_name) for column_name in new_columns]
+                    for row_id, row in zip(row_ids, data)
+                ),
             )
-            cursor.execute(add_column_sql)
-        self.conn.commit()
 
-        # 6. copy the data into datagrid
-        for index, row in enumerate(data, start=1):
-            for column_name, field_name in zip(new_columns, field_names):
-                field_value = row.get(column_name)
-                sql_update = "UPDATE datagrid SET %s = ? where column_0 = ?" % (
-                    field_name,
-                )
-                cursor.execute(sql_update, [field_value, index])
-        self.conn.commit()
+            # 6. copy the data into datagrid with one UPDATE
+            cursor.execute(
+                "UPDATE datagrid SET (%s) = (SELECT %s FROM temp.new_columns WHERE row_id = datagrid.column_0);"
+                % (", ".join(field_names), ", ".join(field_names))
+            )
+            cursor.execute("DROP TABLE temp.new_columns;")
+
+            # 7. add the new columns to the schema
+            cursor.executemany(
+                "INSERT INTO metadata (name, field_name, type) VALUES (?,?,?);",
+                [
+                    [column_name, field_name, column_type]
+                    for (column_name, column_type), field_name in zip(
+                        new_columns.items(), field_names
+                    )
+                ],
+            )
+            self.conn.commit()
+            self._schema = None
 
         self._asset_id_cache = None
 
-        # Update and clear cache:
-        self._compute_stats()
+        # Only the new columns need stats:
+        self._mark_dirty(new_columns)
+        self._update_stats()
 
-    def _append_row_dict_to_db(self, index, row_dict, field_name_map):
+    def _get_row_values(self, index, row_dict, column_names):
         # Only for user-suppplied columns; collects column names
         # as a side efect, it logs the assets!
         new_columns = {}
@@ -1810,17 +2343,43 @@ class DataGrid:
         # Add row-id:
         row_dict["row-id"] = index
 
-        # SQL insert as a dict:
-        field_dict = {
-            field_name_map[column_name]: value
-            for column_name, value in row_dict.items()
-        }
-        field_names = ", ".join(field_dict.keys())
-        value_names = ", ".join([":" + field_name for field_name in field_dict])
-        self.cursor.execute(
-            "INSERT INTO datagrid (%s) VALUES (%s)" % (field_names, value_names),
-            field_dict,
-        )
+        if len(row_dict) > len(column_names):
+            unknown = set(row_dict) - set(column_names)
+            if unknown:
+                raise Exception("unknown columns: %r" % sorted(unknown))
+
+        # The values for the INSERT, in column order:
+        return [row_dict.get(column_name) for column_name in column_names]
+
+    @contextlib.contextmanager
+    def _bulk_load(self):
+        """
+        Write to the database in WAL mode, with relaxed syncing, and
+        commit. Afterwards, checkpoint the log and restore the
+        previous journal mode, so that the datagrid is one file that
+        read-only connections can open.
+        """
+        self.conn.commit()
+        journal_mode = self.conn.execute("PRAGMA journal_mode;").fetchone()[0]
+        synchronous = self.conn.execute("PRAGMA synchronous;").fetchone()[0]
+        self.conn.execute("PRAGMA journal_mode = WAL;")
+        self.conn.execute("PRAGMA synchronous = NORMAL;")
+        try:
+            yield
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            self._asset_rows = []
+            self._thumbnails = {}
+            raise
+        finally:
+            self.conn.execute("PRAGMA synchronous = %s;" % synchronous)
+            try:
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+                self.conn.execute("PRAGMA journal_mode = %s;" % journal_mode)
+            except sqlite3.OperationalError as exc:
+                # Another connection is using the database:
+                LOGGER.warning("unable to restore journal mode: %s", exc)
 
     def get_schema(self):
         """
@@ -2087,6 +2646,12 @@ class DataGrid:
                 being the column name, and value is a string describing the
                 expression of the column. Uses same syntax and semantics
                 as the filter query expressions.
+            cursor: (optional, str) continue the selection after the last
+                row of a previous one, instead of using offset (requires limit).
+                Faster than offset for deep pages.
+            return_cursor: (optional, bool) if True, return (rows, cursor)
+                where cursor is given to the next select to get the next
+                page, or is None if there are no more rows
 
         Example:
         ```python
@@ -2125,6 +2690,8 @@ class DataGrid:
         offset=0,
         debug=False,
         select_columns=None,
+        cursor=None,
+        return_cursor=False,
     ):
         """
         Perform a selection on the database, including possibly a
@@ -2179,25 +2746,40 @@ class DataGrid:
             offset,
             debug=debug,
             select_columns=select_columns,
+            cursor=(cursor or "") if (cursor or return_cursor) else None,
         )
         if count:
             return results
+
+        next_cursor = None
+        if cursor or return_cursor:
+            results, next_cursor = results
+
+        if to_dicts:
+            rows = [
+                {
+                    column_name: self._raw_value_to_asset(value)
+                    for column_name, value in row.items()
+                }
+                for row in results
+            ]
         else:
-            if to_dicts:
-                return [
-                    {
-                        column_name: self._raw_value_to_asset(value)
-                        for column_name, value in row.items()
-                    }
-                    for row in results
-                ]
-            else:
-                return [
-                    [self._raw_value_to_asset(value) for value in row.values()]
-                    for row in results
-                ]
+            rows = [
+                [self._raw_value_to_asset(value) for value in row.values()]
+                for row in results
+            ]
+
+        if return_cursor:
+            return rows, next_cursor
+        return rows
 
-    def save(self, filename=None, create_thumbnails=None):
+    def save(
+        self,
+        filename=None,
+        create_thumbnails=None,
+        workers=None,
+        content_asset_ids=None,
+    ):
         """
         Create the SQLite database on disk.
 
@@ -2206,6 +2788,12 @@ class DataGrid:
                 to save to
             create_thumbnails: (optional, bool) if True, then
                 create thumbnail images for assets
+            workers: (optional, int) the number of processes that
+                make thumbnails; see extend()
+            content_asset_ids: (optional, bool) if True, then
+                assets get ids from their content (type, data, and
+                metadata), so identical assets are stored once; see
+                also dedupe_assets()
 
         Example:
         ```python
@@ -2219,12 +2807,18 @@ class DataGrid:
                     if create_thumbnails is None
                     else create_thumbnails
                 )
+                self.content_asset_ids = (
+                    self.content_asset_ids
+                    if content_asset_ids is None
+                    else content_asset_ids
+                )
                 print("Saving settings to %r..." % self.filename)
                 self._save_settings(
                     heuristics=self.heuristics,
                     datetime_format=self.datetime_format,
                     name=self.name,
                     create_thumbnails=self.create_thumbnails,
+                    content_asset_ids=self.content_asset_ids,
                 )
                 return
             else:
@@ -2239,6 +2833,9 @@ class DataGrid:
         self.create_thumbnails = (
             self.create_thumbnails if create_thumbnails is None else create_thumbnails
         )
+        self.content_asset_ids = (
+            self.content_asset_ids if content_asset_ids is None else content_asset_ids
+        )
 
         # Final check and conversion on column types:
         self._columns = {
@@ -2288,16 +2885,18 @@ class DataGrid:
         )
         self.conn.execute(drop_assets_sql)
         self.conn.execute(create_assets_sql)
+        self.conn.execute(CREATE_ASSET_INDEX_SQL)
         self._create_schema(new_columns)
         self._create_settings(
             heuristics=self.heuristics,
             datetime_format=self.datetime_format,
             name=self.name,
             create_thumbnails=self.create_thumbnails,
+            content_asset_ids=self.content_asset_ids,
         )
 
         self._on_disk = True
-        self.extend(self._data, verify=False)
+        self.extend(self._data, verify=False, workers=workers)
         self.filename = filename
         self._data = []
         self._schema = None
@@ -2335,6 +2934,45 @@ class DataGrid:
         markdown = python_to_markdown(filename)
         self._save_settings(about=markdown)
 
+    def create_index(self, column_name):
+        """
+        Create an index on a column, to make sorting, grouping,
+        and filtering on it faster. The index is recorded in
+        the DataGrid's settings.
+
+        Args:
+            column_name: (str) the name of the column
+
+        Example:
+        ```python
+        >>> dg.create_index("Score")
+        ```
+        """
+        if not self._on_disk:
+            raise Exception("DataGrid needs to be saved first")
+
+        schema = self.get_schema()
+        if column_name not in schema:
+            raise Exception("no such column: %r" % column_name)
+
+        self.indexes = create_column_index(
+            self.conn, column_name, schema[column_name]["field_name"]
+        )
+
+    def drop_index(self, column_name):
+        """
+        Remove the index on a column, created with create_index().
+
+        Args:
+            column_name: (str) the name of the column
+        """
+        if column_name not in self.indexes:
+            raise Exception("no index on column: %r" % column_name)
+
+        self.conn.execute("DROP INDEX IF EXISTS %s;" % self.indexes[column_name])
+        del self.indexes[column_name]
+        self._save_settings(indexes=json.dumps(self.indexes))
+
     def get_about(self):
         """
         Get the about page for this DataGrid.
@@ -2385,10 +3023,15 @@ class DataGrid:
             "datetime_format": str,
             "name": str,
             "create_thumbnails": bool,
+            "content_asset_ids": bool,
             "about": str,
+            "indexes": dict,
         }
 
         for row in self.conn.execute(select_settings_sql):
+            if row["name"] not in type_map:
+                LOGGER.debug("ignoring unknown setting %r", row["name"])
+                continue
             setattr(
                 self, row["name"], _convert_setting(row["value"], type_map[row["name"]])
             )
@@ -2412,178 +3055,410 @@ class DataGrid:
         self.conn.commit()
         self._schema = None
 
-    def _compute_stats(self, columns=None):
+    def compute_statistics(self, columns=None, exact=False):
         """
-        Compute the stats and metadata for all columns.
+        Compute the statistics of the columns of a saved DataGrid.
+
+        Args:
+            columns: (optional, list of str) the column names; default
+                is all columns
+            exact: (optional, bool) if True, count the unique values
+                of TEXT columns exactly, rather than estimating them
+                from a sketch when there are many
+
+        Example:
+        ```python
+        >>> dg.compute_statistics(exact=True)
+        ```
         """
-        insert_metadata_sql = """UPDATE metadata SET minimum = ?, maximum = ?, average = ?, variance = ?, total = ?, stddev= ? , other = ? WHERE name = ?;"""
+        if not self._on_disk:
+            raise Exception("DataGrid must be saved before computing statistics")
+        self._compute_stats(columns, exact)
 
+    def _compute_stats(self, columns=None, exact=False):
+        """
+        Compute the stats and metadata for all columns.
+        """
         if columns is not None:
             schema = self.get_schema()
             columns = {name: schema[name] for name in columns}
         else:
             columns = self.get_schema()
 
+        jobs = [
+            (col_name, columns[col_name]["type"], columns[col_name]["field_name"])
+            for col_name in columns
+        ]
+        self._save_stats(self._get_stats(jobs, exact))
+
+    def _mark_dirty(self, columns, rowid=None):
+        """
+        Mark the columns whose stats need to be updated.
+
+        Args:
+            columns: (list of str) the column names
+            rowid: (optional, int) if only rows were added, the rowid
+                of the first new row; otherwise, the whole column
+                is dirty
+        """
+        for column_name in columns:
+            if column_name in self._dirty_columns:
+                first_rowid = self._dirty_columns[column_name]
+                if first_rowid is not None and rowid is not None:
+                    first_rowid = min(first_rowid, rowid)
+                else:
+                    first_rowid = None
+            else:
+                first_rowid = rowid
+            self._dirty_columns[column_name] = first_rowid
+
+    def _update_stats(self):
+        """
+        Update the stats and metadata of the dirty columns. Where
+        only rows were added, the stats of the new rows are merged
+        with the saved ones; otherwise, the column's stats are
+        recomputed.
+        """
+        dirty = self._dirty_columns
+        self._dirty_columns = {}
+        if not dirty:
+            return
+
+        schema = self.get_schema()
+        saved = {
+            row[0]: list(row[1:]) + [row[0]]
+            for row in self.conn.execute(
+                "SELECT name, minimum, maximum, average, variance, total, stddev, other FROM metadata;"
+            )
+        }
+        jobs = []
+        for col_name in schema:
+            if col_name not in dirty:
+                continue
+            col_type = schema[col_name]["type"]
+            field_name = schema[col_name]["field_name"]
+            rowid = dirty[col_name]
+            if rowid is not None and can_merge_stats(col_type, saved[col_name]):
+                # Only the new rows:
+                jobs.append(
+                    (
+                        col_name,
+                        col_type,
+                        field_name,
+                        "rowid >= %s" % int(rowid),
+                        tuple(saved[col_name][:2]),
+                    )
+                )
+            else:
+                jobs.append((col_name, col_type, field_name))
+
         data = []
+        for job, stats in zip(jobs, self._get_stats(jobs)):
+            if len(job) > 3:
+                stats = merge_stats(job[1], saved[job[0]], stats)
+            data.append(stats)
+
+        # Merged numeric columns have only a bound on their distinct
+        # values, so count them:
+        inexact = {}
+        for job, stats in zip(jobs, data):
+            if job[1] in NUMERIC_TYPES and stats[6]:
+                other = json.loads(stats[6])
+                if not other.get("count_unique_exact", True):
+                    inexact[job[2]] = (stats, other)
+        if inexact:
+            counts = get_count_unique(self.conn, list(inexact))
+            for field_name, (stats, other) in inexact.items():
+                other["count_unique"] = counts[field_name]
+                other["count_unique_exact"] = True
+                stats[6] = json.dumps(other)
+
+        self._save_stats(data)
+
+    def _save_stats(self, data):
+        """
+        Save metadata rows of stats; Nones are skipped.
+        """
+        insert_metadata_sql = """UPDATE metadata SET minimum = ?, maximum = ?, average = ?, variance = ?, total = ?, stddev= ? , other = ? WHERE name = ?;"""
+
+        cursor = self.conn.cursor()
+        for row in data:
+            if row:
+                cursor.execute(insert_metadata_sql, row)
+        self.conn.commit()
+
+    def _get_stats(self, jobs, exact=False):
+        """
+        Compute the stats of columns. The aggregates of all numeric
+        columns are computed in one pass; then, columns are done
+        concurrently, each thread with its own read connection.
+
+        Args:
+            jobs: a list of (col_name, col_type, field_name), with
+                optional where and histogram_range; see
+                _get_column_stats()
+            exact: (optional, bool) see _get_column_stats()
+
+        Returns: a list of the stats of each job, or None
+        """
+        jobs = [(job + ("1", None))[:5] for job in jobs]
+        # The aggregates of numeric columns, for each where:
+        numeric = defaultdict(list)
+        for col_name, col_type, field_name, where, histogram_range in jobs:
+            if col_type in NUMERIC_TYPES:
+                numeric[where].append(field_name)
+        aggregates = {}
+        for where, field_names in numeric.items():
+            for field_name, row in get_numeric_aggregates(
+                self.conn, field_names, where
+            ).items():
+                aggregates[(field_name, where)] = row
+
+        def get_stats(job, conn):
+            col_name, col_type, field_name, where, histogram_range = job
+            return self._get_column_stats(
+                col_name,
+                col_type,
+                field_name,
+                exact,
+                where,
+                histogram_range,
+                conn,
+                aggregates.get((field_name, where)),
+            )
+
+        # Assets may write to the datagrid, so use this connection:
+        read_only = [i for i, job in enumerate(jobs) if not job[1].endswith("-ASSET")]
+        workers = min(STATS_WORKERS, len(read_only))
+        futures = {}
+        connections = []
+        if workers > 1:
+            uri = "file:%s?mode=ro" % urllib.request.pathname2url(
+                self.conn.execute("PRAGMA database_list;").fetchone()[2]
+            )
+            local = threading.local()
+
+            def get_stats_concurrently(job):
+                if not hasattr(local, "conn"):
+                    local.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                    connections.append(local.conn)
+                return get_stats(job, local.conn)
+
+            executor = concurrent.futures.ThreadPoolExecutor(workers)
+            futures = {
+                i: executor.submit(get_stats_concurrently, jobs[i]) for i in read_only
+            }
+
+        results = []
         print("Computing statistics...")
-        for col_name in ProgressBar(columns):
-            col_type = columns[col_name]["type"]
-            field_name = columns[col_name]["field_name"]
-            if col_type in ["FLOAT", "INTEGER", "ROW_ID"]:
-                row = self.conn.execute(
-                    """SELECT MIN({field_name}),
-                              MAX({field_name}),
-                              AVG({field_name}),
-                              TOTAL({field_name}),
-                              COUNT({field_name}),
-                              COUNT(DISTINCT {field_name}) from datagrid;""".format(
-                        field_name=field_name
-                    )
-                ).fetchone()
-                minimum, maximum, avg, total, count, count_unique = row
-
-                other = json.dumps({"count": count, "count_unique": count_unique})
-                ## FIXME: somebody check my math:
-                deviations = []
-                for row in self.conn.execute(
-                    """SELECT {field_name} from datagrid;""".format(
-                        field_name=field_name
-                    )
-                ):
-                    if not is_null(row[0]):
-                        deviations.append((row[0] - avg) ** 2)
-
-                variance = sum(deviations) / count if count > 0 else None
-                if not is_null(variance):
-                    stddev = math.sqrt(variance)
-                    # min, max, avg, variance, total, stddev, other, name
-                    data.append(
-                        [
-                            minimum,
-                            maximum,
-                            avg,
-                            variance,
-                            total,
-                            stddev,
-                            other,
-                            col_name,
-                        ]
-                    )
+        try:
+            for i in ProgressBar(range(len(jobs))):
+                if i in futures:
+                    results.append(futures[i].result())
                 else:
-                    # min, max, avg, variance, total, stddev, other, name
-                    data.append(
-                        [minimum, maximum, avg, variance, total, None, other, col_name]
+                    results.append(get_stats(jobs[i], self.conn))
+        finally:
+            if futures:
+                executor.shutdown()
+                for conn in connections:
+                    conn.close()
+        return results
+
+    def _get_column_stats(
+        self,
+        col_name,
+        col_type,
+        field_name,
+        exact=False,
+        where="1",
+        histogram_range=None,
+        conn=None,
+        aggregates=None,
+    ):
+        """
+        Compute the stats of a column.
+
+        Args:
+            col_name: (str) the column name
+            col_type: (str) the column type
+            field_name: (str) the column field name
+            exact: (optional, bool) if True, count the unique values of
+                TEXT columns exactly
+            where: (optional, str) SQL for the rows to include
+            histogram_range: (optional) the (minimum, maximum) of the
+                histogram of a numeric column, if not its own
+            conn: (optional) the connection to read from; default is
+                the datagrid's
+            aggregates: (optional) a numeric column's row from
+                get_numeric_aggregates(), if already computed
+
+        Returns: [min, max, avg, variance, total, stddev, other, name],
+            or None
+        """
+        conn = conn if conn is not None else self.conn
+        if col_type in NUMERIC_TYPES:
+            if aggregates is None:
+                aggregates = get_numeric_aggregates(conn, [field_name], where)[
+                    field_name
+                ]
+            minimum, maximum, avg, total, count, variance = aggregates
+
+            other = {"count": count, "count_unique": 0, "count_unique_exact": True}
+            if count:
+                # So that histograms of the whole column don't need the data:
+                rows = [
+                    row[0]
+                    for row in conn.execute(
+                        """SELECT {field_name} from datagrid WHERE {field_name} IS NOT NULL AND {where};""".format(
+                            field_name=field_name, where=where
+                        )
                     )
+                ]
+                values = np.array(rows, dtype=np.float64)
+                values.sort()
+                if col_type == "FLOAT":
+                    # Sorted, the unique values are where the value changes:
+                    other["count_unique"] = int(np.count_nonzero(np.diff(values))) + 1
+                else:
+                    # Integers above 2**53 aren't all distinct as floats:
+                    other["count_unique"] = len(set(rows))
+                if histogram_range is None or None in histogram_range:
+                    histogram_range = (minimum, maximum)
+                histogram = get_histogram(values, *histogram_range)
+                if histogram is not None:
+                    # Else, the server computes it, as before:
+                    other["histogram"] = histogram
+                other["quantiles"] = QuantileSketch.from_values(values).to_dict()
+            other = json.dumps(other)
+
+            stddev = math.sqrt(variance) if variance is not None else None
+            # min, max, avg, variance, total, stddev, other, name
+            return [minimum, maximum, avg, variance, total, stddev, other, col_name]
+
+        elif col_type == "VECTOR":
+            # min, max, avg, variance, total, stddev, other, name
+            return [
+                None,
+                None,
+                None,
+                None,
+                None,
+                None,
+                None,
+                col_name,
+            ]
 
-            elif col_type == "VECTOR":
-                # min, max, avg, variance, total, stddev, other, name
-                data.append(
-                    [
-                        None,
-                        None,
-                        None,
-                        None,
-                        None,
-                        None,
-                        None,
-                        col_name,
-                    ]
+        elif col_type == "JSON":
+            rows = conn.execute(
+                "SELECT {field_name} from datagrid WHERE {where};".format(
+                    field_name=field_name, where=where
                 )
+            )
+            completions = defaultdict(set)
+            count = 0
+            for row in rows:
+                # get key, type from all rows for fields
+                if row[0]:
+                    count += 1
+                    json_data = json.loads(row[0])
+                    self._get_completions(json_data, completions)
 
-            elif col_type == "JSON":
-                rows = self.conn.execute(
-                    "SELECT {field_name} from datagrid;".format(field_name=field_name)
-                )
-                completions = defaultdict(set)
-                for row in rows:
-                    # get key, type from all rows for fields
-                    if row[0]:
-                        json_data = json.loads(row[0])
-                        self._get_completions(json_data, completions)
-
-                completions_serialized = json.dumps(
-                    {
-                        "completions": {
-                            key: list(value) for key, value in completions.items()
-                        }
-                    }
-                )
+            completions_serialized = json.dumps(
+                {
+                    "completions": {
+                        key: list(value) for key, value in completions.items()
+                    },
+                    "count": count,
+                }
+            )
 
-                # min, max, avg, variance, total, stddev, other, name
-                data.append(
-                    [
-                        None,
-                        None,
-                        None,
-                        None,
-                        None,
-                        None,
-                        completions_serialized,
-                        col_name,
-                    ]
-                )
+            # min, max, avg, variance, total, stddev, other, name
+            return [
+                None,
+                None,
+                None,
+                None,
+                None,
+                None,
+                completions_serialized,
+                col_name,
+            ]
 
-            elif col_type == "DATETIME":
-                row = self.conn.execute(
-                    "SELECT MIN({field_name}), MAX({field_name}), TOTAL({field_name}) from datagrid;".format(
-                        field_name=field_name
-                    )
-                ).fetchone()
-                # min, max, avg, variance, total, stddev, other, name
-                data.append(
-                    [
-                        row[0],
-                        row[1],
-                        None,
-                        None,
-                        row[2],
-                        None,
-                        None,
-                        col_name,
-                    ]
+        elif col_type == "DATETIME":
+            row = conn.execute(
+                "SELECT MIN({field_name}), MAX({field_name}), TOTAL({field_name}), COUNT({field_name}) from datagrid WHERE {where};".format(
+                    field_name=field_name, where=where
                 )
-            elif col_type.endswith("-ASSET"):
-                # min, max, avg, variance, total, stddev, other, name
-                stats = DATAGRID_TYPES[col_type]["get_statistics"](
-                    self, col_name, field_name
+            ).fetchone()
+            # min, max, avg, variance, total, stddev, other, name
+            return [
+                row[0],
+                row[1],
+                None,
+                None,
+                row[2],
+                None,
+                json.dumps({"count": row[3]}),
+                col_name,
+            ]
+        elif col_type.endswith("-ASSET"):
+            # min, max, avg, variance, total, stddev, other, name
+            return DATAGRID_TYPES[col_type]["get_statistics"](
+                self, col_name, field_name
+            )
+        else:
+            if col_type == "TEXT":
+                # One pass for the distinct count and the most
+                # common values:
+                distinct = HyperLogLog()
+                top = TopK()
+                nulls = update_text_sketches(
+                    (
+                        row[0]
+                        for row in conn.execute(
+                            """SELECT {field_name} from datagrid WHERE {where};""".format(
+                                field_name=field_name, where=where
+                            )
+                        )
+                    ),
+                    top,
+                    distinct,
                 )
-                if stats:
-                    data.append(stats)
-            else:
-                if col_type == "TEXT":
-                    row = self.conn.execute(
-                        """SELECT COUNT({field_name}), COUNT(DISTINCT {field_name}) from datagrid;""".format(
-                            field_name=field_name
+                count = top.n
+                if exact:
+                    count_unique = conn.execute(
+                        """SELECT COUNT(DISTINCT {field_name}) from datagrid WHERE {where};""".format(
+                            field_name=field_name, where=where
                         )
-                    ).fetchone()
-                    count, count_unique = row
-                    other = json.dumps(
-                        {
-                            "completions": {"": ["str"]},
-                            "count": count,
-                            "count_unique": count_unique,
-                        }
-                    )
+                    ).fetchone()[0]
+                elif top.exact:
+                    count_unique = len(top.counts)
                 else:
-                    other = None
-                # min, max, avg, variance, total, stddev, other, name
-                data.append(
-                    [
-                        None,
-                        None,
-                        None,
-                        None,
-                        None,
-                        None,
-                        other,
-                        col_name,
-                    ]
+                    count_unique = distinct.count()
+                other = json.dumps(
+                    {
+                        "completions": {"": ["str"]},
+                        "count": count,
+                        "count_unique": count_unique,
+                        "count_unique_exact": exact or top.exact,
+                        "nulls": nulls,
+                        "distinct": distinct.to_dict(),
+                        "top": top.to_dict(),
+                    }
                 )
-
-        cursor = self.conn.cursor()
-        for row in data:
-            cursor.execute(insert_metadata_sql, row)
-        self.conn.commit()
+            else:
+                other = None
+            # min, max, avg, variance, total, stddev, other, name
+            return [
+                None,
+                None,
+                None,
+                None,
+                None,
+                None,
+                other,
+                col_name,
+            ]
 
     def _log_and_serialize_data(self):
         """
@@ -2637,22 +3512,49 @@ class DataGrid:
             json_string = _convert_with_assets_to_json(metadata, self)
             # Log to database
             # If we should make a thumbnail, do it
-            if self.create_thumbnails and hasattr(ASSET_TYPE_MAP[asset_type.lower()], "generate_thumbnail"):
+            if asset_id in self._thumbnails:
+                asset_thumbnail = self._thumbnails.pop(asset_id)
+            elif self.create_thumbnails and hasattr(ASSET_TYPE_MAP[asset_type.lower()], "generate_thumbnail"):
                 asset_thumbnail = ASSET_TYPE_MAP[asset_type.lower()].generate_thumbnail(
                     asset_data, metadata
                 )
             else:
                 asset_thumbnail = None  # means one hasn't been created yet
-            self.cursor.execute(
-                "INSERT INTO assets (asset_id, asset_type, asset_data, asset_metadata, asset_thumbnail) VALUES (?, ?, ?, ?, ?);",
-                [asset_id, asset_type, asset_data, json_string, asset_thumbnail],
+            # Written with the next batch; see _flush_assets():
+            self._asset_rows.append(
+                [asset_id, asset_type, asset_data, json_string, asset_thumbnail]
             )
             self._asset_id_cache.add(asset_id)
 
+    def _set_content_asset_id(self, asset):
+        """
+        Give the asset the id of its content, so that it is logged
+        once, however many times it is in the datagrid.
+        """
+        metadata = json.loads(_convert_with_assets_to_json(asset.metadata, self))
+        asset_id = generate_content_id(asset.ASSET_TYPE, asset.asset_data, metadata)
+        if asset_id != asset.asset_id:
+            if asset.asset_id in self._thumbnails:
+                self._thumbnails[asset_id] = self._thumbnails.pop(asset.asset_id)
+            asset.asset_id = asset_id
+            asset.metadata["assetId"] = asset_id
+
+    def _flush_assets(self):
+        """
+        Insert the assets logged since the last flush.
+        """
+        if self._asset_rows:
+            self.cursor.executemany(
+                "INSERT INTO assets (asset_id, asset_type, asset_data, asset_metadata, asset_thumbnail) VALUES (?, ?, ?, ?, ?);",
+                self._asset_rows,
+            )
+            self._asset_rows = []
+
     def upgrade(self):
         """
         Upgrade to latest version of datagrid.
         """
+        self._upgrade_asset_index()
         self._upgrade_table("asset_id", "asset_metadata", "assets")
         schema = self.get_schema()
         for column_name in schema:
@@ -2665,6 +3567,20 @@ class DataGrid:
                 )
         self._compute_stats()
 
+    def _upgrade_asset_index(self):
+        """
+        Add the unique index on assets.asset_id, removing
+        any duplicated asset rows first.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "DELETE FROM assets WHERE rowid NOT IN (SELECT MIN(rowid) FROM assets GROUP BY asset_id);"
+        )
+        if cursor.rowcount > 0:
+            print("Deleted %s duplicate assets" % cursor.rowcount)
+        cursor.execute(CREATE_ASSET_INDEX_SQL)
+        self.conn.commit()
+
     def _upgrade_table(self, column_id_name, column_metadata_name, table_name):
         """
         Upgrade to latest version of datagrid.
@@ -28,19 +28,17 @@ def prepare_embedding(embedding, dimensions, seed):
     if len(embedding) <= dimensions:
         return embedding
 
-    key = (seed, dimensions)
-    if not SAMPLE_CACHE.contains(key):
+    key = (seed, dimensions, len(embedding))
+    indices = SAMPLE_CACHE.get(key, None)
+    if indices is None:
         random.seed(seed)
         indices = list(range(len(embedding)))
         random.shuffle(indices)
-        SAMPLE_CACHE.put(key, set(indices[:dimensions]))
-
-    indices = SAMPLE_CACHE.get(key)
+        indices = set(indices[:dimensions])
+        SAMPLE_CACHE.put(key, indices)
 
     return [v for i, v in enumerate(embedding) if i in indices]
 
-    SAMPLE_CACHE.get(key)
-
 
 class Embedding(Asset):
     """
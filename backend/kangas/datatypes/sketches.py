@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+
+import base64
+import hashlib
+import heapq
+import math
+
+import numpy as np
+
+HISTOGRAM_BINS = 10
+
+
+class QuantileSketch:
+    """
+    A mergeable quantile sketch (KLL), so that the quantiles of a
+    column can be kept in its metadata.
+
+    Items are kept in levels; when a level is full, it is sorted and
+    every other item moves up a level, where each item stands for
+    twice as many values. While no level has been compacted, the
+    quantiles are exact.
+
+    Args:
+        k: (int) the size of the top level; the rank error is about
+            1.7 / k
+    """
+
+    def __init__(self, k=200):
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+        self._offsets = [0]
+        self._size = 0
+        self._max_size = self._capacity(0)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return int(math.ceil(self.k * (2.0 / 3.0) ** depth)) + 1
+
+    def _grow(self):
+        self.levels.append([])
+        self._offsets.append(0)
+        self._max_size = sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def _compress(self):
+        for level in range(len(self.levels)):
+            if len(self.levels[level]) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self._grow()
+                items = sorted(self.levels[level])
+                # Keep an odd item at this level:
+                self.levels[level] = [items.pop()] if len(items) % 2 else []
+                # Alternate between keeping the even and odd items:
+                offset = self._offsets[level]
+                self._offsets[level] = 1 - offset
+                self.levels[level + 1].extend(items[offset::2])
+                self._size = sum(len(items) for items in self.levels)
+                if self._size < self._max_size:
+                    break
+
+    def update(self, value):
+        """
+        Add a value to the sketch.
+        """
+        self.levels[0].append(value)
+        self.n += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other):
+        """
+        Add all of the values of another sketch to this one.
+        """
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self._size = sum(len(items) for items in self.levels)
+        while self._size >= self._max_size:
+            self._compress()
+
+    def quantiles(self, qs):
+        """
+        Get the (approximate) values at the quantiles qs.
+
+        Args:
+            qs: a list of quantiles, from 0 to 1
+
+        Returns: a list of values, or Nones if the sketch is empty
+        """
+        if self.n == 0:
+            return [None for q in qs]
+        elif len(self.levels[0]) == self.n:
+            # Exact, and the same as numpy:
+            return [value.item() for value in np.quantile(self.levels[0], qs)]
+
+        items = sorted(
+            (value, 2**level)
+            for level, values in enumerate(self.levels)
+            for value in values
+        )
+        total = sum(weight for value, weight in items)
+        results = []
+        for q in qs:
+            rank = q * total
+            seen = 0
+            for value, weight in items:
+                seen += weight
+                if seen >= rank:
+                    break
+            results.append(value)
+        return results
+
+    @classmethod
+    def from_values(cls, values, k=200):
+        """
+        Make a sketch of many values at once, the same as (but much
+        faster than) calling update() with each one: the values are
+        sorted, and every 2**h-th one is kept at level h.
+
+        Args:
+            values: a numpy array of numbers
+            k: (int) the size of the top level
+        """
+        sketch = cls(k)
+        values = np.sort(values)
+        level = 0
+        while len(values) > k * 2**level:
+            level += 1
+            sketch._grow()
+        step = 2**level
+        sketch.levels[level] = values[(step - 1) // 2 :: step].tolist()
+        sketch.n = len(values)
+        sketch._size = len(sketch.levels[level])
+        return sketch
+
+    def to_dict(self):
+        return {"k": self.k, "n": self.n, "levels": self.levels}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["k"])
+        for level, items in enumerate(data["levels"]):
+            if level >= len(sketch.levels):
+                sketch._grow()
+            sketch.levels[level] = list(items)
+        sketch.n = data["n"]
+        sketch._size = sum(len(items) for items in sketch.levels)
+        return sketch
+
+
+def get_hash(value):
+    """
+    Get a stable 64-bit hash of a value's text.
+    """
+    return int.from_bytes(
+        hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+class HyperLogLog:
+    """
+    A mergeable sketch of the number of distinct values.
+
+    Args:
+        p: (int) 2**p registers are used; the error is about
+            1.04 / sqrt(2**p), 1.6% for the default
+    """
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = bytearray(2**p)
+
+    def update_hash(self, hash_value):
+        """
+        Add a value, given its get_hash().
+        """
+        index = hash_value >> (64 - self.p)
+        rest = hash_value & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, value):
+        """
+        Add a value to the sketch.
+        """
+        self.update_hash(get_hash(value))
+
+    def merge(self, other):
+        """
+        Add all of the values of another sketch (with the same p)
+        to this one.
+        """
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """
+        Get the (approximate) number of distinct values.
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Few values; use linear counting:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self):
+        return {
+            "p": self.p,
+            "registers": base64.b64encode(bytes(self.registers)).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["p"])
+        sketch.registers = bytearray(base64.b64decode(data["registers"]))
+        return sketch
+
+
+class TopK:
+    """
+    A mergeable sketch of the most frequent values (Misra-Gries).
+
+    At most 2k values are counted. When there are more, all of the
+    counts go down by the (k + 1)th largest one (and zeros are
+    dropped), so a count may be low by at most n / (k + 1). Until that
+    happens, the counts are exact, and the values are all of the
+    distinct values.
+
+    Args:
+        k: (int) the number of values counted
+    """
+
+    def __init__(self, k=64):
+        self.k = k
+        self.n = 0
+        self.counts = {}
+        self.exact = True
+
+    def update(self, value, count=1):
+        """
+        Count a value. Returns True if the value was already counted.
+        """
+        self.n += count
+        if value in self.counts:
+            self.counts[value] += count
+            return True
+        self.counts[value] = count
+        if len(self.counts) > 2 * self.k:
+            self._reduce()
+        return False
+
+    def _reduce(self):
+        # Subtract the (k + 1)th largest count from all:
+        self.exact = False
+        cut = heapq.nlargest(self.k + 1, self.counts.values())[-1]
+        self.counts = {
+            value: count - cut for value, count in self.counts.items() if count > cut
+        }
+
+    def merge(self, other):
+        """
+        Add all of the counts of another sketch to this one.
+        """
+        self.n += other.n
+        self.exact = self.exact and other.exact
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        if len(self.counts) > 2 * self.k:
+            self._reduce()
+
+    def most_common(self, n=None):
+        """
+        Get a list of (value, count), most frequent first.
+        """
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+    def to_dict(self):
+        return {"k": self.k, "n": self.n, "exact": self.exact, "counts": self.counts}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["k"])
+        sketch.n = data["n"]
+        sketch.exact = data["exact"]
+        sketch.counts = dict(data["counts"])
+        return sketch
+
+
+def update_text_sketches(values, top, distinct):
+    """
+    Add the text of values to a TopK and a HyperLogLog sketch in one
+    pass. Values already in the TopK aren't hashed again, so columns
+    with few distinct values cost little more than counting them.
+
+    Args:
+        values: an iterable of values; None is not counted
+        top: a TopK sketch
+        distinct: a HyperLogLog sketch
+
+    Returns: the number of Nones
+    """
+    counts = top.counts
+    registers = distinct.registers
+    shift = 64 - distinct.p
+    mask = (1 << shift) - 1
+    nulls = 0
+    for value in values:
+        if value is None:
+            nulls += 1
+            continue
+        top.n += 1
+        value = str(value)
+        if value in counts:
+            counts[value] += 1
+            continue
+        counts[value] = 1
+        # Inlined HyperLogLog.update_hash(get_hash(value)):
+        hash_value = get_hash(value)
+        index = hash_value >> shift
+        rank = shift - (hash_value & mask).bit_length() + 1
+        if rank > registers[index]:
+            registers[index] = rank
+        if len(counts) > 2 * top.k:
+            top._reduce()
+            counts = top.counts
+    return nulls
+
+
+def get_histogram(values, minimum, maximum, bins=HISTOGRAM_BINS):
+    """
+    Get the fixed-bin histogram of values, the same as the
+    server computes from the data.
+
+    Returns: {"bins": counts, "labels": bin edges}, or None if
+        the range is too narrow to divide into bins (such as large,
+        nearly equal values)
+    """
+    try:
+        counts, labels = np.histogram(values, bins=bins, range=(minimum, maximum))
+    except ValueError:
+        return None
+    return {"bins": counts.tolist(), "labels": labels.tolist()}
@@ -14,7 +14,9 @@
 import datetime
 import functools
 import gzip
+import hashlib
 import io
+import json
 import logging
 import math
 import numbers
@@ -35,6 +37,8 @@ RESERVED_NAMES = ["row-id"]
 LOGGER = logging.getLogger(__name__)
 INFINITY = float("inf")
 CONVERSION_METHODS = ["as_py", "to_pydatetime"]
+# Python type to DataGrid type, filled in by pytype_to_dgtype():
+SCALAR_DGTYPES = {}
 
 
 def contain(image, size, method=None):
@@ -138,13 +142,17 @@ def all_numbers(item):
 
 
 def pytype_to_dgtype(item):
+    if is_null(item):
+        return None
+
+    # The type of a scalar only depends on its Python type:
+    if type(item) in SCALAR_DGTYPES:
+        return SCALAR_DGTYPES[type(item)]
+
     import PIL.Image
 
     from .serialize import DATAGRID_TYPES
 
-    if is_null(item):
-        return None
-
     if isinstance(item, PIL.Image.Image):
         return "IMAGE-ASSET"
 
@@ -167,6 +175,8 @@ def pytype_to_dgtype(item):
 
     for ctype in DATAGRID_TYPES:
         if isinstance(item, tuple(DATAGRID_TYPES[ctype]["types"])):
+            if type(item) in (bool, int, float, str):
+                SCALAR_DGTYPES[type(item)] = ctype
             return ctype
 
     raise ValueError("unknown type: %r" % type(item))
@@ -228,10 +238,6 @@ def convert_to_type(value, dg_type):
     Convert to a type, allowing for
     possible later corercion.
     """
-    import PIL.Image
-
-    from .image import Image
-
     # FIXME: is this even needed?
     if dg_type is None or value is None:
         return value
@@ -266,6 +272,10 @@ def convert_to_type(value, dg_type):
             print("Invalid DATETIME: %r; ignoring" % value)
             return None
     elif dg_type == "IMAGE-ASSET":
+        import PIL.Image
+
+        from .image import Image
+
         if isinstance(value, (PIL.Image.Image,)):
             return Image(value)
         else:
@@ -463,6 +473,34 @@ def generate_guid():
     return uuid.uuid4().hex
 
 
+def generate_content_id(asset_type, asset_data, metadata=None):
+    """
+    Generate an asset id from the content of an asset, so that
+    identical assets get the same id.
+
+    Args:
+        asset_type: (str) the asset type
+        asset_data: (bytes or str) the asset data
+        metadata: (optional, dict) the asset metadata, with assets
+            replaced by their ids; its "assetId" is ignored
+
+    Returns: a BLAKE2 hash, as a hex string the length of a GUID
+    """
+    metadata = {
+        key: value for key, value in (metadata or {}).items() if key != "assetId"
+    }
+    digest = hashlib.blake2b(digest_size=16)
+    for part in [asset_type, asset_data, json.dumps(metadata, sort_keys=True)]:
+        if part is None:
+            part = b""
+        elif isinstance(part, str):
+            part = part.encode("utf-8")
+        # Length-prefixed, so that parts can't run together:
+        digest.update(b"%d:" % len(part))
+        digest.update(part)
+    return digest.hexdigest()
+
+
 def generate_image(asset_data):
     """
     Given the asset data, generate a PIL Image.
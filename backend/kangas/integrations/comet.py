@@ -232,6 +232,9 @@ def export_to_comet(path, name, options):
     )
     cur.execute("CREATE TABLE settings AS SELECT * from original.settings;")
     cur.execute("ALTER TABLE assets ADD COLUMN asset_data BLOB;")
+    cur.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS assets_asset_id ON assets (asset_id);"
+    )
     rows = list(
         conn.execute("SELECT asset_id, asset_metadata from original.assets;").fetchall()
     )
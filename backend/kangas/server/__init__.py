@@ -13,7 +13,7 @@
 
 import os
 
-from .queries import KANGAS_ROOT  # noqa
+from .queries import CONNECTION_POOL, KANGAS_ROOT  # noqa
 
 
 def start_tornado_server(port, debug_level=None, max_workers=None):
@@ -55,6 +55,8 @@ def start_tornado_server(port, debug_level=None, max_workers=None):
     except KeyboardInterrupt:
         print()
         print("Exiting Kangas tornado backend server")
+    finally:
+        CONNECTION_POOL.close_all()
 
 
 def start_flask_server(host, port, debug_level=None, max_workers=None):
@@ -74,3 +76,5 @@ def start_flask_server(host, port, debug_level=None, max_workers=None):
     except KeyboardInterrupt:
         print()
         print("Exiting Kangas flask backend server")
+    finally:
+        CONNECTION_POOL.close_all()
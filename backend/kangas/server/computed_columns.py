@@ -13,6 +13,7 @@
 
 import ast
 import hashlib
+import re
 
 import astor
 
@@ -25,6 +26,87 @@ def get_hash(string):
     return hashlib.sha1(string.encode("utf-8")).hexdigest()
 
 
+# Native SQLite JSON versions of the Python functions (see
+# add_python_functions() in queries.py). Each is used for JSON
+# arrays (or objects); other values still go to the Python function.
+# The JSON type of the argument, or NULL if it isn't JSON:
+JSON_KIND = "(CASE WHEN json_valid(%(x)s) THEN json_type(%(x)s) END)"
+# Python truthiness of a json_each() item:
+JSON_ITEM_TRUE = (
+    "(CASE json_item.type WHEN 'null' THEN 0 WHEN 'text' THEN json_item.value != '' "
+    + "WHEN 'array' THEN json_array_length(json_item.value) > 0 "
+    + "WHEN 'object' THEN EXISTS (SELECT 1 FROM json_each(json_item.value)) "
+    + "ELSE json_item.value != 0 END)"
+)
+# A json_each() item's value, keeping true and false (not 1 and 0):
+JSON_ITEM_VALUE = (
+    "(CASE %(item)s.type WHEN 'true' THEN json('true') "
+    + "WHEN 'false' THEN json('false') ELSE %(item)s.value END)"
+)
+JSON_FUNCTIONS = {
+    "LENGTH": "CASE " + JSON_KIND + " WHEN 'array' THEN json_array_length(%(x)s) "
+    + "WHEN 'object' THEN (SELECT COUNT(*) FROM json_each(%(x)s)) "
+    + "ELSE LENGTH(%(x)s) END",
+    "SUM_OF_LIST": "CASE " + JSON_KIND + " WHEN 'array' THEN "
+    + "(SELECT IFNULL(SUM(value), 0) FROM json_each(%(x)s)) "
+    + "ELSE SUM_OF_LIST(%(x)s) END",
+    "MEAN": "CASE " + JSON_KIND + " WHEN 'array' THEN "
+    + "(SELECT AVG(value) FROM json_each(%(x)s)) ELSE MEAN(%(x)s) END",
+    "ANY_IN_GROUP": "CASE " + JSON_KIND + " WHEN 'array' THEN EXISTS "
+    + "(SELECT 1 FROM json_each(%(x)s) AS json_item WHERE " + JSON_ITEM_TRUE + ") "
+    + "ELSE ANY_IN_GROUP(%(x)s) END",
+    "ALL_IN_GROUP": "CASE " + JSON_KIND + " WHEN 'array' THEN NOT EXISTS "
+    + "(SELECT 1 FROM json_each(%(x)s) AS json_item WHERE NOT " + JSON_ITEM_TRUE + ") "
+    + "ELSE ALL_IN_GROUP(%(x)s) END",
+    "FLATTEN": "CASE " + JSON_KIND + " WHEN 'array' THEN CASE WHEN NOT EXISTS "
+    + "(SELECT 1 FROM json_each(%(x)s) WHERE type != 'array') THEN "
+    + "(SELECT json_group_array("
+    + JSON_ITEM_VALUE % {"item": "json_inner"}
+    + ") FROM json_each(%(x)s) AS json_outer, "
+    + "json_each(json_outer.value) AS json_inner) "
+    + "ELSE FLATTEN(%(x)s) END ELSE FLATTEN(%(x)s) END",
+    "KEYS_OF": "CASE " + JSON_KIND + " WHEN 'object' THEN "
+    + "(SELECT json_group_array(key) FROM json_each(%(x)s)) ELSE KEYS_OF(%(x)s) END",
+    "VALUES_OF": "CASE " + JSON_KIND + " WHEN 'object' THEN "
+    + "(SELECT json_group_array("
+    + JSON_ITEM_VALUE % {"item": "json_item"}
+    + ") FROM json_each(%(x)s) AS json_item) "
+    + "ELSE VALUES_OF(%(x)s) END",
+    "IN_OBJ": "CASE " + JSON_KIND + " WHEN 'array' THEN EXISTS "
+    + "(SELECT 1 FROM json_each(%(x)s) WHERE value = %(item)s) "
+    + "WHEN 'object' THEN EXISTS "
+    + "(SELECT 1 FROM json_each(%(x)s) WHERE key = %(item)s) "
+    + "ELSE IN_OBJ(%(item)s, %(x)s) END",
+}
+
+
+def is_column_reference(arg):
+    """
+    Is the SQL argument a column, or a field of a column?
+    """
+    return re.match(r"^(\{'[^']*'\}|json_extract\(\{'[^']*'\}, '[^']*'\))$", arg)
+
+
+def json_function(function_name, x, item=None):
+    """
+    Get the SQL for a Python function, using SQLite's JSON
+    functions where possible.
+
+    Args:
+        function_name: the name of the Python SQL function
+        x: (str) the SQL argument
+        item: (str, optional) the item SQL argument of IN_OBJ
+
+    Returns: the SQL expression
+    """
+    if function_name in JSON_FUNCTIONS and is_column_reference(x):
+        return "(%s)" % (JSON_FUNCTIONS[function_name] % {"x": x, "item": item})
+    elif item is not None:
+        return "%s(%s, %s)" % (function_name, item, x)
+    else:
+        return "%s(%s)" % (function_name, x)
+
+
 class AttributeNode:
     def __init__(self, obj, attr):
         self.obj = obj
@@ -48,6 +130,19 @@ class AttributeNode:
         )
 
 
+# Functions applied to a column, over the whole datagrid:
+AGGREGATE_FUNCTIONS = [
+    "AVG",
+    "MAX",
+    "MIN",
+    "SUM",
+    "TOTAL",
+    "COUNT",
+    "STDEV",
+    "HISTOGRAM",
+]
+
+
 class Evaluator:
     def __init__(self):
         # Selections keep track of aggregate select clauses
@@ -95,7 +190,9 @@ class Evaluator:
             ## Special format for delayed evaluation of computed
             ## columns
             value = node.id
-            if value.lower() in [
+            if value in AGGREGATE_FUNCTIONS:
+                return value
+            elif value.lower() in [
                     "math", "random", "any", "all", "avg", "len",
                     "flatten", "sum", "range"
             ]:
@@ -111,16 +208,7 @@ class Evaluator:
         elif isinstance(node, ast.Call):
             function_name = self.eval_node(node.func)
             args = [self.eval_node(arg) for arg in node.args]
-            if function_name in [
-                "AVG",
-                "MAX",
-                "MIN",
-                "SUM",
-                "TOTAL",
-                "COUNT",
-                "STDEV",
-                "HISTOGRAM",
-            ]:
+            if function_name in AGGREGATE_FUNCTIONS:
                 column_name = args[0][2:-2].lower()
                 if function_name == "HISTOGRAM":
                     if len(args) != 2:
@@ -181,6 +269,8 @@ class Evaluator:
                     "sum": "SUM_OF_LIST",
                     "range": "RANGE",
                 }
+                if len(args) == 1:
+                    return json_function(function_map[function_name], str(args[0]))
                 sargs = ", ".join([str(arg) for arg in args])
                 expr = "{function_name}({sargs})".format(
                     function_name=function_map[function_name],
@@ -267,10 +357,7 @@ class Evaluator:
 
                     sargs = ", ".join([str(arg) for arg in args])
                     if function_name.attr == "mean":
-                        expr = "MEAN({sargs})".format(
-                            sargs=sargs,
-                        )
-                        return expr
+                        return json_function("MEAN", sargs)
                     else:
                         raise Exception("unsupported method %r" % repr(function_name))
                 elif function_name.obj == "math":
@@ -427,9 +514,13 @@ class Evaluator:
                 elif function_name.attr == "split":
                     return "SPLIT(%s)" % ", ".join([str(function_name.obj)] + args)
                 elif function_name.attr == "keys":
-                    return "KEYS_OF(%s)" % ", ".join([str(function_name.obj)] + args)
+                    return json_function(
+                        "KEYS_OF", ", ".join([str(function_name.obj)] + args)
+                    )
                 elif function_name.attr == "values":
-                    return "VALUES_OF(%s)" % ", ".join([str(function_name.obj)] + args)
+                    return json_function(
+                        "VALUES_OF", ", ".join([str(function_name.obj)] + args)
+                    )
                 else:
                     raise Exception("unknown method %r" % repr(function_name))
             else:
@@ -454,9 +545,9 @@ class Evaluator:
                     isinstance(comparators[0], str) and comparators[0].startswith("(")
                 ):
                     if ops[0] == " IN ":
-                        return "IN_OBJ(%s, %s)" % (left, comparators[0])
+                        return json_function("IN_OBJ", comparators[0], left)
                     elif ops[0] == " NOT IN ":
-                        return "NOT IN_OBJ(%s, %s)" % (left, comparators[0])
+                        return "NOT " + json_function("IN_OBJ", comparators[0], left)
 
             retval = ""
             for op, right in zip(ops, comparators):
@@ -608,16 +699,21 @@ def update_state(
     columns,
     select_expr_as,
     where_expr=None,
+    aggregates=None,
 ):
     """
     The top-level function to evaluate computed columns and computed
     expressions.
 
     The side effects are that the fields are added to `metadata`,
-    the needed computed aggregates are added to `databases`,
     the new computed columns are added to `columns`, and the
     additional select-as expressions are added to select_expr_as.
 
+    Aggregates (such as AVG({'x'})) become scalar subqueries;
+    `databases` is left as it is. If `aggregates` is given, it is
+    updated with {scalar subquery SQL: aggregate SQL}, so that the
+    caller can compute the aggregates ahead of time.
+
     Returns the SQL where clause, if `where_expr` is provided.
     """
     new_columns, select_map, where_sql = eval_computed_columns(
@@ -646,23 +742,30 @@ def update_state(
         {name_to_key(name): new_columns[name]["field_expr"] for name in new_columns}
     )
 
-    if where_sql:
-        where_sql = where_sql.format(**columns_to_field_name)
-
-    ## Database views to select from:
+    ## Aggregates over the whole datagrid:
+    subqueries = {}
     for select_name in select_map:
-        select_expr = select_map[select_name]
-        database = "(SELECT rowid, %s AS %s FROM datagrid)" % (
-            select_expr,
-            select_name,
+        select_expr = select_map[select_name].format(**columns_to_field_expr)
+        subqueries[select_name] = "(SELECT %s FROM datagrid)" % select_expr
+        if aggregates is not None:
+            aggregates[subqueries[select_name]] = select_expr
+
+    def inline_aggregates(sql):
+        if not subqueries:
+            return sql
+        return re.sub(
+            r"\b(%s)\b" % "|".join(re.escape(name) for name in subqueries),
+            lambda match: subqueries[match.group(1)],
+            sql,
         )
-        database = database.format(**columns_to_field_expr)
-        databases.append(database)
+
+    if where_sql:
+        where_sql = inline_aggregates(where_sql.format(**columns_to_field_name))
 
     ## Add to metadata, columns and add to select_expr_as:
     for column_name in new_columns:
-        field_expr = new_columns[column_name]["field_expr"].format(
-            **columns_to_field_name
+        field_expr = inline_aggregates(
+            new_columns[column_name]["field_expr"].format(**columns_to_field_name)
         )
         field_type = new_columns[column_name]["type"]
         field_name = new_columns[column_name]["field_name"]
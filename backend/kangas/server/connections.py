@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+
+import logging
+import os
+import sqlite3
+import threading
+import urllib.request
+from collections import OrderedDict
+
+LOGGER = logging.getLogger(__name__)
+
+
+def get_file_signature(db_path):
+    """
+    Get the (mtime, size) signature of a datagrid file.
+
+    Returns None if the file does not exist.
+    """
+    try:
+        stat = os.stat(db_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def is_writable(db_path):
+    """
+    Can the server write to this datagrid (and its journal)?
+    """
+    directory = os.path.dirname(os.path.abspath(db_path))
+    return os.access(db_path, os.W_OK) and os.access(directory, os.W_OK)
+
+
+# Maps a datagrid path to (signature, version) after the server
+# itself writes to the file, see note_internal_write():
+_VERSION_ALIASES = {}
+_VERSION_LOCK = threading.Lock()
+
+
+def get_datagrid_version(db_path):
+    """
+    Get the version of a datagrid file, used to know when cached
+    information about it is out of date.
+
+    This is the file signature, except that writes made by the
+    server that don't change the data (see note_internal_write())
+    keep the previous version.
+    """
+    signature = get_file_signature(db_path)
+    with _VERSION_LOCK:
+        alias = _VERSION_ALIASES.get(db_path)
+    if alias is not None and alias[0] == signature:
+        return alias[1]
+    return signature
+
+
+def note_internal_write(db_path, signature_before):
+    """
+    Record that the file changed from signature_before only
+    because of a write that leaves the data as it was (such
+    as saving a thumbnail), so that its version stays the same.
+
+    Args:
+        db_path: (str) the path to the datagrid
+        signature_before: the file signature, taken just
+            before the write
+    """
+    signature_after = get_file_signature(db_path)
+    with _VERSION_LOCK:
+        alias = _VERSION_ALIASES.get(db_path)
+        if alias is not None and alias[0] == signature_before:
+            version = alias[1]
+        else:
+            version = signature_before
+        _VERSION_ALIASES[db_path] = (signature_after, version)
+
+
+class ConnectionPool:
+    """
+    A pool of read-only SQLite connections, keyed by datagrid.
+
+    Each thread keeps its own connections (at most `max_per_thread`,
+    least-recently used are closed first). A connection is reopened
+    when the datagrid file's version (mtime, size) changes.
+
+    Args:
+        max_per_thread: (int) maximum number of open connections
+            kept for each thread
+        setup: (callable, optional) called once with each new
+            connection, for example to register SQL functions
+    """
+
+    def __init__(self, max_per_thread=8, setup=None):
+        self.max_per_thread = max_per_thread
+        self.setup = setup
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = set()
+
+    def _get_connections(self):
+        if not hasattr(self._local, "connections"):
+            self._local.connections = OrderedDict()
+        return self._local.connections
+
+    def _open(self, db_path):
+        uri = "file:%s?mode=ro" % urllib.request.pathname2url(os.path.abspath(db_path))
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        if self.setup is not None:
+            self.setup(conn)
+        with self._lock:
+            self._all.add(conn)
+        return conn
+
+    def _close(self, conn):
+        with self._lock:
+            self._all.discard(conn)
+        try:
+            conn.close()
+        except Exception:
+            LOGGER.debug("unable to close connection", exc_info=True)
+
+    def get_connection(self, db_path):
+        """
+        Get a read-only connection to the datagrid at db_path for
+        the current thread.
+        """
+        signature = get_datagrid_version(db_path)
+        if signature is None:
+            raise Exception("file not found: %r" % db_path)
+
+        connections = self._get_connections()
+        if db_path in connections:
+            conn, conn_signature = connections[db_path]
+            if conn_signature == signature:
+                connections.move_to_end(db_path)
+                return conn
+            # The file changed on disk:
+            del connections[db_path]
+            self._close(conn)
+
+        conn = self._open(db_path)
+        connections[db_path] = (conn, signature)
+        while len(connections) > self.max_per_thread:
+            _, (old_conn, _) = connections.popitem(last=False)
+            self._close(old_conn)
+        return conn
+
+    def size(self):
+        """
+        The number of open connections, across all threads.
+        """
+        with self._lock:
+            return len(self._all)
+
+    def close_all(self):
+        """
+        Close all of the open connections, in all threads.
+        """
+        with self._lock:
+            connections = list(self._all)
+            self._all.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                LOGGER.debug("unable to close connection", exc_info=True)
+        self._local = threading.local()
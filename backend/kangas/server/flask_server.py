@@ -26,8 +26,14 @@ from flask_caching import Cache
 
 from .._version import __version__
 from ..datatypes.utils import THUMBNAIL_SIZE, image_to_fp
+from .indexes import INDEX_ADVISOR
 from .queries import (  # custom_output,
+    CONNECTION_POOL,
     KANGAS_ROOT,
+    METADATA_CACHE,
+    PROJECTION_TRACE_CACHE,
+    QUERY_PLAN_CACHE,
+    RESULT_SET_CACHE,
     get_about,
     get_completions,
     get_datagrid_timestamp,
@@ -47,6 +53,7 @@ from .tasks import (
     select_asset_metadata_task,
     select_asset_task,
     select_category_task,
+    select_cells_task,
     select_histogram_task,
     select_projection_data_task,
 )
@@ -85,8 +92,8 @@ if log_file:
     application.logger.setLevel(KANGAS_LOG_FILE_LEVEL)
 
 
-def error(error_code):
-    response = make_response(str(error_code))
+def error(error_code, message=None):
+    response = make_response(message or str(error_code))
     response.status_code = error_code
     return response
 
@@ -233,6 +240,40 @@ def get_datagrid_histogram_handler():
         return error(404)
 
 
+@application.route("/datagrid/batch-cells", methods=["POST"])
+@auth_wrapper
+def get_datagrid_batch_cells_handler():
+    data = request.get_json(force=True)
+    # Required:
+    dgid = data.get("dgid")
+    cells = data.get("cells", [])
+    # Optional:
+    group_by = data.get("groupBy", None)
+    where = data.get("where", None)
+    where_description = data.get("whereDescription", where)
+    computed_columns = data.get("computedColumns", None)
+    where_expr = data.get("whereExpr", None)
+    where_expr = where_expr.strip() if where_expr else None
+    for cell in cells:
+        cell["columnValue"] = get_column_value(cell.get("columnValue", None))
+
+    if ensure_datagrid_path(dgid):
+        results = select_cells_task.apply(
+            args=(
+                dgid,
+                group_by,
+                where,
+                cells,
+                where_description,
+                computed_columns,
+                where_expr,
+            )
+        ).get()
+        return {"cells": results}
+    else:
+        return error(404)
+
+
 @application.route("/datagrid/query-total")
 @auth_wrapper
 def get_datagrid_query_total_handler():
@@ -274,21 +315,26 @@ def get_datagrid_query_page_handler():
     where = request.args.get("where", None)
     where_expr = request.args.get("whereExpr", None)
     where_expr = where_expr.strip() if where_expr else None
+    cursor = request.args.get("cursor", None)
 
     if ensure_datagrid_path(dgid):
-        result = select_query_page(
-            dgid,
-            offset,
-            group_by,
-            sort_by,
-            sort_desc,
-            where,
-            limit,
-            select,
-            computed_columns,
-            where_expr,
-            timestamp=timestamp,
-        )
+        try:
+            result = select_query_page(
+                dgid,
+                offset,
+                group_by,
+                sort_by,
+                sort_desc,
+                where,
+                limit,
+                select,
+                computed_columns,
+                where_expr,
+                timestamp=timestamp,
+                cursor=cursor,
+            )
+        except ValueError as exc:
+            return error(400, str(exc))
         return result
     else:
         return error(404)
@@ -360,6 +406,12 @@ def get_datagrid_status_handler():
         "OS version": "%s %s %s"
         % (platform.system(), platform.release(), platform.version()),
         "OS details": "%s (%s)" % (sys.platform, platform.platform()),
+        "Open connections": CONNECTION_POOL.size(),
+        "Metadata cache": METADATA_CACHE.stats(),
+        "Query plan cache": QUERY_PLAN_CACHE.stats(),
+        "Result set cache": RESULT_SET_CACHE.stats(),
+        "Projection cache": PROJECTION_TRACE_CACHE.stats(),
+        "Index advisor": INDEX_ADVISOR.stats(),
     }
     return result
 
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from ..datatypes.datagrid import create_column_index
+from .connections import get_file_signature, is_writable, note_internal_write
+
+LOGGER = logging.getLogger(__name__)
+KANGAS_INDEX_ADVISOR = int(os.environ.get("KANGAS_INDEX_ADVISOR", "0"))
+KANGAS_INDEX_ADVISOR_THRESHOLD = int(
+    os.environ.get("KANGAS_INDEX_ADVISOR_THRESHOLD", "3")
+)
+
+
+class IndexAdvisor:
+    """
+    Records which columns are used to sort, group, and filter
+    each datagrid, and once a column has been used `threshold`
+    times, creates an index on it in a background thread.
+
+    Indexes are only created on datagrids that the server can
+    write to, and only when enabled.
+
+    Args:
+        enabled: (bool) if False, only record the use of columns
+        threshold: (int) number of uses before creating an index
+    """
+
+    def __init__(self, enabled=False, threshold=3):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.uses = Counter()
+        self.indexed = set()
+        self._lock = threading.Lock()
+        # Its thread isn't started until an index is made:
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def record(self, db_path, metadata, field_names):
+        """
+        Record the use of columns in a query.
+
+        Args:
+            db_path: (str) the path to the datagrid
+            metadata: the datagrid metadata
+            field_names: the field_names used to sort, group,
+                or filter
+        """
+        columns = {
+            metadata[name]["field_name"]: name
+            for name in metadata
+            if re.match(r"^column_\d+$", metadata[name]["field_name"] or "")
+        }
+        todo = []
+        with self._lock:
+            for field_name in set(field_names):
+                if field_name not in columns:
+                    # Not a column of the datagrid table
+                    continue
+                key = (db_path, field_name)
+                self.uses[key] += 1
+                if (
+                    self.enabled
+                    and key not in self.indexed
+                    and self.uses[key] >= self.threshold
+                ):
+                    self.indexed.add(key)
+                    todo.append((columns[field_name], field_name))
+
+        for column_name, field_name in todo:
+            self._executor.submit(self._create_index, db_path, column_name, field_name)
+
+    def _create_index(self, db_path, column_name, field_name):
+        if not self.create_index(db_path, column_name, field_name):
+            # Such as "database is locked"; try again after more uses:
+            with self._lock:
+                self.indexed.discard((db_path, field_name))
+                self.uses[(db_path, field_name)] = 0
+
+    def create_index(self, db_path, column_name, field_name):
+        """
+        Create an index on a column, if the datagrid is writable.
+        """
+        if not is_writable(db_path):
+            LOGGER.debug("datagrid %r is not writable; no index made", db_path)
+            return False
+
+        signature_before = get_file_signature(db_path)
+        try:
+            conn = sqlite3.connect(db_path, timeout=5)
+            try:
+                create_column_index(conn, column_name, field_name)
+            finally:
+                conn.close()
+        except sqlite3.OperationalError as exc:
+            LOGGER.debug("unable to create index on %r: %s", column_name, exc)
+            return False
+
+        # An index doesn't change the data, so cached
+        # information about the datagrid is still valid:
+        note_internal_write(db_path, signature_before)
+        LOGGER.info("Created index on %r in %r", column_name, db_path)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "columns": len(self.uses),
+                "indexed": len(self.indexed),
+            }
+
+
+INDEX_ADVISOR = IndexAdvisor(
+    bool(KANGAS_INDEX_ADVISOR), threshold=KANGAS_INDEX_ADVISOR_THRESHOLD
+)
@@ -12,6 +12,8 @@
 ######################################################
 
 import ast
+import base64
+import functools
 import io
 import json
 import logging
@@ -23,13 +25,15 @@ import statistics
 import string
 import time
 import urllib
-from collections import Counter, defaultdict
+from collections import ChainMap, defaultdict
 
 import numpy as np
 import PIL.Image
 import PIL.ImageDraw
 
+from ..datatypes.sketches import QuantileSketch, TopK
 from ..datatypes.utils import (
+    generate_image,
     generate_thumbnail,
     get_color,
     image_to_fp,
@@ -37,12 +41,32 @@ from ..datatypes.utils import (
     pytype_to_dgtype,
 )
 from .computed_columns import unify_computed_columns, update_state
-from .utils import Cache, process_about, safe_compile, safe_env
+from .connections import ConnectionPool, get_datagrid_version
+from .indexes import INDEX_ADVISOR
+from .thumbnails import get_sidecar_thumbnail, save_thumbnail
+from .utils import (
+    Cache,
+    VersionedCache,
+    get_size,
+    process_about,
+    safe_compile,
+    safe_env,
+)
 
 LOGGER = logging.getLogger(__name__)
 KANGAS_ROOT = os.environ.get("KANGAS_ROOT", ".")
 MAX_CATEGORIES = 20
+# Saved in metadata.other, but not sent to the client:
+SKETCHES = {"quantiles", "distinct", "top"}
 HISTOGRAM_BINS = 10
+MAX_CONNECTIONS_PER_THREAD = int(os.environ.get("KANGAS_MAX_CONNECTIONS", "8"))
+QUERY_PLAN_CACHE_SIZE = 1000
+RESULT_SET_CACHE_SIZE = 20
+# Limit, in bytes, on each of the server-side caches:
+CACHE_MAX_BYTES = int(os.environ.get("KANGAS_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+RESULT_SET_MAX_BYTES = int(
+    os.environ.get("KANGAS_RESULT_SET_MAX_BYTES", 256 * 1024 * 1024)
+)
 
 CUSTOM_CODE_INIT = """
 import matplotlib.pyplot as plt
@@ -56,7 +80,15 @@ import math
 
 VALID_CHARS = string.ascii_letters + string.digits + "_"
 
-PROJECTION_TRACE_CACHE = Cache(100)
+PROJECTION_TRACE_CACHE = Cache(100, max_bytes=CACHE_MAX_BYTES)
+METADATA_CACHE = VersionedCache(max_bytes=CACHE_MAX_BYTES)
+QUERY_PLAN_CACHE = VersionedCache(
+    QUERY_PLAN_CACHE_SIZE,
+    max_bytes=CACHE_MAX_BYTES,
+    sizeof=lambda entry: entry[1].get_size(),
+)
+RESULT_SET_CACHE = VersionedCache(RESULT_SET_CACHE_SIZE, max_bytes=RESULT_SET_MAX_BYTES)
+RESULT_COUNT_CACHE = VersionedCache(QUERY_PLAN_CACHE_SIZE)
 
 
 def sqlite_query_explain(
@@ -305,11 +337,24 @@ class StdevFunc:
         return math.sqrt(self.S / (self.k - 1))  # To use MySQL version, change to k-2
 
 
+def _parse_list_or_obj(string):
+    # JSON, or a Python list from another function (like SPLIT):
+    try:
+        return json.loads(string)
+    except ValueError:
+        return ast.literal_eval(string)
+
+
+def _to_json(value):
+    # The same text as SQLite's json_group_array():
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
 def FLATTEN(lists):
     if lists:
         try:
-            return str(
-                [item for sublist in ast.literal_eval(lists) for item in sublist]
+            return _to_json(
+                [item for sublist in _parse_list_or_obj(lists) for item in sublist]
             )
         except Exception:
             pass
@@ -327,7 +372,7 @@ def SPLIT(string, delim=None, maxsplit=-1):
 def KEYS_OF(obj):
     if obj:
         try:
-            return str(list(ast.literal_eval(obj).keys()))
+            return _to_json(list(_parse_list_or_obj(obj).keys()))
         except Exception:
             pass
 
@@ -337,7 +382,7 @@ def KEYS_OF(obj):
 def VALUES_OF(obj):
     if obj:
         try:
-            return str(list(ast.literal_eval(obj).values()))
+            return _to_json(list(_parse_list_or_obj(obj).values()))
         except Exception:
             pass
 
@@ -348,7 +393,7 @@ def LENGTH(string_or_obj):
     ## Comes in as a string, but might be "[...]"
     if string_or_obj:
         try:
-            return len(ast.literal_eval(string_or_obj))
+            return len(_parse_list_or_obj(string_or_obj))
         except Exception:
             return len(string_or_obj)
     return 0
@@ -370,7 +415,7 @@ def SUM_OF_LIST(string_or_obj):
     ## Comes in as a string, but might be "[...]"
     if string_or_obj:
         try:
-            return sum(ast.literal_eval(string_or_obj))
+            return sum(_parse_list_or_obj(string_or_obj))
         except Exception:
             return sum(string_or_obj)
     return 0
@@ -380,7 +425,7 @@ def MEAN(string_or_obj):
     ## Comes in as a string, but might be "[...]"
     if string_or_obj:
         try:
-            return statistics.mean(ast.literal_eval(string_or_obj))
+            return statistics.mean(_parse_list_or_obj(string_or_obj))
         except Exception:
             return statistics.mean(string_or_obj)
     return 0
@@ -389,7 +434,7 @@ def MEAN(string_or_obj):
 def IN_OBJ(item, string_or_obj):
     if string_or_obj:
         try:
-            return item in list(ast.literal_eval(string_or_obj))
+            return item in list(_parse_list_or_obj(string_or_obj))
         except Exception:
             return item in string_or_obj
     return False
@@ -398,7 +443,7 @@ def IN_OBJ(item, string_or_obj):
 def ANY_IN_GROUP(group):
     if group:
         try:
-            decoded_group = ast.literal_eval(group)
+            decoded_group = _parse_list_or_obj(group)
         except Exception:
             decoded_group = None
         if isinstance(decoded_group, list):
@@ -414,7 +459,7 @@ def ALL_IN_GROUP(group):
     ## is empty
     if group:
         try:
-            decoded_group = ast.literal_eval(group)
+            decoded_group = _parse_list_or_obj(group)
         except Exception:
             decoded_group = None
         if isinstance(decoded_group, list):
@@ -441,14 +486,39 @@ def unescape(string):
         return ""
 
 
+@functools.lru_cache(maxsize=1000)
+def compile_list_comprehension(x, y, ifs):
+    """
+    Unescape and compile the parts of a list comprehension,
+    once for each expression (not once for each row).
+
+    Returns: (code, y, compiled_ifs)
+    """
+    code = safe_compile(unescape(x))
+    if ifs:
+        decoded_ifs = [unescape(exp) for exp in ifs.split(",")]
+    else:
+        decoded_ifs = []
+    compiled_ifs = [safe_compile(exp) for exp in decoded_ifs]
+    return code, unescape(y), compiled_ifs
+
+
+@functools.lru_cache(maxsize=1)
+def get_list_comprehension_env():
+    """
+    The environment that list comprehensions are evaluated in;
+    each call to ListComprehension() uses a copy.
+    """
+    return safe_env()
+
+
 def ListComprehension(x, y, gen, ifs):
     ## [x for y in gen ifs]
     results = []
     gen = unescape(gen)
     if gen:
-        x, y = unescape(x), unescape(y)
-        code = safe_compile(x)
-        env = safe_env()
+        code, y, compiled_ifs = compile_list_comprehension(x, y, ifs)
+        env = dict(get_list_comprehension_env())
         try:
             ## FIXME: a string that is a number is json-like
             decoded_gen = json.loads(gen)
@@ -459,13 +529,6 @@ def ListComprehension(x, y, gen, ifs):
             except Exception:
                 decoded_gen = gen
 
-        ## first, we prepare ifs:
-        if ifs:
-            decoded_ifs = [unescape(exp) for exp in ifs.split(",")]
-        else:
-            decoded_ifs = []
-        compiled_ifs = [safe_compile(exp) for exp in decoded_ifs]
-
         # dict:
         if isinstance(decoded_gen, dict):
             env[y] = decoded_gen
@@ -517,18 +580,29 @@ def add_python_functions(conn):
     conn.create_function("ListComprehension", 4, ListComprehension)
 
 
+CONNECTION_POOL = ConnectionPool(
+    MAX_CONNECTIONS_PER_THREAD,
+    setup=add_python_functions,
+)
+
+
 def get_database_connection(dgid):
+    """
+    Get a pooled, read-only connection to the datagrid.
+
+    Note: the connection is owned by the pool; don't close it.
+    """
     db_path = get_dg_path(dgid)
-    conn = sqlite3.connect(db_path)
-    add_python_functions(conn)
-    return conn
+    return CONNECTION_POOL.get_connection(db_path)
 
 
 def get_completions(dgid, computed_columns):
-    db_path = get_dg_path(dgid)
-    conn = sqlite3.connect(db_path)
+    conn = get_database_connection(dgid)
     unify_computed_columns(computed_columns)
-    rows = conn.execute("SELECT name, other, type from metadata;").fetchall()
+    metadata = get_metadata(conn, dgid)
+    rows = [
+        (name, metadata[name]["other"], metadata[name]["type"]) for name in metadata
+    ]
     if computed_columns:
         rows.extend(
             [(key, None, computed_columns[key]["type"]) for key in computed_columns]
@@ -630,16 +704,11 @@ def get_completions(dgid, computed_columns):
         name, other, datatype = row
         name = name if not name.endswith("--metadata") else name[:-10]
         results["{"].add('"%s"' % name)
-        if not other:
+        if other is None:
             # No metadata, but add methods for datatypes here:
             if datatype == "TEXT":
                 results['{"%s"}.' % (name,)].update(string_methods)
         else:
-            try:
-                other = json.loads(other)
-            except Exception:
-                continue
-
             results["["].add('[x for x in {"%s"}]' % name)
             if "completions" in other:
                 for comp in other["completions"].keys():
@@ -688,9 +757,29 @@ strings:
 """
 
 
-def get_metadata(conn):
+def get_metadata(conn, dgid=None):
+    """
+    Get the metadata for all columns.
+
+    If dgid is given, the parsed metadata is cached for the
+    current version of the datagrid file, and a copy-on-write
+    view of it is returned. Adding columns to the view (as
+    update_state does) leaves the cached metadata unchanged.
+    """
     try:
-        return _get_metadata(conn)
+        if dgid is None:
+            return _get_metadata(conn)
+
+        db_path = get_dg_path(dgid)
+
+        def compute():
+            # New (or changed) datagrid, drop anything else
+            # cached from the old version:
+            invalidate_caches(dgid)
+            return _get_metadata(conn)
+
+        metadata = METADATA_CACHE.get(db_path, get_datagrid_version(db_path), compute)
+        return ChainMap({}, metadata)
     except sqlite3.OperationalError as exc:
         LOGGER.error("SQL ERROR: %s", exc)
         raise Exception(str(exc))
@@ -723,6 +812,218 @@ def _get_metadata(conn):
     }
 
 
+def get_projection(select_expr_as, sql_exprs):
+    """
+    Get only the select expressions that a query needs, given the
+    SQL expressions (where clause, sort, group by, selected fields)
+    that it refers to.
+
+    A select expression is needed when its name is referenced,
+    directly or by another needed select expression.
+
+    Args:
+        select_expr_as: list of "column_N" and "EXPR AS ccN"
+        sql_exprs: list of SQL expressions (None is skipped)
+
+    Returns: the list of needed select expressions
+    """
+    names = set(re.findall(r"\w+", " ".join(expr for expr in sql_exprs if expr)))
+    needed = [False] * len(select_expr_as)
+    changed = True
+    while changed:
+        changed = False
+        for i, expr_as in enumerate(select_expr_as):
+            if not needed[i] and expr_as.rsplit(" AS ", 1)[-1] in names:
+                needed[i] = changed = True
+                names.update(re.findall(r"\w+", expr_as))
+
+    projection = [expr_as for expr_as, need in zip(select_expr_as, needed) if need]
+    # SELECT needs at least one expression:
+    return projection or ["1"]
+
+
+def get_aggregate_constants(conn, aggregates):
+    """
+    Compute the aggregates over the whole datagrid, all in one
+    query.
+
+    Args:
+        conn: a connection to the datagrid
+        aggregates: a dict of {scalar subquery SQL: aggregate SQL}
+
+    Returns: a dict of {scalar subquery SQL: SQL constant}; empty if
+        the aggregates can't be computed, so that the subqueries
+        are left (and report their own errors)
+    """
+    select_sql = "SELECT %s FROM datagrid;" % ", ".join(aggregates.values())
+    LOGGER.debug("SQL %s", select_sql)
+    try:
+        row = conn.execute(select_sql).fetchone()
+    except sqlite3.OperationalError as exc:
+        LOGGER.debug("unable to compute aggregates: %s", exc)
+        return {}
+
+    constants = {}
+    for subquery, value in zip(aggregates, row):
+        if value is None:
+            constants[subquery] = "NULL"
+        elif isinstance(value, str):
+            constants[subquery] = quote_value(value)
+        elif isinstance(value, float) and math.isinf(value):
+            constants[subquery] = "1e999" if value > 0 else "-1e999"
+        elif isinstance(value, (int, float)):
+            constants[subquery] = repr(value)
+    return constants
+
+
+def replace_all(sql, replacements):
+    """
+    Replace each key of replacements in sql with its value.
+    """
+    if sql:
+        for old, new in replacements.items():
+            sql = sql.replace(old, new)
+    return sql
+
+
+class QueryPlan:
+    """
+    The compiled form of a set of computed columns and a
+    where expression, for one version of a datagrid.
+
+    Attributes:
+        columns: the column names, including computed columns
+        select_expr_as: the SQL select expressions for the columns
+        databases: the SQL FROM clauses
+        where_sql: the SQL where clause, or None
+        sql: a dict of finished SQL statements, filled in by the
+            query functions that use this plan
+        projections: a dict of the projections made by project()
+
+    Args:
+        base_metadata: the datagrid's metadata
+        computed_columns: the computed columns, or None
+        where_expr: the where expression, or None
+        conn: (optional) a connection to the datagrid. If given,
+            the aggregates (such as AVG({'x'})) are computed here, in
+            one pass, and used as constants in the plan's SQL
+    """
+
+    def __init__(self, base_metadata, computed_columns, where_expr, conn=None):
+        metadata = ChainMap({}, base_metadata)
+        columns = list(base_metadata.keys())
+        select_expr_as = [get_field_name(column, metadata) for column in columns]
+        databases = ["datagrid"]
+        where_sql = None
+        aggregates = {}
+
+        if computed_columns or where_expr:
+            # Side-effects: updates metadata, databases, columns, select_expr_as:
+            where_sql = update_state(
+                computed_columns,
+                metadata,
+                databases,
+                columns,
+                select_expr_as,
+                where_expr,
+                aggregates,
+            )
+
+        if conn is not None and aggregates:
+            constants = get_aggregate_constants(conn, aggregates)
+            where_sql = replace_all(where_sql, constants)
+            select_expr_as = [replace_all(expr, constants) for expr in select_expr_as]
+            for column in metadata.maps[0].values():
+                column["field_expr"] = replace_all(column["field_expr"], constants)
+
+        self.base_metadata = base_metadata
+        self.computed_metadata = metadata.maps[0]
+        self.columns = columns
+        self.select_expr_as = select_expr_as
+        self.databases = databases
+        self.where_sql = where_sql if where_sql else None
+        self.sql = {}
+        self.projections = {}
+
+    def get_size(self):
+        """
+        Estimate the bytes used by this plan. The base metadata is
+        shared with the metadata cache, and every other plan of the
+        datagrid, so it isn't counted.
+        """
+        return get_size(
+            [
+                self.computed_metadata,
+                self.columns,
+                self.select_expr_as,
+                self.databases,
+                self.where_sql,
+                self.sql,
+                self.projections,
+            ]
+        )
+
+    def unpack(self):
+        """
+        Returns fresh copies of (metadata, columns, select_expr_as,
+        databases) that the caller may change.
+        """
+        return (
+            ChainMap(dict(self.computed_metadata), self.base_metadata),
+            list(self.columns),
+            list(self.select_expr_as),
+            list(self.databases),
+        )
+
+    def project(self, *sql_exprs):
+        """
+        Returns (select_expr_as, databases) for a query that only
+        refers to sql_exprs and the where clause. See get_projection().
+        """
+        if sql_exprs not in self.projections:
+            self.projections[sql_exprs] = get_projection(
+                self.select_expr_as, sql_exprs + (self.where_sql,)
+            )
+        return list(self.projections[sql_exprs]), list(self.databases)
+
+
+def invalidate_caches(dgid):
+    """
+    Drop the cached query plans, result sets, and projection
+    traces of a datagrid.
+    """
+    db_path = get_dg_path(dgid)
+    QUERY_PLAN_CACHE.invalidate(db_path)
+    PROJECTION_TRACE_CACHE.invalidate(db_path)
+    RESULT_SET_CACHE.invalidate(db_path)
+    RESULT_COUNT_CACHE.invalidate(db_path)
+
+
+def get_query_plan(conn, dgid, computed_columns, where_expr):
+    """
+    Get the QueryPlan for computed_columns and where_expr on
+    the current version of the datagrid.
+
+    Plans are cached, so repeated requests with the same
+    expressions don't parse and translate them again.
+    """
+    unify_computed_columns(computed_columns)
+    db_path = get_dg_path(dgid)
+    key = (
+        db_path,
+        where_expr,
+        json.dumps(computed_columns, sort_keys=True),
+    )
+    return QUERY_PLAN_CACHE.get(
+        key,
+        get_datagrid_version(db_path),
+        lambda: QueryPlan(
+            get_metadata(conn, dgid), computed_columns, where_expr, conn
+        ),
+        dgid=db_path,
+    )
+
+
 def plural(count, noun):
     if noun.endswith("'"):
         nouns = noun
@@ -755,8 +1056,8 @@ def histogram(cur, metadata, values, column):
     column_type = stats["type"]
     name = stats.get("name", column)
 
-    if values:
-        np_values = np.array(values, dtype=np.float64)
+    if len(values):
+        np_values = np.asarray(values, dtype=np.float64)
         np_values = np_values[~np.isnan(np_values)]
     else:
         # How can this happen? The field changed
@@ -767,7 +1068,7 @@ def histogram(cur, metadata, values, column):
         LOGGER.debug(
             "column %r does not have pre-computed stats; computing on the fly", column
         )
-        if values:
+        if len(np_values):
             minimum = np_values.min().item()
             maximum = np_values.max().item()
         else:
@@ -781,7 +1082,7 @@ def histogram(cur, metadata, values, column):
     counts, labels = np.histogram(np_values, bins=HISTOGRAM_BINS, range=range)
 
     # Compute stats for this set:
-    if values:
+    if len(np_values):
         try:
             quantiles = np.nanquantile(np_values, q=[0.25, 0.50, 0.75], axis=0)
             std = np.nanstd(np_values, axis=0, ddof=1).item()
@@ -927,6 +1228,9 @@ def select_group_by_rows(
     field_expr = get_field_expr(column_name, metadata)
 
     column_value = get_column_value(column_value, group_by, metadata)
+    select_expr_as = get_projection(
+        select_expr_as, [where, field_expr, group_by_field_expr]
+    )
 
     try:
         rows = get_group_by_rows(
@@ -948,6 +1252,28 @@ def select_group_by_rows(
     return rows
 
 
+def push_down_group_predicate(where, group_by_field_expr, column_values):
+    """
+    Add the selection of the group(s) to the where clause.
+
+    Instead of aggregating every group and then keeping the one
+    with the group value, only the rows of the group are scanned,
+    and an index on the group_by column can be used.
+
+    Args:
+        where: the SQL where clause
+        group_by_field_expr: the SQL expression of the group_by column
+        column_values: a list of SQL values of the group_by column
+
+    Returns: the new where clause
+    """
+    predicate = " OR ".join(
+        "(%s) IS %s" % (group_by_field_expr, column_value)
+        for column_value in column_values
+    )
+    return "(%s) AND (%s)" % (where, predicate)
+
+
 def get_group_by_rows(
     cur,
     group_by_field_name,
@@ -961,18 +1287,15 @@ def get_group_by_rows(
     distinct=False,
 ):
     env = {
-        "group_by_field_name": group_by_field_name,
-        "group_by_field_expr": group_by_field_expr,
         "field_name": field_name,
         "field_expr": field_expr,
-        "column_value": column_value,
-        "where": where,
+        "where": push_down_group_predicate(where, group_by_field_expr, [column_value]),
         "databases": ", ".join(databases),
         "select_expr_as": ", ".join(select_expr_as),
         "distinct": "DISTINCT " if distinct else "",
     }
 
-    select_sql = "SELECT value FROM (SELECT {select_expr_as}, {group_by_field_expr} AS {group_by_field_name}, GROUP_CONCAT({distinct}REPLACE(IFNULL({field_expr},'None'), ',', '&comma;')) as value FROM {databases} WHERE {where} GROUP BY {group_by_field_name}) WHERE {group_by_field_name} is {column_value}"
+    select_sql = "SELECT GROUP_CONCAT({distinct}REPLACE(IFNULL({field_expr},'None'), ',', '&comma;')) as value, {select_expr_as} FROM {databases} WHERE {where}"
     selection_sql = select_sql.format(**env)
 
     LOGGER.debug("SQL %s", selection_sql)
@@ -983,6 +1306,219 @@ def get_group_by_rows(
     return rows
 
 
+def get_group_values_sql(
+    group_by_field_name,
+    group_by_field_expr,
+    field_expr,
+    column_value,
+    where,
+    databases,
+    select_expr_as,
+):
+    """
+    Get the SQL that selects the values of field_expr (as
+    "value", with their SQL types) in the rows where the group_by
+    column is column_value.
+
+    Unlike get_group_by_rows(), the values are not joined into a
+    string, so they can be aggregated in SQL or streamed.
+
+    If group_by_field_expr is None, all of the rows are selected.
+    """
+    if group_by_field_expr is not None:
+        where = push_down_group_predicate(where, group_by_field_expr, [column_value])
+    env = {
+        "field_expr": field_expr,
+        "where": where,
+        "databases": ", ".join(databases),
+        "select_expr_as": ", ".join(select_expr_as),
+    }
+    select_sql = "SELECT value FROM (SELECT {select_expr_as}, {field_expr} AS value FROM {databases} WHERE {where})"
+    return select_sql.format(**env)
+
+
+def execute_group_values_sql(cur, sql):
+    LOGGER.debug("SQL %s", sql)
+    start_time = time.time()
+    try:
+        cur.execute(sql)
+    except sqlite3.OperationalError as exc:
+        LOGGER.error("SQL: %s", exc)
+        raise Exception(str(exc))
+    LOGGER.debug("SQL %s seconds", time.time() - start_time)
+    return cur
+
+
+def get_category_json(
+    rows,
+    column_name,
+    column_type,
+    group_by,
+    column_value,
+    where_description,
+    computed_columns,
+):
+    """
+    Make the category cell result from rows of (category, count,
+    number of categories, number of values), ordered by category.
+    """
+    # These are categories (ints or strings):
+    results_json = {"type": "verbatim", "value": "", "columnType": column_type}
+    if rows:
+        counts = {category: count for (category, count, _, _) in rows}
+        values = list(counts.keys())
+        ulength = rows[0][2]
+        length = rows[0][3]
+
+        if length == 0:
+            results_json = {
+                "type": "verbatim",
+                "value": plural(length, "value"),
+                "columnType": column_type,
+            }
+        elif length == 1:
+            results_json = {
+                "type": "verbatim",
+                "value": values[0],
+                "columnType": column_type,
+            }
+        elif ulength == 1:
+            results_json = {
+                "type": "verbatim",
+                "value": "%s (%s of them)" % (values[0], length),
+                "columnType": column_type,
+            }
+        elif ulength > MAX_CATEGORIES:
+            if length == ulength:
+                results_json = {
+                    "type": "verbatim",
+                    "value": plural(length, "unique value"),
+                    "columnType": column_type,
+                }
+            else:
+                results_json = {
+                    "type": "verbatim",
+                    "value": (
+                        plural(length, "value")
+                        + ", "
+                        + ("%s %s" % (ulength, "unique"))
+                    ),
+                    "columnType": column_type,
+                }
+        else:
+            counts = {
+                key: value
+                for (key, value) in sorted(counts.items(), key=lambda item: item[1])
+            }
+            # values: {"Animal": 37, "Plant": 12}
+            results_json = {
+                "type": "category",
+                "values": counts,
+                "column": column_name,
+                "columnType": column_type,
+                "groupBy": group_by,
+                "groupByValue": column_value,
+                "whereDescription": where_description,
+                "computedColumns": computed_columns,
+            }
+
+    return results_json
+
+
+def get_description_json(count, first_value, column_type):
+    """
+    Make the description cell result from the number of values,
+    and the first one (as text).
+    """
+    results_json = {"type": "verbatim", "value": "", "columnType": column_type}
+
+    if count == 1:
+        results_json["value"] = first_value
+    elif count > 1:
+        results_json["value"] = plural(count, "value")
+
+    return results_json
+
+
+def get_saved_histogram(metadata, column):
+    """
+    Get the histogram of a whole column from the histogram and
+    quantile sketch saved in its metadata, without reading the
+    data. The quartiles and median are approximate for large
+    columns.
+
+    Returns: the same as histogram(), or None if the column doesn't
+        have them
+    """
+    stats = metadata[column]
+    other = stats.get("other") or {}
+    if (
+        not isinstance(other, dict)
+        or "histogram" not in other
+        or len(other["histogram"]["bins"]) != HISTOGRAM_BINS
+    ):
+        return None
+
+    count = other["count"]
+    quantiles = QuantileSketch.from_dict(other["quantiles"]).quantiles(
+        [0.25, 0.50, 0.75]
+    )
+    # The saved variance is of the population; histogram() uses the sample's:
+    std = math.sqrt(stats["variance"] * count / (count - 1)) if count > 1 else 0.0
+    return {
+        "type": "histogram",
+        "bins": other["histogram"]["bins"],
+        "labels": other["histogram"]["labels"],
+        "min": stats["minimum"],
+        "max": stats["maximum"],
+        "columnType": stats["type"],
+        "column": stats.get("name", column),
+        "statistics": {
+            "count": count,
+            "min": stats["minimum"],
+            "max": stats["maximum"],
+            "mean": stats["average"],
+            "median": quantiles[1],
+            "std": std,
+            "25%": quantiles[0],
+            "50%": quantiles[1],
+            "75%": quantiles[2],
+            "sum": stats["total"],
+        },
+    }
+
+
+def get_saved_category_rows(metadata, column):
+    """
+    Get the category rows of a whole TEXT column (as used by
+    get_category_json()) from the sketches saved in its metadata,
+    without reading the data. The number of unique values is
+    approximate for columns with many of them, unless the stats
+    were computed with exact=True.
+
+    Returns: a list of rows, or None if the column doesn't have them
+    """
+    other = metadata[column].get("other") or {}
+    if not isinstance(other, dict) or "top" not in other:
+        return None
+
+    top = TopK.from_dict(other["top"])
+    nulls = other["nulls"]
+    length = top.n + nulls
+    if top.exact:
+        counts = dict(top.counts)
+        if nulls:
+            counts["None"] = counts.get("None", 0) + nulls
+        ulength = len(counts)
+    else:
+        counts = dict(top.most_common(MAX_CATEGORIES + 1))
+        ulength = other["count_unique"] + (1 if nulls else 0)
+    return [
+        (category, counts[category], ulength, length)
+        for category in sorted(counts)[: MAX_CATEGORIES + 1]
+    ]
+
+
 def select_histogram(
     dgid,
     group_by,
@@ -996,60 +1532,44 @@ def select_histogram(
     conn = get_database_connection(dgid)
     cur = conn.cursor()
 
-    unify_computed_columns(computed_columns)
-    metadata = get_metadata(conn)
-    columns = list(metadata.keys())
-    select_expr_as = [get_field_name(column, metadata) for column in columns]
-    databases = ["datagrid"]
-
-    if computed_columns or where_expr:
-        where_sql = update_state(
-            computed_columns,
-            metadata,
-            databases,
-            columns,
-            select_expr_as,
-            where_expr,
-        )
-        if where_sql:
-            where = where_sql
-
-    where = where if where else "1"
+    plan = get_query_plan(conn, dgid, computed_columns, where_expr)
+    metadata, columns, select_expr_as, databases = plan.unpack()
+    where = plan.where_sql or where or "1"
 
-    field_name = get_field_name(column_name, metadata)
     field_expr = metadata[column_name]["field_expr"]
     group_by_field_name = get_field_name(group_by, metadata)
-    group_by_field_expr = get_field_expr(group_by, metadata)
+    group_by_field_expr = get_field_expr(group_by, metadata) if group_by else None
 
-    column_value = get_column_value(column_value, group_by, metadata)
-
-    try:
-        rows = get_group_by_rows(
-            cur,
+    results_json = None
+    if group_by:
+        column_value = get_column_value(column_value, group_by, metadata)
+    elif where == "1" and column_name in plan.base_metadata:
+        # The whole column; use the histogram saved with the datagrid:
+        results_json = get_saved_histogram(metadata, column_name)
+
+    if results_json is None:
+        select_expr_as, databases = plan.project(
+            where, field_expr, group_by_field_expr
+        )
+        values_sql = get_group_values_sql(
             group_by_field_name,
             group_by_field_expr,
-            field_name,
             field_expr,
             column_value,
             where,
             databases,
             select_expr_as,
         )
-    except sqlite3.OperationalError as exc:
-        LOGGER.error("SQL: %s", exc)
-        raise Exception(str(exc))
-
-    # These should be numbers:
-    values = []
-    if rows:
-        row = rows[0]
-        if row:
-            if row[0]:
-                values = parse_comma_separated_values(row[0])
-            if not isinstance(values, (list, tuple)):
-                values = [values]
+        # These should be numbers; NULL is NaN:
+        values = np.fromiter(
+            (
+                np.nan if value is None else value
+                for (value,) in execute_group_values_sql(cur, values_sql)
+            ),
+            dtype=np.float64,
+        )
 
-    results_json = histogram(cur, metadata, values, column_name)
+        results_json = histogram(cur, metadata, values, column_name)
 
     results_json["groupBy"] = group_by
     results_json["groupByValue"] = column_value
@@ -1062,9 +1582,17 @@ def select_histogram(
 def select_metadata(dgid):
     conn = get_database_connection(dgid)
 
-    metadata = get_metadata(conn)
+    metadata = get_metadata(conn, dgid)
 
-    return metadata
+    results = {}
+    for name, column in metadata.items():
+        other = column.get("other")
+        if isinstance(other, dict) and SKETCHES.intersection(other):
+            # The sketches are only used by the server:
+            other = {key: other[key] for key in other if key not in SKETCHES}
+            column = dict(column, other=other)
+        results[name] = column
+    return results
 
 
 def select_description(
@@ -1080,63 +1608,34 @@ def select_description(
     conn = get_database_connection(dgid)
     cur = conn.cursor()
 
-    unify_computed_columns(computed_columns)
-    metadata = get_metadata(conn)
-    columns = list(metadata.keys())
-    select_expr_as = [get_field_name(column, metadata) for column in columns]
-    databases = ["datagrid"]
-
-    if computed_columns or where_expr:
-        where_sql = update_state(
-            computed_columns,
-            metadata,
-            databases,
-            columns,
-            select_expr_as,
-            where_expr,
-        )
-        if where_sql:
-            where = where_sql
-
-    where = where if where else "1"
+    plan = get_query_plan(conn, dgid, computed_columns, where_expr)
+    metadata, columns, select_expr_as, databases = plan.unpack()
+    where = plan.where_sql or where or "1"
 
     column_type = metadata[column_name]["type"]
-    field_name = get_field_name(column_name, metadata)
     field_expr = metadata[column_name]["field_expr"]
     group_by_field_name = get_field_name(group_by, metadata)
     group_by_field_expr = get_field_expr(group_by, metadata)
 
     column_value = get_column_value(column_value, group_by, metadata)
+    select_expr_as, databases = plan.project(where, field_expr, group_by_field_expr)
 
-    try:
-        rows = get_group_by_rows(
-            cur,
-            group_by_field_name,
-            group_by_field_expr,
-            field_name,
-            field_expr,
-            column_value,
-            where,
-            databases,
-            select_expr_as,
-        )
-    except sqlite3.OperationalError as exc:
-        LOGGER.error("SQL: %s", exc)
-        raise Exception(str(exc))
-
-    results_json = {"type": "verbatim", "value": "", "columnType": column_type}
-
-    if rows:
-        row = rows[0]
-        if row:
-            if row[0]:
-                delims = row[0].count(",")
-                if delims == 0:
-                    results_json["value"] = row[0]
-                else:
-                    results_json["value"] = plural(delims + 1, "value")
+    values_sql = get_group_values_sql(
+        group_by_field_name,
+        group_by_field_expr,
+        field_expr,
+        column_value,
+        where,
+        databases,
+        select_expr_as,
+    )
+    count_sql = (
+        "SELECT COUNT(*), MIN(IFNULL(CAST(value AS TEXT), 'None')) FROM (%s)"
+        % values_sql
+    )
+    count, first_value = execute_group_values_sql(cur, count_sql).fetchone()
 
-    return results_json
+    return get_description_json(count, first_value, column_type)
 
 
 def select_category(
@@ -1155,119 +1654,217 @@ def select_category(
     conn = get_database_connection(dgid)
     cur = conn.cursor()
 
-    unify_computed_columns(computed_columns)
-    metadata = get_metadata(conn)
-    columns = list(metadata.keys())
-    select_expr_as = [get_field_name(column, metadata) for column in columns]
-    databases = ["datagrid"]
+    plan = get_query_plan(conn, dgid, computed_columns, where_expr)
+    metadata, columns, select_expr_as, databases = plan.unpack()
+    where = plan.where_sql or where or "1"
 
-    if computed_columns or where_expr:
-        where_sql = update_state(
-            computed_columns,
-            metadata,
+    column_type = metadata[column_name]["type"]
+    field_expr = get_field_expr(column_name, metadata)
+    group_by_field_name = get_field_name(group_by, metadata)
+    group_by_field_expr = get_field_expr(group_by, metadata) if group_by else None
+
+    rows = None
+    if group_by:
+        column_value = get_column_value(column_value, group_by, metadata)
+    elif where == "1" and column_name in plan.base_metadata:
+        # The whole column; use the sketches saved with the datagrid:
+        rows = get_saved_category_rows(metadata, column_name)
+
+    if rows is None:
+        select_expr_as, databases = plan.project(
+            where, field_expr, group_by_field_expr
+        )
+        values_sql = get_group_values_sql(
+            group_by_field_name,
+            group_by_field_expr,
+            field_expr,
+            column_value,
+            where,
             databases,
-            columns,
             select_expr_as,
-            where_expr,
         )
-        if where_sql:
-            where = where_sql
+        # Count each category, and the totals, without
+        # fetching more than MAX_CATEGORIES + 1 of them:
+        counts_sql = (
+            "SELECT category, count, COUNT(*) OVER (), SUM(count) OVER () FROM "
+            + "(SELECT IFNULL(CAST(value AS TEXT), 'None') AS category, COUNT(*) AS count "
+            + "FROM (%s) GROUP BY category) ORDER BY category LIMIT %s"
+        ) % (values_sql, MAX_CATEGORIES + 1)
+        rows = execute_group_values_sql(cur, counts_sql).fetchall()
+
+    return get_category_json(
+        rows,
+        column_name,
+        column_type,
+        group_by,
+        column_value,
+        where_description,
+        computed_columns,
+    )
 
-    where = where if where else "1"
 
-    column_type = metadata[column_name]["type"]
-    field_name = get_field_name(column_name, metadata)
-    field_expr = get_field_expr(column_name, metadata)
-    group_by_field_name = get_field_name(group_by, metadata)
-    group_by_field_expr = get_field_expr(group_by, metadata)
+def get_cell_values_sql(
+    group_by_field_name,
+    group_by_field_expr,
+    field_expr,
+    column_values,
+    where,
+    databases,
+    select_expr_as,
+):
+    """
+    Like get_group_values_sql(), but for many groups at once. Each
+    value is selected with "cell_group", the index of its group's
+    value in column_values.
+    """
+    cases = " ".join(
+        "WHEN {group_by_field_name} IS %s THEN %s" % (column_value, index)
+        for index, column_value in enumerate(column_values)
+    )
+    env = {
+        "group_by_field_name": group_by_field_name,
+        "group_by_field_expr": group_by_field_expr,
+        "field_expr": field_expr,
+        "where": push_down_group_predicate(where, group_by_field_expr, column_values),
+        "databases": ", ".join(databases),
+        "select_expr_as": ", ".join(select_expr_as),
+    }
+    select_sql = (
+        "SELECT CASE %s END AS cell_group, value FROM (SELECT {select_expr_as}, {group_by_field_expr} AS {group_by_field_name}, {field_expr} AS value FROM {databases} WHERE {where})"
+        % cases
+    )
+    return select_sql.format(**env)
 
-    column_value = get_column_value(column_value, group_by, metadata)
 
-    try:
-        rows = get_group_by_rows(
-            cur,
+def select_cells(
+    dgid,
+    group_by,
+    where,
+    cells,
+    where_description,
+    computed_columns,
+    where_expr,
+):
+    """
+    Compute a page of group cells at once. The cells of each column
+    (and type) are computed with one query, rather than one query
+    per cell.
+
+    Args:
+        dgid: the datagrid id
+        group_by: the name of the column the datagrid is grouped by
+        where: (str, optional) a SQL where clause
+        cells: a list of dicts with "type" ("histogram", "category",
+            or "description"), "columnName", and "columnValue" (the
+            value of the group_by column)
+        where_description: (str, optional) description of the where
+        computed_columns: (dict, optional) the computed columns
+        where_expr: (str, optional) a Python where expression
+
+    Returns: a list of results, in the order of cells, the same as
+        select_histogram(), select_category(), or select_description()
+        would return for each.
+    """
+    conn = get_database_connection(dgid)
+    cur = conn.cursor()
+
+    plan = get_query_plan(conn, dgid, computed_columns, where_expr)
+    metadata, columns, select_expr_as, databases = plan.unpack()
+    where = plan.where_sql or where or "1"
+
+    group_by_field_name = get_field_name(group_by, metadata)
+    group_by_field_expr = get_field_expr(group_by, metadata)
+
+    # (type, column_name) -> {column_value: [cell indexes]}
+    batches = defaultdict(dict)
+    for index, cell in enumerate(cells):
+        if cell["type"] not in ["histogram", "category", "description"]:
+            raise Exception("Unknown cell type: %r" % cell["type"])
+        column_value = get_column_value(cell["columnValue"], group_by, metadata)
+        batch = batches[(cell["type"], cell["columnName"])]
+        batch.setdefault(column_value, []).append(index)
+
+    results = [None] * len(cells)
+    for (cell_type, column_name), batch in batches.items():
+        column_type = get_column_type(column_name, metadata)
+        column_values = list(batch.keys())
+        field_expr = get_field_expr(column_name, metadata)
+        select_expr_as, databases = plan.project(where, field_expr, group_by_field_expr)
+        values_sql = get_cell_values_sql(
             group_by_field_name,
             group_by_field_expr,
-            field_name,
             field_expr,
-            column_value,
+            column_values,
             where,
             databases,
             select_expr_as,
         )
-    except sqlite3.OperationalError as exc:
-        LOGGER.error("SQL: %s", exc)
-        raise Exception(str(exc))
-
-    # These are categories (ints or strings):
-    results_json = {"type": "verbatim", "value": "", "columnType": column_type}
-    if rows:
-        row = rows[0]
-        if row:
-            raw_value = row[0]
-            if raw_value:
-                values = [v.replace("&comma;", ",") for v in raw_value.split(",")]
-            else:
-                values = []
 
-            counts = Counter(values)
-            length = len(values)
-            unique_values = list(counts.keys())
-            ulength = len(unique_values)
+        if cell_type == "histogram":
+            values = [[] for column_value in column_values]
+            for cell_group, value in execute_group_values_sql(cur, values_sql):
+                values[cell_group].append(np.nan if value is None else value)
+            batch_results = []
+            for column_value, group_values in zip(column_values, values):
+                results_json = histogram(
+                    cur,
+                    metadata,
+                    np.array(group_values, dtype=np.float64),
+                    column_name,
+                )
+                results_json["groupBy"] = group_by
+                results_json["groupByValue"] = column_value
+                results_json["whereDescription"] = where_description
+                results_json["computedColumns"] = computed_columns
+                batch_results.append(results_json)
+
+        elif cell_type == "category":
+            counts_sql = (
+                "SELECT cell_group, category, count, ucount, total FROM "
+                + "(SELECT cell_group, category, count, "
+                + "COUNT(*) OVER (PARTITION BY cell_group) AS ucount, "
+                + "SUM(count) OVER (PARTITION BY cell_group) AS total, "
+                + "ROW_NUMBER() OVER (PARTITION BY cell_group ORDER BY category) AS position FROM "
+                + "(SELECT cell_group, IFNULL(CAST(value AS TEXT), 'None') AS category, COUNT(*) AS count "
+                + "FROM (%s) GROUP BY cell_group, category)) "
+                + "WHERE position <= %s ORDER BY cell_group, category"
+            ) % (values_sql, MAX_CATEGORIES + 1)
+            rows = [[] for column_value in column_values]
+            for row in execute_group_values_sql(cur, counts_sql):
+                rows[row[0]].append(row[1:])
+            batch_results = [
+                get_category_json(
+                    group_rows,
+                    column_name,
+                    column_type,
+                    group_by,
+                    column_value,
+                    where_description,
+                    computed_columns,
+                )
+                for column_value, group_rows in zip(column_values, rows)
+            ]
+
+        else:  # description
+            count_sql = (
+                "SELECT cell_group, COUNT(*), MIN(IFNULL(CAST(value AS TEXT), 'None')) "
+                + "FROM (%s) GROUP BY cell_group"
+            ) % values_sql
+            counts = [(0, None) for column_value in column_values]
+            for cell_group, count, first_value in execute_group_values_sql(
+                cur, count_sql
+            ):
+                counts[cell_group] = (count, first_value)
+            batch_results = [
+                get_description_json(count, first_value, column_type)
+                for (count, first_value) in counts
+            ]
 
-            if length == 0:
-                results_json = {
-                    "type": "verbatim",
-                    "value": plural(length, "value"),
-                    "columnType": column_type,
-                }
-            elif length == 1:
-                results_json = {
-                    "type": "verbatim",
-                    "value": values[0],
-                    "columnType": column_type,
-                }
-            elif ulength == 1:
-                results_json = {
-                    "type": "verbatim",
-                    "value": "%s (%s of them)" % (values[0], length),
-                    "columnType": column_type,
-                }
-            elif ulength > MAX_CATEGORIES:
-                if length == ulength:
-                    results_json = {
-                        "type": "verbatim",
-                        "value": plural(length, "unique value"),
-                        "columnType": column_type,
-                    }
-                else:
-                    results_json = {
-                        "type": "verbatim",
-                        "value": (
-                            plural(length, "value")
-                            + ", "
-                            + ("%s %s" % (ulength, "unique"))
-                        ),
-                        "columnType": column_type,
-                    }
-            else:
-                counts = {
-                    key: value
-                    for (key, value) in sorted(counts.items(), key=lambda item: item[1])
-                }
-                # values: {"Animal": 37, "Plant": 12}
-                results_json = {
-                    "type": "category",
-                    "values": counts,
-                    "column": column_name,
-                    "columnType": column_type,
-                    "groupBy": group_by,
-                    "groupByValue": column_value,
-                    "whereDescription": where_description,
-                    "computedColumns": computed_columns,
-                }
+        for column_value, results_json in zip(column_values, batch_results):
+            for index in batch[column_value]:
+                results[index] = results_json
 
-    return results_json
+    return results
 
 
 def select_asset_group_thumbnail(
@@ -1356,25 +1953,9 @@ def select_asset_group(
     conn = get_database_connection(dgid)
     cur = conn.cursor()
 
-    unify_computed_columns(computed_columns)
-    metadata = get_metadata(conn)
-    columns = list(metadata.keys())
-    select_expr_as = [get_field_name(column, metadata) for column in columns]
-    databases = ["datagrid"]
-
-    if computed_columns or where_expr:
-        where_sql = update_state(
-            computed_columns,
-            metadata,
-            databases,
-            columns,
-            select_expr_as,
-            where_expr,
-        )
-        if where_sql:
-            where = where_sql
-
-    where = where if where else "1"
+    plan = get_query_plan(conn, dgid, computed_columns, where_expr)
+    metadata, columns, select_expr_as, databases = plan.unpack()
+    where = plan.where_sql or where or "1"
 
     column_types = [metadata[key]["type"] for key in columns]
     group_by_field_name = get_field_name(group_by, metadata)
@@ -1383,6 +1964,9 @@ def select_asset_group(
     field_expr = get_field_expr(column_name, metadata)
 
     column_value = get_column_value(column_value, group_by, metadata)
+    select_expr_as, databases = plan.project(
+        where, field_name, field_expr, group_by_field_expr
+    )
 
     try:
         rows = get_group_by_rows(
@@ -1402,15 +1986,13 @@ def select_asset_group(
         raise Exception(str(exc))
 
     env = {
-        "group_by_field_name": group_by_field_name,
         "field_name": field_name,
-        "column_value": get_column_value(column_value, group_by, metadata),
-        "where": where,
+        "where": push_down_group_predicate(where, group_by_field_expr, [column_value]),
         "databases": ", ".join(databases),
         "select_expr_as": ", ".join(select_expr_as),
     }
     # These are assetIds (strings):
-    select_sql = "SELECT value FROM (SELECT {select_expr_as}, COUNT({field_name}) as value FROM {databases} WHERE {where} GROUP BY {group_by_field_name}) WHERE {group_by_field_name} is {column_value};"
+    select_sql = "SELECT COUNT({field_name}) as value, {select_expr_as} FROM {databases} WHERE {where};"
     selection_sql = select_sql.format(**env)
     LOGGER.debug("SQL %s", selection_sql)
     start_time = time.time()
@@ -1464,25 +2046,9 @@ def select_asset_group_metadata(
     conn = get_database_connection(dgid)
     cur = conn.cursor()
 
-    unify_computed_columns(computed_columns)
-    metadata = get_metadata(conn)
-    columns = list(metadata.keys())
-    select_expr_as = [get_field_name(column, metadata) for column in columns]
-    databases = ["datagrid"]
-
-    if computed_columns or where_expr:
-        where_sql = update_state(
-            computed_columns,
-            metadata,
-            databases,
-            columns,
-            select_expr_as,
-            where_expr,
-        )
-        if where_sql:
-            where = where_sql
-
-    where = where if where else "1"
+    plan = get_query_plan(conn, dgid, computed_columns, where_expr)
+    metadata, columns, select_expr_as, databases = plan.unpack()
+    where = plan.where_sql or where or "1"
 
     group_by_field_name = get_field_name(group_by, metadata)
     group_by_field_expr = get_field_expr(group_by, metadata)
@@ -1490,6 +2056,9 @@ def select_asset_group_metadata(
     field_expr = get_field_expr(column_name, metadata)
 
     column_value = get_column_value(column_value, group_by, metadata)
+    select_expr_as, databases = plan.project(
+        where, field_name, field_expr, group_by_field_expr
+    )
 
     try:
         rows = get_group_by_rows(
@@ -1611,46 +2180,34 @@ def verify_where(
     conn = get_database_connection(dgid)
     cur = conn.cursor()
 
-    unify_computed_columns(computed_columns)
-    metadata = get_metadata(conn)
-    columns = list(metadata.keys())
-    select_expr_as = [get_field_name(column, metadata) for column in columns]
-    databases = ["datagrid"]
-    where = None
-
     # FIXME:
     # Add the where_expr as a computed column, and return that
     # too in order to give some auto-completion hints
 
     # Expand to include computed columns
-    if computed_columns or where_expr:
-        try:
-            where_sql = update_state(
-                computed_columns,
-                metadata,
-                databases,
-                columns,
-                select_expr_as,
-                where_expr,
-            )
-            if where_sql:
-                where = where_sql
-        except Exception as exc:
-            return {
-                "valid": False,
-                "message": repr(exc),
-            }
-
-    where = where if where else "1"
+    try:
+        plan = get_query_plan(conn, dgid, computed_columns, where_expr)
+    except Exception as exc:
+        return {
+            "valid": False,
+            "message": repr(exc),
+        }
 
-    env = {
-        "where": where,
-        "select_expr_as": ", ".join(select_expr_as),
-        "databases": ", ".join(databases),
-    }
-    select_sql = "SELECT {select_expr_as} FROM {databases} WHERE {where} LIMIT 1;"
+    key = ("verify",)
+    selection_sql = plan.sql.get(key)
+    if selection_sql is None:
+        # The computed columns are selected so that they are checked too:
+        select_expr_as, databases = plan.project(
+            *[column["field_name"] for column in plan.computed_metadata.values()]
+        )
+        env = {
+            "where": plan.where_sql or "1",
+            "select_expr_as": ", ".join(select_expr_as),
+            "databases": ", ".join(databases),
+        }
+        select_sql = "SELECT {select_expr_as} FROM {databases} WHERE {where} LIMIT 1;"
+        selection_sql = plan.sql[key] = select_sql.format(**env)
 
-    selection_sql = select_sql.format(**env)
     LOGGER.debug("SQL %s", selection_sql)
 
     try:
@@ -1676,6 +2233,7 @@ def query_sql(
     offset=0,
     debug=False,
     select_columns=None,
+    cursor=None,
 ):
     dgid = datagrid.filename
     if select_columns is None:
@@ -1709,10 +2267,64 @@ def query_sql(
             computed_columns=computed_columns,
             where_expr=where_expr,
             debug=debug,
+            cursor=cursor,
         )
+        if cursor is not None:
+            return results["rows"], results.get("cursor")
         return results["rows"]
 
 
+def get_result_set(cur, dgid, plan, computed_columns, sort_by_field_name, sort_desc):
+    """
+    Get the rowids of the rows matching the plan's where, in sorted
+    order, as a numpy array.
+
+    The result set is computed once per version of the datagrid,
+    so that paging through (and counting) a filtered datagrid
+    doesn't evaluate the where expression each time.
+
+    Args:
+        cur: a cursor on the datagrid
+        dgid: the datagrid id
+        plan: the QueryPlan
+        computed_columns: the plan's computed columns
+        sort_by_field_name: the field_name to sort on
+        sort_desc: "ASC" or "DESC"
+    """
+    db_path = get_dg_path(dgid)
+    version = get_datagrid_version(db_path)
+    where = plan.where_sql or "1"
+    computed_key = json.dumps(computed_columns, sort_keys=True)
+    key = (db_path, where, computed_key, sort_by_field_name, sort_desc)
+
+    def compute():
+        select_expr_as, databases = plan.project(sort_by_field_name)
+        env = {
+            "where": where,
+            "sort_by_field_name": sort_by_field_name,
+            "sort_desc": sort_desc,
+            "select_expr_as": ", ".join(select_expr_as),
+            "databases": ", ".join(databases),
+        }
+        select_sql = "SELECT result_rowid FROM (SELECT datagrid.rowid AS result_rowid, {select_expr_as} FROM {databases} WHERE {where}) ORDER BY {sort_by_field_name} {sort_desc}, result_rowid;"
+        selection_sql = select_sql.format(**env)
+        LOGGER.debug("SQL %s", selection_sql)
+        start_time = time.time()
+        try:
+            cur.execute(selection_sql)
+        except sqlite3.OperationalError as exc:
+            LOGGER.error("SQL: %s; %s", selection_sql, exc)
+            raise Exception(str(exc))
+        rowids = np.fromiter((row[0] for row in cur), dtype=np.int64)
+        LOGGER.debug("SQL %s seconds", time.time() - start_time)
+        RESULT_COUNT_CACHE.put(
+            (db_path, where, computed_key), version, len(rowids), dgid=db_path
+        )
+        return rowids
+
+    return RESULT_SET_CACHE.get(key, version, compute, dgid=db_path)
+
+
 def select_query_count(
     dgid,
     group_by,
@@ -1722,39 +2334,40 @@ def select_query_count(
     conn = get_database_connection(dgid)
     cur = conn.cursor()
 
-    unify_computed_columns(computed_columns)
-    metadata = get_metadata(conn)
-    columns = list(metadata.keys())
-    select_expr_as = [get_field_name(column, metadata) for column in columns]
-    databases = ["datagrid"]
-    where = None
-
-    if computed_columns or where_expr:
-        where_sql = update_state(
-            computed_columns,
-            metadata,
-            databases,
-            columns,
-            select_expr_as,
-            where_expr,
+    plan = get_query_plan(conn, dgid, computed_columns, where_expr)
+
+    if plan.where_sql and not group_by:
+        # Count the matching rows once, and share the result
+        # set with select_query_page():
+        db_path = get_dg_path(dgid)
+        return RESULT_COUNT_CACHE.get(
+            (db_path, plan.where_sql, json.dumps(computed_columns, sort_keys=True)),
+            get_datagrid_version(db_path),
+            lambda: len(
+                get_result_set(cur, dgid, plan, computed_columns, "column_0", "ASC")
+            ),
+            dgid=db_path,
         )
-        if where_sql:
-            where = where_sql
 
-    where = where if where else "1"
+    key = ("count", group_by)
+    selection_sql = plan.sql.get(key)
+    if selection_sql is None:
+        metadata, columns, select_expr_as, databases = plan.unpack()
+        group_by_field_name = get_field_name(group_by, metadata) if group_by else None
+        select_expr_as, databases = plan.project(group_by_field_name)
+        env = {
+            "where": plan.where_sql or "1",
+            "select_expr_as": ", ".join(select_expr_as),
+            "databases": ", ".join(databases),
+        }
 
-    env = {
-        "where": where,
-        "select_expr_as": ", ".join(select_expr_as),
-        "databases": ", ".join(databases),
-    }
+        if group_by:
+            env["group_by_field_name"] = group_by_field_name
+            total_sql = "SELECT COUNT() from (SELECT {select_expr_as} FROM {databases} GROUP BY {group_by_field_name});"
+        else:
+            total_sql = "SELECT COUNT() FROM (SELECT {select_expr_as} FROM {databases} WHERE {where});"
+        selection_sql = plan.sql[key] = total_sql.format(**env)
 
-    if group_by:
-        env["group_by_field_name"] = get_field_name(group_by, metadata)
-        total_sql = "SELECT COUNT() from (SELECT {select_expr_as} FROM {databases} GROUP BY {group_by_field_name});"
-    else:
-        total_sql = "SELECT COUNT() FROM (SELECT {select_expr_as} FROM {databases} WHERE {where});"
-    selection_sql = total_sql.format(**env)
     LOGGER.debug("SQL %s", selection_sql)
     start_time = time.time()
     total_rows = cur.execute(selection_sql).fetchone()[0]
@@ -1795,6 +2408,49 @@ def select_query(
     return result
 
 
+def make_cursor(sort_by_field_name, sort_desc, sort_key, rowid):
+    """
+    Make an (opaque) cursor for keyset pagination, pointing
+    at the row with sort_key and rowid.
+    """
+    data = {"sort": sort_by_field_name, "desc": sort_desc, "key": sort_key, "rowid": rowid}
+    return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii")
+
+
+def get_keyset_where(cursor, sort_by_field_name, sort_desc, limit):
+    """
+    Get the where clause (with a {sort_by_field_name} placeholder)
+    and its parameters, for the page of rows after cursor.
+
+    Rows are ordered by the sort key, then by rowid. NULL sort keys
+    come first in ascending order, and last in descending order.
+    """
+    if not cursor:
+        return "1", (limit,)
+
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        sort_key, rowid = data["key"], data["rowid"]
+        valid = data["sort"] == sort_by_field_name and data["desc"] == sort_desc
+    except Exception:
+        valid = False
+    if not valid:
+        raise ValueError("Invalid cursor: %r" % cursor)
+
+    if sort_key is None:
+        if sort_desc == "DESC":
+            keyset_sql = "({sort_by_field_name} IS NULL AND page_rowid > ?)"
+        else:
+            keyset_sql = "(({sort_by_field_name} IS NULL AND page_rowid > ?) OR {sort_by_field_name} IS NOT NULL)"
+        return keyset_sql, (rowid, limit)
+
+    if sort_desc == "DESC":
+        keyset_sql = "({sort_by_field_name} < ? OR ({sort_by_field_name} = ? AND page_rowid > ?) OR {sort_by_field_name} IS NULL)"
+    else:
+        keyset_sql = "({sort_by_field_name} > ? OR ({sort_by_field_name} = ? AND page_rowid > ?))"
+    return keyset_sql, (sort_key, sort_key, rowid, limit)
+
+
 def select_query_page(
     dgid,
     offset,
@@ -1808,34 +2464,34 @@ def select_query_page(
     where_expr=None,
     debug=False,
     timestamp=None,
+    cursor=None,
 ):
+    """
+    Select a page of rows.
+
+    With cursor (keyset pagination), the page starts after the row
+    that the cursor points to, rather than at offset, and the result
+    includes the "cursor" of the next page (None when there are no
+    more rows). Use "" as the cursor of the first page. A cursor
+    can't be used with group_by, or without a limit.
+    """
+    if cursor is not None and group_by:
+        raise ValueError("A cursor can't be used with group_by; use offset")
+    if cursor is not None and not limit:
+        raise ValueError("A cursor requires a limit")
+
     sort_desc = "DESC" if sort_desc else "ASC"
     conn = get_database_connection(dgid)
     cur = conn.cursor()
 
-    unify_computed_columns(computed_columns)
-    metadata = get_metadata(conn)
-    columns = list(metadata.keys())
-    select_expr_as = [get_field_name(column, metadata) for column in columns]
-    databases = ["datagrid"]
+    plan = get_query_plan(conn, dgid, computed_columns, where_expr)
+    metadata, columns, select_expr_as, databases = plan.unpack()
 
     # NOTE: use Image.attr to get metadata
 
-    # Expand to include computed columns
-    if computed_columns or where_expr:
-        where_sql = update_state(
-            computed_columns,
-            metadata,
-            databases,
-            columns,
-            select_expr_as,
-            where_expr,
-        )
-        if where_sql:
-            where = where_sql
-
-    where = where if where else "1"
-    limit = ("LIMIT %s OFFSET %s" % (limit, offset)) if limit is not None else ""
+    where = plan.where_sql or where or "1"
+    params = (limit, offset) if limit is not None else ()
+    limit = "LIMIT ? OFFSET ?" if limit is not None else ""
 
     # Metadata now has computed_columns:
     if select_columns is None:
@@ -1855,41 +2511,99 @@ def select_query_page(
             select_fields.append(get_field_name(group_by, metadata))
             remove_columns.append(group_by)
 
-        group_by_field_name = get_field_name(group_by, metadata)
-        env = {
-            "limit": limit,
-            "group_by_field_name": group_by_field_name,
-            "sort_by_field_name": sort_by_field_name,
-            "where": where,
-            "sort_desc": sort_desc,
-            "select_expr_as": ", ".join(select_expr_as),
-            "select_fields": ", ".join(select_fields),
-            "databases": ", ".join(databases),
-        }
-        select_sql = "SELECT {select_expr_as} FROM {databases} WHERE {where} GROUP BY {group_by_field_name} ORDER BY {sort_by_field_name} {sort_desc} {limit}"
-    else:
-        env = {
-            "limit": limit,
-            "sort_by_field_name": sort_by_field_name,
-            "where": where,
-            "sort_desc": sort_desc,
-            "select_expr_as": ", ".join(select_expr_as),
-            "select_fields": ", ".join(select_fields),
-            "databases": ", ".join(databases),
-        }
-        select_sql = "SELECT {select_expr_as} FROM {databases} WHERE {where} ORDER BY {sort_by_field_name} {sort_desc} {limit}"
+    INDEX_ADVISOR.record(
+        get_dg_path(dgid),
+        metadata,
+        [sort_by_field_name, get_field_name(group_by, metadata)]
+        + re.findall(r"\bcolumn_\d+\b", where),
+    )
+
+    use_cursor = cursor is not None
+    if use_cursor:
+        page_size = params[0]
+        keyset_sql, params = get_keyset_where(
+            cursor, sort_by_field_name, sort_desc, page_size
+        )
+
+    # Filtered pages come from a materialized result set; unfiltered
+    # (sorted) pages are cheaper with ORDER BY ... LIMIT/OFFSET:
+    use_result_set = not use_cursor and not group_by and limit and plan.where_sql
+    if use_result_set:
+        rowids = get_result_set(
+            cur, dgid, plan, computed_columns, sort_by_field_name, sort_desc
+        )
+        page_rowids = rowids[params[1] : params[1] + params[0]]
+        params = (json.dumps(page_rowids.tolist()),)
+
+    key = (
+        "page",
+        where,
+        group_by,
+        sort_by_field_name,
+        sort_desc,
+        tuple(select_columns),
+        limit,
+        use_result_set,
+        keyset_sql if use_cursor else None,
+    )
+    selection_sql = plan.sql.get(key)
+    if selection_sql is None:
+        if use_cursor:
+            env = {
+                "keyset": keyset_sql.format(sort_by_field_name=sort_by_field_name),
+                "sort_by_field_name": sort_by_field_name,
+                "where": where,
+                "sort_desc": sort_desc,
+                "select_expr_as": ", ".join(select_expr_as),
+                "select_fields": ", ".join(select_fields),
+                "databases": ", ".join(databases),
+            }
+            # The sort key and rowid of each row are added, for the next cursor:
+            select_sql = "SELECT {select_fields}, {sort_by_field_name}, page_rowid FROM (SELECT {select_expr_as}, datagrid.rowid AS page_rowid FROM {databases} WHERE {where}) WHERE {keyset} ORDER BY {sort_by_field_name} {sort_desc}, page_rowid LIMIT ?"
+        elif use_result_set:
+            env = {
+                "select_expr_as": ", ".join(select_expr_as),
+                "select_fields": ", ".join(select_fields),
+                "databases": ", ".join(databases),
+            }
+            select_sql = "SELECT {select_expr_as} FROM {databases}, json_each(?) AS result_page WHERE datagrid.rowid = result_page.value ORDER BY result_page.key"
+        elif group_by:
+            group_by_field_name = get_field_name(group_by, metadata)
+            env = {
+                "limit": limit,
+                "group_by_field_name": group_by_field_name,
+                "sort_by_field_name": sort_by_field_name,
+                "where": where,
+                "sort_desc": sort_desc,
+                "select_expr_as": ", ".join(select_expr_as),
+                "select_fields": ", ".join(select_fields),
+                "databases": ", ".join(databases),
+            }
+            select_sql = "SELECT {select_expr_as} FROM {databases} WHERE {where} GROUP BY {group_by_field_name} ORDER BY {sort_by_field_name} {sort_desc} {limit}"
+        else:
+            env = {
+                "limit": limit,
+                "sort_by_field_name": sort_by_field_name,
+                "where": where,
+                "sort_desc": sort_desc,
+                "select_expr_as": ", ".join(select_expr_as),
+                "select_fields": ", ".join(select_fields),
+                "databases": ", ".join(databases),
+            }
+            select_sql = "SELECT {select_expr_as} FROM {databases} WHERE {where} ORDER BY {sort_by_field_name} {sort_desc} {limit}"
+
+        if len(select_columns) != len(columns) and not use_cursor:
+            select_sql = "SELECT {select_fields} FROM (%s);" % select_sql
+        else:
+            select_sql = "%s;" % select_sql
+        selection_sql = plan.sql[key] = select_sql.format(**env)
 
-    if len(select_columns) != len(columns):
-        select_sql = "SELECT {select_fields} FROM (%s);" % select_sql
-    else:
-        select_sql = "%s;" % select_sql
-    selection_sql = select_sql.format(**env)
     if debug:
         print(selection_sql)
     LOGGER.debug("SQL %s", selection_sql)
     start_time = time.time()
     try:
-        cur.execute(selection_sql)
+        cur.execute(selection_sql, params)
     except sqlite3.OperationalError as exc:
         LOGGER.error("SQL: %s; %s", selection_sql, exc)
         raise Exception(str(exc))
@@ -1897,6 +2611,15 @@ def select_query_page(
     LOGGER.debug("SQL %s seconds", time.time() - start_time)
     rows = cur.fetchall()
 
+    if use_cursor:
+        if len(rows) == page_size:
+            next_cursor = make_cursor(
+                sort_by_field_name, sort_desc, rows[-1][-2], rows[-1][-1]
+            )
+        else:
+            next_cursor = None
+        rows = [row[:-2] for row in rows]
+
     if group_by:
         group_by_field_name = get_field_name(group_by, metadata)
         # Add cell messages for groups and assets:
@@ -1984,7 +2707,7 @@ def select_query_page(
     for column in remove_columns:
         select_columns.remove(column)
 
-    return {
+    results = {
         "columns": select_columns,
         "columnTypes": [
             get_column_type(select_column, metadata) for select_column in select_columns
@@ -1993,6 +2716,9 @@ def select_query_page(
         "ncols": len(select_columns),
         "rows": rows,
     }
+    if use_cursor:
+        results["cursor"] = next_cursor
+    return results
 
 
 def select_query_raw(
@@ -2107,7 +2833,7 @@ def get_fields(dgid, metadata=None, computed_columns=None):
     # NOTE: metadata does not contain computed_columns yet
     if metadata is None:
         conn = get_database_connection(dgid)
-        metadata = get_metadata(conn)
+        metadata = get_metadata(conn, dgid)
 
     # Used to evaluate computed columns
     unify_computed_columns(computed_columns)
@@ -2345,7 +3071,7 @@ def select_projection_data(
     conn = get_database_connection(dgid)
     cur = conn.cursor()
     unify_computed_columns(computed_columns)
-    metadata = get_metadata(conn)
+    metadata = get_metadata(conn, dgid)
     column_limit = None
     column_offset = 0
 
@@ -2363,7 +3089,8 @@ def select_projection_data(
             group_by,
             where_expr,
         )
-        if not PROJECTION_TRACE_CACHE.contains(key):
+        cached_traces = PROJECTION_TRACE_CACHE.get(key, None)
+        if cached_traces is None:
             rows = select_query_raw(
                 cur,
                 metadata,
@@ -2386,9 +3113,10 @@ def select_projection_data(
                 default_color,
                 "lightgray",
             )
-            PROJECTION_TRACE_CACHE.put(key, traces)
+            PROJECTION_TRACE_CACHE.put(key, traces, dgid=get_dg_path(dgid))
+            cached_traces = traces
         # Traces contains projection data; make copy:
-        traces = PROJECTION_TRACE_CACHE.get(key)[:]
+        traces = cached_traces[:]
 
         # Next, add the selected asset:
         asset_data_raw = select_asset(dgid, asset_id)
@@ -2425,7 +3153,8 @@ def select_projection_data(
             group_by,
             where_expr,
         )
-        if not PROJECTION_TRACE_CACHE.contains(key):
+        cached_traces = PROJECTION_TRACE_CACHE.get(key, None)
+        if cached_traces is None:
             rows = select_group_by_rows(
                 column_name,
                 column_value,
@@ -2451,9 +3180,10 @@ def select_projection_data(
                         default_color,
                         None,
                     )
-            PROJECTION_TRACE_CACHE.put(key, traces)
+            PROJECTION_TRACE_CACHE.put(key, traces, dgid=get_dg_path(dgid))
+            cached_traces = traces
         # Traces contains projection data; make copy:
-        traces = PROJECTION_TRACE_CACHE.get(key)[:]
+        traces = cached_traces[:]
     return traces
 
 
@@ -2464,40 +3194,50 @@ def select_asset(dgid, asset_id, thumbnail=False, return_image=False):
         "SELECT asset_data, asset_type, asset_thumbnail, "
         + 'json_extract(asset_metadata, "$.remote") as asset_remote, '
         + 'json_extract(asset_metadata, "$.annotations") as asset_annotations '
-        + 'from assets where asset_id = "{asset_id}";'
+        + "from assets where asset_id = ?;"
     )
-    env = {"asset_id": asset_id}
-    selection_sql = selection.format(**env)
-    LOGGER.debug("SQL %s", selection_sql)
+    LOGGER.debug("SQL %s", selection)
     start_time = time.time()
-    row = cur.execute(selection_sql).fetchone()
+    row = cur.execute(selection, (asset_id,)).fetchone()
     LOGGER.debug("SQL %s seconds", time.time() - start_time)
 
     if row:
         asset_data, asset_type, asset_thumbnail, asset_remote, asset_annotations = row
+        thumbnail = thumbnail and asset_type in ["Image", "PointCloud"]
+        if thumbnail:
+            # Use a thumbnail made previously, if there is one:
+            thumbnail_data = _get_saved_thumbnail(
+                dgid, asset_id, asset_data, asset_thumbnail, asset_annotations
+            )
+            if thumbnail_data is not None:
+                return generate_image(thumbnail_data) if return_image else thumbnail_data
+
         if asset_remote:
             # FIXME: asset_type == ["Image"]
             # FIXME: move to Image class
             # FIXME: use a cache?
             remote = json.loads(asset_remote)
             experiment_key = remote["experimentId"]
-            asset_id = remote["assetId"]
+            remote_asset_id = remote["assetId"]
             if remote["framework"] == "comet":
                 import comet_ml
                 api = comet_ml.API()
                 asset_data = api._client.get_experiment_asset(
-                    asset_id=asset_id,
+                    asset_id=remote_asset_id,
                     experiment_key=experiment_key,
                     return_type="binary",
                 )
             else:
                 raise Exception("Unknown remote type")
 
-        if thumbnail and asset_type in ["Image", "PointCloud"]:
-            if asset_annotations:
-                asset_annotations = json.loads(asset_annotations)
+        if thumbnail:
             thumbnail_data, thumbnail_image = generate_thumbnail(
-                asset_data, annotations=asset_annotations, return_image=True
+                asset_data,
+                annotations=json.loads(asset_annotations) if asset_annotations else None,
+                return_image=True,
+            )
+            save_thumbnail(
+                get_dg_path(dgid), asset_id, asset_annotations, thumbnail_data
             )
             if return_image:
                 return thumbnail_image
@@ -2509,15 +3249,27 @@ def select_asset(dgid, asset_id, thumbnail=False, return_image=False):
     return None
 
 
+def _get_saved_thumbnail(dgid, asset_id, asset_data, asset_thumbnail, asset_annotations):
+    """
+    Get the thumbnail bytes stored in the datagrid, or in the
+    thumbnail cache, or None if one hasn't been made yet.
+    """
+    if asset_thumbnail == "":
+        # Use the original, unless there is something to draw on it:
+        if asset_data is not None and not asset_annotations:
+            return asset_data
+    elif asset_thumbnail is not None:
+        return asset_thumbnail
+    return get_sidecar_thumbnail(get_dg_path(dgid), asset_id, asset_annotations)
+
+
 def select_asset_metadata(dgid, asset_id):
     conn = get_database_connection(dgid)
     cur = conn.cursor()
-    selection = 'SELECT asset_metadata from assets where asset_id = "{asset_id}";'
-    env = {"asset_id": asset_id}
-    selection_sql = selection.format(**env)
-    LOGGER.debug("SQL %s", selection_sql)
+    selection = "SELECT asset_metadata from assets where asset_id = ?;"
+    LOGGER.debug("SQL %s", selection)
     start_time = time.time()
-    row = cur.execute(selection_sql).fetchone()
+    row = cur.execute(selection, (asset_id,)).fetchone()
     LOGGER.debug("SQL %s seconds", time.time() - start_time)
     if row:
         return row[0]
@@ -2679,8 +3431,7 @@ STDOUT = printed
 
 
 def get_about(url, dgid):
-    db_path = get_dg_path(dgid)
-    conn = sqlite3.connect(db_path)
+    conn = get_database_connection(dgid)
 
     try:
         about_text = conn.execute(
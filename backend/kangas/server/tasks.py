@@ -29,6 +29,7 @@ from .queries import (
     select_asset_group_thumbnail,
     select_asset_metadata,
     select_category,
+    select_cells,
     select_histogram,
     select_projection_data,
 )
@@ -335,3 +336,31 @@ def select_category_task(
     except Exception as e:
         kwargs = get_retry_kwargs(e)
         raise self.retry(exc=e, **kwargs)
+
+
+@app.task(bind=True)
+def select_cells_task(
+    self,
+    dgid,
+    group_by,
+    where,
+    cells,
+    where_description,
+    computed_columns,
+    where_expr,
+):
+    try:
+        result = select_cells(
+            dgid,
+            group_by,
+            where,
+            cells,
+            where_description,
+            computed_columns,
+            where_expr,
+        )
+        return result
+
+    except Exception as e:
+        kwargs = get_retry_kwargs(e)
+        raise self.retry(exc=e, **kwargs)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+
+from .connections import get_file_signature, is_writable, note_internal_write
+
+LOGGER = logging.getLogger(__name__)
+KANGAS_THUMBNAIL_FOLDER = os.environ.get(
+    "KANGAS_THUMBNAIL_FOLDER", os.path.join(tempfile.gettempdir(), "kangas-thumbnails")
+)
+
+
+def get_annotations_hash(annotations):
+    """
+    Get a hash of the JSON annotations string (or None).
+    """
+    return hashlib.sha1((annotations or "").encode("utf-8")).hexdigest()
+
+
+def get_sidecar_path(db_path):
+    """
+    Get the path of the thumbnail cache file for a datagrid that
+    can't be written to.
+    """
+    key = hashlib.sha1(os.path.abspath(db_path).encode("utf-8")).hexdigest()
+    return os.path.join(KANGAS_THUMBNAIL_FOLDER, "%s.thumbnails" % key)
+
+
+def _connect_sidecar(sidecar_path):
+    conn = sqlite3.connect(sidecar_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS thumbnails (asset_id TEXT, annotations_hash TEXT, asset_thumbnail BLOB, PRIMARY KEY (asset_id, annotations_hash));"
+    )
+    return conn
+
+
+def get_sidecar_thumbnail(db_path, asset_id, annotations):
+    """
+    Get a thumbnail from the sidecar cache, or None.
+    """
+    sidecar_path = get_sidecar_path(db_path)
+    if not os.path.exists(sidecar_path):
+        return None
+
+    conn = sqlite3.connect(sidecar_path)
+    try:
+        row = conn.execute(
+            "SELECT asset_thumbnail FROM thumbnails WHERE asset_id = ? AND annotations_hash = ?;",
+            (asset_id, get_annotations_hash(annotations)),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def save_thumbnail(db_path, asset_id, annotations, thumbnail):
+    """
+    Save a generated thumbnail so that it is only made once.
+
+    The thumbnail is written to the datagrid's assets table when
+    possible; otherwise, it goes to a sidecar cache file keyed by
+    asset_id and annotations hash.
+    """
+    if is_writable(db_path):
+        signature_before = get_file_signature(db_path)
+        try:
+            conn = sqlite3.connect(db_path, timeout=1)
+            try:
+                cursor = conn.execute(
+                    "UPDATE assets SET asset_thumbnail = ? WHERE asset_id = ? AND asset_thumbnail IS NULL;",
+                    (thumbnail, asset_id),
+                )
+                conn.commit()
+            finally:
+                conn.close()
+            note_internal_write(db_path, signature_before)
+            # Else, the asset uses the original image ("") but has
+            # annotations to draw, so the thumbnail goes in the cache:
+            if cursor.rowcount > 0:
+                return
+        except sqlite3.OperationalError as exc:
+            LOGGER.debug("unable to save thumbnail to datagrid: %s", exc)
+
+    try:
+        os.makedirs(KANGAS_THUMBNAIL_FOLDER, exist_ok=True)
+        conn = _connect_sidecar(get_sidecar_path(db_path))
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO thumbnails (asset_id, annotations_hash, asset_thumbnail) VALUES (?, ?, ?);",
+                (asset_id, get_annotations_hash(annotations), thumbnail),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except (OSError, sqlite3.OperationalError) as exc:
+        LOGGER.debug("unable to save thumbnail to cache: %s", exc)
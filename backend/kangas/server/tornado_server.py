@@ -31,8 +31,14 @@ from tornado.web import RequestHandler
 
 from .._version import __version__
 from ..datatypes.utils import THUMBNAIL_SIZE
+from .indexes import INDEX_ADVISOR
 from .queries import (
+    CONNECTION_POOL,
     KANGAS_ROOT,
+    METADATA_CACHE,
+    PROJECTION_TRACE_CACHE,
+    QUERY_PLAN_CACHE,
+    RESULT_SET_CACHE,
     custom_output,
     generate_chart_image,
     get_about,
@@ -46,6 +52,7 @@ from .queries import (
     select_asset_group_thumbnail,
     select_asset_metadata,
     select_category,
+    select_cells,
     select_description,
     select_histogram,
     select_metadata,
@@ -324,6 +331,38 @@ class CategoryHandler(BaseHandler):
             self.write_json(result)
 
 
+class BatchCellsHandler(BaseHandler):
+    @run_on_executor
+    @auth_wrapper
+    def post(self):
+        # Required:
+        data = tornado.escape.json_decode(self.request.body)
+        dgid = self.unquote(data.get("dgid", None))
+        cells = data.get("cells", [])
+
+        # Optional selections:
+        group_by = data.get("groupBy", None)
+        where = data.get("where", None)
+        where_description = data.get("whereDescription", where)
+        computed_columns = data.get("computedColumns", None)
+        where_expr = data.get("whereExpr", None)
+        where_expr = where_expr.strip() if where_expr else None
+        for cell in cells:
+            cell["columnValue"] = get_column_value(cell.get("columnValue", None))
+
+        if self.ensure_datagrid_path(dgid):
+            results = select_cells(
+                dgid,
+                group_by,
+                where,
+                cells,
+                where_description,
+                computed_columns,
+                where_expr,
+            )
+            self.write_json({"cells": results})
+
+
 class AssetGroupHandler(BaseHandler):
     @run_on_executor
     @auth_wrapper
@@ -597,21 +636,28 @@ class QueryPageHandler(BaseHandler):
         computed_columns = data.get("computedColumns", None)
         where_expr = data.get("whereExpr", None)
         where_expr = where_expr.strip() if where_expr else None
+        cursor = data.get("cursor", None)
 
         if self.ensure_datagrid_path(dgid):
             LOGGER.debug("QueryPageHandler dgid: %s", dgid)
-            result = select_query_page(
-                dgid,
-                offset,
-                group_by,
-                sort_by,
-                sort_desc,
-                where,
-                limit,
-                select,
-                computed_columns,
-                where_expr,
-            )
+            try:
+                result = select_query_page(
+                    dgid,
+                    offset,
+                    group_by,
+                    sort_by,
+                    sort_desc,
+                    where,
+                    limit,
+                    select,
+                    computed_columns,
+                    where_expr,
+                    cursor=cursor,
+                )
+            except ValueError as exc:
+                self.set_status(400)
+                self.write_json({"message": str(exc)})
+                return
             self.write_json(result)
 
     @run_on_executor
@@ -632,21 +678,28 @@ class QueryPageHandler(BaseHandler):
         computed_columns = self.get_query_argument("computedColumns", None)
         where_expr = self.get_query_argument("whereExpr", None)
         where_expr = where_expr.strip() if where_expr else None
+        cursor = self.get_query_argument("cursor", None)
 
         if self.ensure_datagrid_path(dgid):
             LOGGER.debug("QueryPageHandler dgid: %s", dgid)
-            result = select_query_page(
-                dgid,
-                offset,
-                group_by,
-                sort_by,
-                sort_desc,
-                where,
-                limit,
-                select,
-                computed_columns,
-                where_expr,
-            )
+            try:
+                result = select_query_page(
+                    dgid,
+                    offset,
+                    group_by,
+                    sort_by,
+                    sort_desc,
+                    where,
+                    limit,
+                    select,
+                    computed_columns,
+                    where_expr,
+                    cursor=cursor,
+                )
+            except ValueError as exc:
+                self.set_status(400)
+                self.write_json({"message": str(exc)})
+                return
             self.write_json(result)
 
 
@@ -835,6 +888,12 @@ class StatusHandler(BaseHandler):
             "OS version": "%s %s %s"
             % (platform.system(), platform.release(), platform.version()),
             "OS details": "%s (%s)" % (sys.platform, platform.platform()),
+            "Open connections": CONNECTION_POOL.size(),
+            "Metadata cache": METADATA_CACHE.stats(),
+            "Query plan cache": QUERY_PLAN_CACHE.stats(),
+            "Result set cache": RESULT_SET_CACHE.stats(),
+            "Projection cache": PROJECTION_TRACE_CACHE.stats(),
+            "Index advisor": INDEX_ADVISOR.stats(),
         }
         self.write_json(result)
 
@@ -911,6 +970,7 @@ datagrid_handlers = [
     ("/datagrid/histogram", HistogramHandler),
     ("/datagrid/description", DescriptionHandler),
     ("/datagrid/category", CategoryHandler),
+    ("/datagrid/batch-cells", BatchCellsHandler),
     ("/datagrid/asset-group", AssetGroupHandler),
     ("/datagrid/asset-group-metadata", AssetGroupMetadataHandler),
     ("/datagrid/asset-group-thumbnail", AssetGroupThumbnailHandler),
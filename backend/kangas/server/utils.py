@@ -18,7 +18,10 @@ import pickle
 import re
 import subprocess
 import sys
+import threading
+import time
 import urllib
+from collections import ChainMap, OrderedDict
 
 try:
     import marko
@@ -291,32 +294,220 @@ def pickle_loads_embedding(ascii_string):
     return pickle_loads(safe, ascii_string)
 
 
+def get_size(value):
+    """
+    Estimate the number of bytes used by a value, including
+    the items of containers and the attributes of objects.
+    """
+    seen = set()
+    size = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        nbytes = getattr(item, "nbytes", None)
+        if isinstance(nbytes, int):
+            # numpy arrays
+            size += nbytes
+            continue
+        size += sys.getsizeof(item)
+        if isinstance(item, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        elif isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, ChainMap):
+            stack.extend(item.maps)
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+    return size
+
+
+_MISSING = object()
+
+
 class Cache:
     """
-    LRU Cache.
+    A thread-safe LRU cache, limited by number of items and
+    (estimated) bytes, with optional time-to-live.
+
+    Items can be tagged with a dgid when they are put, so that
+    everything cached about a datagrid can be dropped at once
+    with invalidate(dgid).
+
+    Args:
+        size: (int, optional) maximum number of items
+        max_bytes: (int, optional) maximum total size of the items,
+            as estimated by sizeof
+        ttl: (float, optional) seconds an item is kept after it is put
+        sizeof: (callable, optional) estimates the size of a value;
+            defaults to get_size()
 
     Note: Make sure you copy retrieved items to avoid
     changing it in cache.
     """
 
-    def __init__(self, size):
-        self.cache = {}
-        self.max_size = 100
+    def __init__(self, size=100, max_bytes=None, ttl=None, sizeof=get_size):
+        self.max_size = size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        # key -> (value, nbytes, expires, dgid)
+        self.cache = OrderedDict()
+        self.dgids = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+
+    def _remove(self, key):
+        value, nbytes, expires, dgid = self.cache.pop(key)
+        self.nbytes -= nbytes
+        if dgid is not None:
+            keys = self.dgids[dgid]
+            keys.discard(key)
+            if not keys:
+                del self.dgids[dgid]
+
+    def _lookup(self, key):
+        # Returns the entry, or None; drops expired entries
+        entry = self.cache.get(key)
+        if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+            self._remove(key)
+            self.evictions += 1
+            entry = None
+        return entry
 
     def contains(self, key):
-        return key in self.cache
-
-    def put(self, key, value):
-        # Check size:
-        if len(self.cache) >= self.max_size:
-            # too many
-            first_in_key = list(self.cache.keys())[0]
-            # del the first-in
-            del self.cache[first_in_key]
-        self.cache[key] = value
-
-    def get(self, key):
-        return self.cache[key]
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def put(self, key, value, dgid=None):
+        """
+        Add (or replace) an item, evicting the least-recently
+        used items if over the limits.
+
+        Args:
+            key: a hashable key
+            value: the value to cache
+            dgid: (str, optional) the datagrid the value belongs to
+        """
+        nbytes = self.sizeof(value) if self.max_bytes is not None else 0
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self.cache:
+                self._remove(key)
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                # Would evict everything else, and not fit anyway
+                self.evictions += 1
+                return
+            self.cache[key] = (value, nbytes, expires, dgid)
+            self.nbytes += nbytes
+            if dgid is not None:
+                self.dgids.setdefault(dgid, set()).add(key)
+            while (self.max_size is not None and len(self.cache) > self.max_size) or (
+                self.max_bytes is not None and self.nbytes > self.max_bytes
+            ):
+                self._remove(next(iter(self.cache)))
+                self.evictions += 1
+
+    def get(self, key, default=_MISSING, valid=None):
+        """
+        Get an item, marking it as recently used. Raises KeyError
+        if missing, unless a default is given.
+
+        Args:
+            key: a hashable key
+            default: (optional) returned if the item is missing
+            valid: (callable, optional) if given, an item for which
+                valid(item) is false counts as missing
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None or (valid is not None and not valid(entry[0])):
+                self.misses += 1
+                if default is _MISSING:
+                    raise KeyError(key)
+                return default
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def invalidate(self, dgid):
+        """
+        Remove all of the items put with this dgid.
+        """
+        with self._lock:
+            for key in list(self.dgids.get(dgid, [])):
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self.cache),
+                "bytes": self.nbytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+            self.dgids.clear()
+            self.nbytes = 0
+
+
+class VersionedCache:
+    """
+    A thread-safe cache of values that are valid only for a
+    particular version of their key, such as the (mtime, size)
+    signature of a datagrid file.
+
+    Args:
+        max_size: (int, optional) the maximum number of keys to
+            keep; the least-recently used are dropped first
+        max_bytes: (int, optional) the maximum total size of
+            the values
+        ttl: (float, optional) seconds a value is kept
+        sizeof: (callable, optional) estimates the size of a
+            (version, value) pair; defaults to get_size()
+
+    Note: values are shared between callers; don't change them.
+    """
+
+    def __init__(self, max_size=None, max_bytes=None, ttl=None, sizeof=get_size):
+        self.cache = Cache(max_size, max_bytes=max_bytes, ttl=ttl, sizeof=sizeof)
+
+    def get(self, key, version, compute, dgid=None):
+        """
+        Get the value for key at version, calling compute() to
+        create it if it is missing or out of date.
+        """
+        entry = self.cache.get(key, None, valid=lambda entry: entry[0] == version)
+        if entry is not None:
+            return entry[1]
+
+        value = compute()
+        self.cache.put(key, (version, value), dgid=dgid)
+        return value
+
+    def put(self, key, version, value, dgid=None):
+        """
+        Set the value for key at version.
+        """
+        self.cache.put(key, (version, value), dgid=dgid)
+
+    def invalidate(self, dgid):
+        self.cache.invalidate(dgid)
+
+    def stats(self):
+        return self.cache.stats()
 
     def clear(self):
         self.cache.clear()
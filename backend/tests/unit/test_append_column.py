@@ -35,3 +35,68 @@ def test_append_column_computed_column():
     dg.append_column("New Column", "{'A'} + {'B'} + {'ROW-ID'}")
     for row in range(3):
         assert dg[row][4] == 3 + row + 1
+
+
+def test_append_column_after_remove_rows():
+    dg = kg.DataGrid(columns=["A"])
+    dg.extend([[10], [20], [30], [40], [50]])
+    dg.save()
+    dg.remove_rows(2)
+    dg.append_column("B", ["a", "b", "c", "d"])
+    assert dg.conn.execute(
+        "SELECT column_0, column_1, column_2 FROM datagrid ORDER BY column_0;"
+    ).fetchall() == [(1, 10, "a"), (2, 30, "b"), (3, 40, "c"), (4, 50, "d")]
+
+
+def test_append_columns_metadata():
+    dg = make_datagrid()
+    dg.append_columns(
+        {
+            "Image": [
+                kg.Image([[i, 0], [0, 0]], metadata={"label": "image-%s" % i})
+                for i in range(3)
+            ],
+            "Score": [0.1, 0.2, 0.3],
+        }
+    )
+    schema = dg.get_schema()
+    assert schema["Image"]["type"] == "IMAGE-ASSET"
+    assert schema["Image--metadata"]["type"] == "JSON"
+    assert schema["Score"]["type"] == "FLOAT"
+    rows = dg.select(select_columns=["Image--metadata", "Score"], to_dicts=True)
+    assert [row["Image--metadata"]["label"] for row in rows] == [
+        "image-0",
+        "image-1",
+        "image-2",
+    ]
+    assert [row["Score"] for row in rows] == [0.1, 0.2, 0.3]
+
+
+def test_append_column_failure():
+    dg = make_datagrid()
+
+    def get_tables(dg):
+        return (
+            dg.conn.execute("PRAGMA table_info(datagrid);").fetchall(),
+            dg.conn.execute("SELECT * FROM datagrid;").fetchall(),
+            dg.conn.execute("SELECT name, field_name, type FROM metadata;").fetchall(),
+        )
+
+    before = get_tables(dg)
+    columns = dg.get_columns()
+    # Fail at the last step:
+    dg.conn.execute(
+        "CREATE TRIGGER fail BEFORE INSERT ON metadata BEGIN SELECT RAISE(ABORT, 'forced'); END;"
+    )
+    try:
+        dg.append_column("New Column", [5, 6, 7])
+    except Exception as exc:
+        assert "forced" in str(exc)
+    else:
+        assert False, "append_column() should have failed"
+    assert get_tables(dg) == before
+    assert dg.get_columns() == columns
+
+    dg.conn.execute("DROP TRIGGER fail;")
+    dg.append_column("New Column", [5, 6, 7])
+    assert [dg[row][4] for row in range(3)] == [5, 6, 7]
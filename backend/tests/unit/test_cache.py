@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+
+import threading
+import time
+
+import pytest
+from kangas.server.utils import Cache, VersionedCache, get_size
+
+
+def test_cache_lru():
+    cache = Cache(3)
+    for key in "abc":
+        cache.put(key, key.upper())
+    # Use "a", so "b" is the least-recently used:
+    assert cache.get("a") == "A"
+    cache.put("d", "D")
+    assert not cache.contains("b")
+    assert cache.contains("a") and cache.contains("d")
+    with pytest.raises(KeyError):
+        cache.get("b")
+    assert cache.get("b", None) is None
+    stats = cache.stats()
+    assert stats["size"] == 3
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_cache_max_bytes():
+    cache = Cache(None, max_bytes=10000)
+    for i in range(10):
+        cache.put(i, b"x" * 2000)
+    stats = cache.stats()
+    assert stats["bytes"] <= 10000
+    assert stats["size"] < 10
+    assert cache.contains(9)
+    # Too big to ever fit:
+    cache.put("big", b"x" * 20000)
+    assert not cache.contains("big")
+    assert cache.contains(9)
+
+
+def test_cache_ttl():
+    cache = Cache(10, ttl=0.05)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a", None) is None
+
+
+def test_cache_invalidate():
+    cache = VersionedCache(10)
+    cache.get("a", 1, lambda: "A", dgid="one.datagrid")
+    cache.get("b", 1, lambda: "B", dgid="two.datagrid")
+    cache.invalidate("one.datagrid")
+    assert cache.get("a", 1, lambda: "A2") == "A2"
+    assert cache.get("b", 1, lambda: "B2") == "B"
+    # New version replaces the old:
+    assert cache.get("b", 2, lambda: "B2") == "B2"
+    assert cache.stats()["size"] == 2
+
+
+def test_versioned_cache_stats():
+    cache = VersionedCache(2)
+    assert cache.get("a", 1, lambda: "A") == "A"
+    assert cache.get("b", 1, lambda: "B") == "B"
+    assert cache.get("a", 1, lambda: "A2") == "A"
+    # An old version is a miss, and doesn't count as a use:
+    assert cache.get("b", 2, lambda: "B2") == "B2"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+    # "a" was used last, so "b" goes:
+    cache.get("a", 1, lambda: "A2")
+    cache.get("c", 1, lambda: "C")
+    assert cache.cache.contains("a") and not cache.cache.contains("b")
+
+
+def test_cache_threads():
+    cache = Cache(50, max_bytes=100000)
+
+    def work(n):
+        for i in range(1000):
+            key = (n + i) % 100
+            if cache.get(key, None) is None:
+                cache.put(key, [key] * 10, dgid=key % 3)
+            if i % 100 == 0:
+                cache.invalidate(n % 3)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats["size"] <= 50
+    assert stats["bytes"] == sum(get_size([key] * 10) for key in cache.cache)
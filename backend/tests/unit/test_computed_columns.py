@@ -11,9 +11,20 @@
 #    All rights reserved                             #
 ######################################################
 
+import sqlite3
+
 from kangas import DataGrid, Image
-from kangas.server.computed_columns import eval_computed_columns, update_state
-from kangas.server.queries import select_query_count, select_query_page
+from kangas.server.computed_columns import (
+    JSON_FUNCTIONS,
+    eval_computed_columns,
+    json_function,
+    update_state,
+)
+from kangas.server.queries import (
+    add_python_functions,
+    select_query_count,
+    select_query_page,
+)
 
 from ..testlib import AlwaysEquals
 
@@ -249,14 +260,9 @@ def test_aggregate_where1():
 
     assert columns == list(computed_columns)
     assert metadata == computed_columns
-    assert databases == [
-        "(SELECT rowid, AVG(42) AS AVG_aggregate_column_11f6ad8ec52a2984abaafd7c3b516503785c2072 FROM datagrid)"
-    ]
+    assert databases == []
     assert select_expr_as == ["42 AS cc1"]
-    assert (
-        where_sql
-        == "cc1 < AVG_aggregate_column_11f6ad8ec52a2984abaafd7c3b516503785c2072"
-    )
+    assert where_sql == "cc1 < (SELECT AVG(42) FROM datagrid)"
 
     results = select_by_query(where_expr, computed_columns)
     expected_results = {
@@ -298,18 +304,10 @@ def test_aggregate_column():
     assert columns == ["A", "AVG A"]
     assert metadata == ccs(
         cc("A", None, "column_1"),
-        cc(
-            "AVG A",
-            "AVG_aggregate_column_86f7e437faa5a7fce15d1ddcb9eaeaea377667b8",
-            "cc1",
-        ),
+        cc("AVG A", "(SELECT AVG(column_1) FROM datagrid)", "cc1"),
     )
-    assert databases == [
-        "(SELECT rowid, AVG(column_1) AS AVG_aggregate_column_86f7e437faa5a7fce15d1ddcb9eaeaea377667b8 FROM datagrid)"
-    ]
-    assert select_expr_as == [
-        "AVG_aggregate_column_86f7e437faa5a7fce15d1ddcb9eaeaea377667b8 AS cc1"
-    ]
+    assert databases == []
+    assert select_expr_as == ["(SELECT AVG(column_1) FROM datagrid) AS cc1"]
     assert where_sql == "column_1 < cc1"
 
     results = select_by_query(where_expr, computed_columns)
@@ -516,3 +514,52 @@ def test_shortcut_boolean_logic():
 def test_boolean_logic():
     results = eval_computed_columns({}, "(1 < 4) and (4 < 2)")
     assert results[2] == "(1 < 4 and 4 < 2)"
+
+
+def test_json_functions():
+    conn = sqlite3.connect(":memory:")
+    add_python_functions(conn)
+    conn.execute("CREATE TABLE datagrid (column_1 TEXT);")
+    values = [
+        "[1, 2, 3]",
+        "[0, 0]",
+        "[]",
+        '["a", "", "b"]',
+        "[[1, 2], [3]]",
+        '{"a": 1, "b": 2}',
+        "['a', 'b']",
+        '[["a", true], [null, 1.5], [{"b": [2]}]]',
+        '{"é": true, "b": null, "c": {"d": [1, "x"]}}',
+        "hello",
+        "",
+        None,
+    ]
+    conn.executemany("INSERT INTO datagrid VALUES (?);", [(v,) for v in values])
+
+    def select(sql, value):
+        try:
+            return conn.execute(
+                "SELECT %s FROM datagrid WHERE column_1 IS ?" % sql, (value,)
+            ).fetchone()[0]
+        except sqlite3.OperationalError:
+            return "error"
+
+    for function_name in JSON_FUNCTIONS:
+        item = "'a'" if function_name == "IN_OBJ" else None
+        sql = json_function(function_name, "{'a'}", item).format(**{"'a'": "column_1"})
+        python_sql = (
+            "IN_OBJ('a', column_1)"
+            if function_name == "IN_OBJ"
+            else "%s(column_1)" % function_name
+        )
+        for value in values:
+            native = select(sql, value)
+            expected = select(python_sql, value)
+            if expected == "error":
+                continue
+            # The same text, not only the same values:
+            assert native == expected, (function_name, value)
+
+    # Only simple arguments use the JSON SQL:
+    assert json_function("LENGTH", "FLATTEN({'a'})") == "LENGTH(FLATTEN({'a'}))"
+    assert json_function("IN_OBJ", "{'a'}", "1").startswith("(CASE ")
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023 Kangas Development Team      #
+#    All rights reserved                             #
+######################################################
+
+import os
+import sqlite3
+import threading
+
+import pytest
+from kangas.server.connections import ConnectionPool
+
+
+def make_database(path, value):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS data (value INTEGER);")
+    conn.execute("DELETE FROM data;")
+    conn.execute("INSERT INTO data VALUES (?);", (value,))
+    conn.commit()
+    conn.close()
+
+
+def test_connection_reused_and_read_only(tmp_path):
+    path = str(tmp_path / "pool.datagrid")
+    make_database(path, 1)
+    pool = ConnectionPool(2)
+
+    conn = pool.get_connection(path)
+    assert pool.get_connection(path) is conn
+    assert conn.execute("SELECT value FROM data;").fetchone()[0] == 1
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("INSERT INTO data VALUES (2);")
+    pool.close_all()
+    assert pool.size() == 0
+
+
+def test_connection_invalidated_on_change(tmp_path):
+    path = str(tmp_path / "pool.datagrid")
+    make_database(path, 1)
+    pool = ConnectionPool(2)
+
+    conn = pool.get_connection(path)
+    make_database(path, 2)
+    os.utime(path, ns=(0, 0))
+    new_conn = pool.get_connection(path)
+    assert new_conn is not conn
+    assert new_conn.execute("SELECT value FROM data;").fetchone()[0] == 2
+    assert pool.size() == 1
+    pool.close_all()
+
+
+def test_connection_bounded_per_thread(tmp_path):
+    paths = [str(tmp_path / ("pool-%s.datagrid" % i)) for i in range(3)]
+    for path in paths:
+        make_database(path, 1)
+    pool = ConnectionPool(
+        2, setup=lambda conn: conn.create_function("ONE", 0, lambda: 1)
+    )
+
+    for path in paths:
+        assert pool.get_connection(path).execute("SELECT ONE();").fetchone()[0] == 1
+    assert pool.size() == 2
+
+    connections = []
+    thread = threading.Thread(
+        target=lambda: connections.append(pool.get_connection(paths[0]))
+    )
+    thread.start()
+    thread.join()
+    assert connections[0] is not pool.get_connection(paths[0])
+    pool.close_all()
@@ -12,12 +12,17 @@
 ######################################################
 
 import datetime
+import io
+import json
 import os
 import random
+import sqlite3
 
+import numpy as np
 import pytest
 
 from kangas import Audio, Curve, DataGrid, Image, Text, Video
+from kangas.datatypes.datagrid import create_column_index, get_numeric_aggregates
 from kangas.datatypes.utils import convert_string_to_date, convert_string_to_value
 from kangas.utils import make_column_name, sanitize_name
 
@@ -633,3 +638,254 @@ def test_datagrid_dicts_read():
         "TEXT",
     ]
     assert list(dg.to_dicts()) == data
+
+
+def test_datagrid_asset_index_upgrade():
+    dg = DataGrid(name="asset-index-1", columns=["Text"])
+    dg.append([Text("one")])
+    dg.append([Text("two")])
+    dg.save()
+    indexes = [
+        row[1] for row in dg.conn.execute("PRAGMA index_list('assets');").fetchall()
+    ]
+    assert "assets_asset_id" in indexes
+
+    # Simulate an older datagrid, with a duplicated asset:
+    dg.conn.execute("DROP INDEX assets_asset_id;")
+    dg.conn.execute("INSERT INTO assets SELECT * FROM assets LIMIT 1;")
+    dg.conn.commit()
+    dg.upgrade()
+    indexes = [
+        row[1] for row in dg.conn.execute("PRAGMA index_list('assets');").fetchall()
+    ]
+    assert "assets_asset_id" in indexes
+    assert dg.conn.execute("SELECT COUNT(*) FROM assets;").fetchone()[0] == 2
+    asset_ids = [row[0].asset_id for row in dg.select()]
+    assert [
+        dg.conn.execute(
+            "SELECT asset_data FROM assets WHERE asset_id = ?;", (asset_id,)
+        ).fetchone()[0]
+        for asset_id in asset_ids
+    ] == ["one", "two"]
+
+
+def test_datagrid_create_index():
+    dg = DataGrid(name="column-index-1", columns=["Name", "Score"])
+    dg.extend([["row-%s" % i, i / 10] for i in range(10)])
+    dg.save()
+    dg.create_index("Score")
+    assert dg.indexes == {"Score": "datagrid_column_2"}
+    plan = dg.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM datagrid ORDER BY column_2;"
+    ).fetchall()
+    assert "datagrid_column_2" in plan[0][3]
+
+    dg2 = DataGrid.read_datagrid(dg.filename)
+    assert dg2.indexes == {"Score": "datagrid_column_2"}
+    dg2.drop_index("Score")
+    assert DataGrid.read_datagrid(dg.filename).indexes == {}
+    with pytest.raises(Exception):
+        dg2.create_index("No such column")
+
+    # Indexed columns can be removed, with their indexes, including
+    # ones made by another connection (like the server's):
+    dg2.create_index("Score")
+    conn = sqlite3.connect(dg.filename)
+    create_column_index(conn, "Name", "column_1")
+    conn.commit()
+    conn.close()
+    dg2.remove_columns("Score", "Name")
+    assert dg2.get_columns() == []
+    dg3 = DataGrid.read_datagrid(dg.filename)
+    assert dg3.get_columns() == []
+    assert dg3.indexes == {}
+    assert (
+        dg3.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'datagrid_%';"
+        ).fetchall()
+        == []
+    )
+
+
+def test_datagrid_info(capsys):
+    dg = DataGrid(name="info-1", columns=["Score", "Name", "Labels"])
+    dg.extend([[1.5, "one", None], [None, "two", {"a": 1}], [3.5, None, None]])
+    dg.info()
+    in_memory = capsys.readouterr().out
+    dg.save()
+    capsys.readouterr()
+    dg.info()
+    saved = capsys.readouterr().out
+    dg.info(exact=True)
+    exact = capsys.readouterr().out
+    assert in_memory.replace("in memory", "on disk") == saved
+    assert "Size (bytes)" in exact
+    # Counts from the stats, and from the data:
+    counts = [line.split()[2] for line in saved.splitlines()[-3:]]
+    assert counts == ["2", "2", "1"]
+    assert [line.split()[2] for line in exact.splitlines()[-3:]] == counts
+
+
+def test_datagrid_extend_batches():
+    dg = DataGrid(name="batches-1", columns=["Name", "Score"])
+    dg.extend([["row-%s" % i, i / 10] for i in range(5)])
+    dg.save()
+    dg.extend([{"Name": "row-%s" % i} for i in range(5, 12)], batch_size=3)
+    assert dg.nrows == 12
+    assert dg.conn.execute(
+        "SELECT column_0, column_1, column_2 FROM datagrid WHERE column_0 > 10"
+    ).fetchall() == [(11, "row-10", None), (12, "row-11", None)]
+    # The bulk load is finished, and the datagrid is one file again:
+    assert dg.conn.execute("PRAGMA journal_mode;").fetchone()[0] == "delete"
+    assert not os.path.exists(dg.filename + "-wal")
+
+
+def test_datagrid_extend_workers():
+    import PIL.Image
+
+    def make_rows(start, stop):
+        return [
+            [i, PIL.Image.new("RGB", (20, 10), (i, 0, 0))] for i in range(start, stop)
+        ]
+
+    dg = DataGrid(name="workers-1", columns=["ID", "Image"])
+    dg.extend(make_rows(0, 3), workers=2)
+    dg.save(create_thumbnails=True, workers=2)
+    dg.extend(make_rows(3, 200), workers=3)
+    assert dg.nrows == 200
+    rows = dg.conn.execute(
+        "SELECT column_1, asset_type, asset_data, asset_thumbnail FROM datagrid JOIN assets ON column_2 = asset_id ORDER BY column_0"
+    ).fetchall()
+    assert [row[:2] for row in rows] == [(i, "Image") for i in range(200)]
+    for i, (_, _, asset_data, thumbnail) in enumerate(rows):
+        image = PIL.Image.open(io.BytesIO(asset_data))
+        assert image.getpixel((0, 0)) == (i, 0, 0)
+        assert thumbnail is not None
+
+
+def test_datagrid_content_asset_ids():
+    import PIL.Image
+
+    def make_rows(start, stop):
+        # Three different images, each in many rows:
+        return [
+            [i, Image(PIL.Image.new("RGB", (20, 10), (i % 3, 0, 0)))]
+            for i in range(start, stop)
+        ]
+
+    def get_assets(dg):
+        return dg.conn.execute(
+            "SELECT column_1, asset_data FROM datagrid LEFT JOIN assets ON column_2 = asset_id ORDER BY column_0"
+        ).fetchall()
+
+    dg = DataGrid(name="content-ids-1", columns=["ID", "Image"])
+    dg.extend(make_rows(0, 10))
+    dg.save(content_asset_ids=True)
+    dg = DataGrid(dg.filename)
+    dg.extend(make_rows(10, 20))
+    assert len(dg.get_asset_ids()) == 3
+    assert len(set(asset_data for i, asset_data in get_assets(dg))) == 3
+
+    dg = DataGrid(name="content-ids-2", columns=["ID", "Image"])
+    dg.extend(make_rows(0, 10))
+    dg.save()
+    assert len(dg.get_asset_ids()) == 10
+    before = get_assets(dg)
+    assert dg.dedupe_assets() == 7
+    assert dg.dedupe_assets() == 0
+    assert len(dg.get_asset_ids()) == 3
+    assert get_assets(dg) == before
+
+
+def test_datagrid_incremental_stats():
+    def make_rows(start, stop):
+        return [
+            [
+                i % 10 if i < 100 else i,
+                "label-%s" % (i % 3) if i % 7 else None,
+                {"a": i} if i % 2 else {"b": str(i)},
+                get_datetime(),
+            ]
+            for i in range(start, stop)
+        ]
+
+    def get_stats(dg):
+        return {
+            row[0]: list(row[1:7]) + [json.loads(row[7]) if row[7] else None]
+            for row in dg.conn.execute(
+                "SELECT name, minimum, maximum, average, variance, total, stddev, other FROM metadata;"
+            )
+        }
+
+    dg = DataGrid(name="stats-1", columns=["Number", "Label", "Data", "Date"])
+    dg.extend(make_rows(0, 50))
+    dg.save()
+    # In the range of the saved numbers, then past it:
+    dg.extend(make_rows(50, 100))
+    histogram = get_stats(dg)["Number"][6]["histogram"]
+    assert histogram["bins"] == [10] * 10
+    dg.extend(make_rows(100, 120))
+    merged = get_stats(dg)
+    dg.compute_statistics()
+    computed = get_stats(dg)
+
+    for name in ["row-id", "Number", "Date"]:
+        assert merged[name][:6] == pytest.approx(computed[name][:6])
+    assert "histogram" not in merged["Number"][6]
+    assert merged["Number"][6]["count"] == computed["Number"][6]["count"] == 120
+    # Counted, rather than bounded, after a merge:
+    assert merged["Number"][6]["count_unique"] == 30
+    assert computed["Number"][6]["count_unique"] == 30
+    assert merged["Number"][6]["count_unique_exact"]
+    assert computed["Number"][6]["count_unique_exact"]
+    assert merged["Label"][6] == computed["Label"][6]
+    assert {
+        key: set(value) for key, value in merged["Data"][6]["completions"].items()
+    } == {key: set(value) for key, value in computed["Data"][6]["completions"].items()}
+
+    # Removed columns keep their stats and field names:
+    dg.remove_columns("Data")
+    dg.append_column("Score", [i / 10 for i in range(120)])
+    schema = dg.get_schema()
+    assert schema["Date"]["field_name"] == "column_4"
+    assert schema["Score"]["field_name"] == "column_5"
+    assert get_stats(dg)["Label"] == computed["Label"]
+    assert get_stats(dg)["Score"][:2] == [0.0, 11.9]
+
+
+def test_datagrid_narrow_histogram():
+    # Too close together, at this size, to divide into bins:
+    dg = DataGrid(name="narrow-1", columns=["Big"])
+    dg.extend([[2**53 + i] for i in range(4)])
+    dg.save()
+    other = json.loads(
+        dg.conn.execute("SELECT other FROM metadata WHERE name = 'Big';").fetchone()[0]
+    )
+    assert other["count"] == 4
+    assert "histogram" not in other
+    # Merging new rows still works without one:
+    dg.extend([[2**53 + 1]])
+    assert dg.nrows == 5
+
+
+def test_numeric_aggregates():
+    values = [1e9 + i / 10 for i in range(1000)] + [None]
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE datagrid (column_1 FLOAT, column_2 INTEGER);")
+    conn.executemany(
+        "INSERT INTO datagrid VALUES (?, ?);", [(value, 7) for value in values]
+    )
+    aggregates = get_numeric_aggregates(conn, ["column_1", "column_2"])
+    minimum, maximum, avg, total, count, variance = aggregates["column_1"]
+    assert (minimum, maximum, count) == (1e9, 1e9 + 99.9, 1000)
+    assert variance == pytest.approx(np.var(values[:-1]))
+    assert aggregates["column_2"][-1] == 0.0
+
+    # The unique count of integers is exact, even if floats aren't:
+    dg = DataGrid(name="aggregates-1", columns=["Big"])
+    dg.extend([[0]] + [[2**53 + i] for i in range(4)])
+    dg.save()
+    other = json.loads(
+        dg.conn.execute("SELECT other FROM metadata WHERE name = 'Big';").fetchone()[0]
+    )
+    assert other["count_unique"] == 5
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+
+import sqlite3
+
+import kangas as kg
+from kangas.server.connections import get_datagrid_version
+from kangas.server.indexes import IndexAdvisor
+from kangas.server.queries import get_database_connection, get_metadata
+
+
+def test_index_advisor(tmp_path):
+    filename = str(tmp_path / "advisor.datagrid")
+    dg = kg.DataGrid(name="Advisor", columns=["Name", "Score"])
+    dg.extend([["row-%s" % i, i / 10] for i in range(10)])
+    dg.save(filename)
+    metadata = get_metadata(get_database_connection(filename), filename)
+    version = get_datagrid_version(filename)
+
+    advisor = IndexAdvisor(enabled=True, threshold=2)
+    advisor.record(filename, metadata, ["column_2", "cc0", None])
+    assert advisor.stats()["indexed"] == 0
+    advisor.record(filename, metadata, ["column_2"])
+    advisor._executor.shutdown(wait=True)
+    assert advisor.stats() == {"enabled": True, "columns": 1, "indexed": 1}
+
+    assert kg.DataGrid.read_datagrid(filename).indexes == {"Score": "datagrid_column_2"}
+    # Cached information about the datagrid is still valid:
+    assert get_datagrid_version(filename) == version
+
+
+def test_index_advisor_failure(tmp_path):
+    filename = str(tmp_path / "failure.datagrid")
+    dg = kg.DataGrid(name="Failure", columns=["Name", "Score"])
+    dg.extend([["row-%s" % i, i / 10] for i in range(10)])
+    dg.save(filename)
+    metadata = get_metadata(get_database_connection(filename), filename)
+
+    advisor = IndexAdvisor(enabled=True, threshold=2)
+    create_index = advisor.create_index
+    # As if the database were locked:
+    advisor.create_index = lambda *args: False
+    for i in range(2):
+        advisor.record(filename, metadata, ["column_2"])
+    advisor._executor.submit(lambda: None).result()
+    assert advisor.stats()["indexed"] == 0
+
+    # Tried again after more uses:
+    advisor.create_index = create_index
+    for i in range(2):
+        advisor.record(filename, metadata, ["column_2"])
+    advisor._executor.shutdown(wait=True)
+    assert advisor.stats()["indexed"] == 1
+    assert kg.DataGrid.read_datagrid(filename).indexes == {"Score": "datagrid_column_2"}
+
+
+def test_index_advisor_disabled(tmp_path):
+    filename = str(tmp_path / "advisor.datagrid")
+    dg = kg.DataGrid(name="Advisor", columns=["Name", "Score"])
+    dg.extend([["row-%s" % i, i / 10] for i in range(10)])
+    dg.save(filename)
+    metadata = get_metadata(get_database_connection(filename), filename)
+
+    advisor = IndexAdvisor(enabled=False, threshold=1)
+    advisor.record(filename, metadata, ["column_1", "column_2"])
+    assert advisor.stats() == {"enabled": False, "columns": 2, "indexed": 0}
+    conn = sqlite3.connect(filename)
+    assert conn.execute("PRAGMA index_list('datagrid');").fetchall() == []
+    conn.close()
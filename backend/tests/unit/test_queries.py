@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023 Kangas Development Team      #
+#    All rights reserved                             #
+######################################################
+
+import os
+import sqlite3
+
+import kangas as kg
+import pytest
+from kangas.server import thumbnails
+from kangas.server.utils import get_size
+from kangas.server.queries import (
+    METADATA_CACHE,
+    RESULT_SET_CACHE,
+    ListComprehension,
+    compile_list_comprehension,
+    get_database_connection,
+    get_group_by_rows,
+    get_metadata,
+    get_projection,
+    get_query_plan,
+    push_down_group_predicate,
+    select_asset,
+    select_category,
+    select_cells,
+    select_description,
+    select_histogram,
+    select_metadata,
+    select_query_count,
+    select_query_page,
+    verify_where,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DGID = "test_queries.datagrid"
+
+dg = kg.DataGrid(
+    name="Queries",
+    columns=["Category", "Score", "Count"],
+)
+for i in range(20):
+    dg.append(["cat-%s" % (i % 3), i / 2, i])
+dg.save(DGID)
+
+
+def test_metadata_cache():
+    METADATA_CACHE.clear()
+    before = METADATA_CACHE.stats()
+    select_metadata(DGID)
+    select_metadata(DGID)
+    after = METADATA_CACHE.stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+
+
+def test_metadata_cache_copy_on_write():
+    select_query_page(
+        DGID,
+        offset=0,
+        group_by=None,
+        sort_by=None,
+        sort_desc=False,
+        where=None,
+        limit=10,
+        select_columns=None,
+        computed_columns={"Double": {"expr": "{'Count'} * 2"}},
+        where_expr="{'Double'} > 10",
+    )
+    metadata = get_metadata(get_database_connection(DGID), DGID)
+    assert "Double" not in metadata
+    metadata["Extra"] = {"field_name": "column_1"}
+    assert "Extra" not in select_metadata(DGID)
+
+
+def test_metadata_cache_sees_changes():
+    select_metadata(DGID)
+    total = select_query_count(DGID, None, None)
+    dg2 = kg.DataGrid.read_datagrid(DGID)
+    dg2.extend([["cat-9", 100.0, 100]])
+    assert select_query_count(DGID, None, None) == total + 1
+    assert select_metadata(DGID)["Score"]["maximum"] == 100.0
+
+
+def test_query_plan_cache():
+    computed_columns = {"Double": {"expr": "{'Count'} * 2"}}
+    conn = get_database_connection(DGID)
+    plan = get_query_plan(conn, DGID, computed_columns, "{'Double'} > 10")
+    total = select_query_count(DGID, "Category", computed_columns, "{'Double'} > 10")
+    assert get_query_plan(conn, DGID, computed_columns, "{'Double'} > 10") is plan
+    assert ("count", "Category") in plan.sql
+    assert (
+        select_query_count(DGID, "Category", computed_columns, "{'Double'} > 10")
+        == total
+    )
+    assert plan.where_sql == "cc0 > 10"
+    assert plan.select_expr_as[-1] == "(column_3 * 2) AS cc0"
+    # The shared metadata isn't part of a plan's size:
+    assert get_size(plan) > get_size(plan.base_metadata) > plan.get_size()
+
+
+def test_thumbnail_saved(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails, "KANGAS_THUMBNAIL_FOLDER", str(tmp_path / "cache"))
+    filename = str(tmp_path / "thumbnails.datagrid")
+    dg = kg.DataGrid(name="Thumbnails", columns=["Image"])
+    dg.append([kg.Image(os.path.join(HERE, "../data/logo.png"))])
+    dg.save(filename)
+    conn = sqlite3.connect(filename)
+    (asset_id,) = conn.execute("SELECT asset_id FROM assets;").fetchone()
+    conn.close()
+
+    select_metadata(filename)
+    version = METADATA_CACHE.stats()
+    thumbnail = select_asset(filename, asset_id, thumbnail=True)
+    conn = sqlite3.connect(filename)
+    (saved,) = conn.execute("SELECT asset_thumbnail FROM assets;").fetchone()
+    conn.close()
+    assert saved == thumbnail
+    assert select_asset(filename, asset_id, thumbnail=True) == thumbnail
+    assert select_asset(filename, asset_id, thumbnail=True, return_image=True).height
+    # Saving the thumbnail doesn't make cached data out of date:
+    select_metadata(filename)
+    assert METADATA_CACHE.stats()["misses"] == version["misses"]
+
+    # A datagrid that can't be written uses the thumbnail cache:
+    conn = sqlite3.connect(filename)
+    conn.execute("UPDATE assets SET asset_thumbnail = NULL;")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(thumbnails, "is_writable", lambda db_path: False)
+    assert select_asset(filename, asset_id, thumbnail=True) == thumbnail
+    assert os.path.exists(thumbnails.get_sidecar_path(filename))
+    assert thumbnails.get_sidecar_thumbnail(filename, asset_id, None) == thumbnail
+
+
+def test_thumbnail_with_annotations_saved(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails, "KANGAS_THUMBNAIL_FOLDER", str(tmp_path / "cache"))
+    filename = str(tmp_path / "annotations.datagrid")
+    image = kg.Image(os.path.join(HERE, "../data/logo.png"))
+    image.add_bounding_box("label", [(0, 0), (10, 10)])
+    dg = kg.DataGrid(name="Annotations", columns=["Image"])
+    dg.append([image])
+    dg.save(filename)
+    # "" means to use the original, but the annotations need drawing:
+    conn = sqlite3.connect(filename)
+    conn.execute("UPDATE assets SET asset_thumbnail = '';")
+    conn.commit()
+    (asset_id,) = conn.execute("SELECT asset_id FROM assets;").fetchone()
+    conn.close()
+
+    thumbnail = select_asset(filename, asset_id, thumbnail=True)
+    # Not saved in the datagrid, so saved in the thumbnail cache:
+    conn = sqlite3.connect(thumbnails.get_sidecar_path(filename))
+    assert conn.execute(
+        "SELECT asset_id, asset_thumbnail FROM thumbnails;"
+    ).fetchall() == [(asset_id, thumbnail)]
+    conn.close()
+    # Not made again:
+    monkeypatch.setattr("kangas.server.queries.save_thumbnail", None)
+    assert select_asset(filename, asset_id, thumbnail=True) == thumbnail
+
+
+def test_group_aggregation():
+    histogram = select_histogram(
+        DGID, "Category", None, "Score", "cat-0", None, None, None
+    )
+    assert histogram["statistics"]["count"] == 7
+    assert histogram["statistics"]["sum"] == 31.5
+    assert histogram["statistics"]["median"] == 4.5
+    assert sum(histogram["bins"]) == 7
+
+    description = select_description(
+        DGID, "Category", None, "Score", "cat-0", None, None, None
+    )
+    assert description["value"] == "7 values"
+
+    computed_columns = {"Parity": {"expr": "{'Count'} % 2"}}
+    category = select_category(
+        DGID, "Category", None, "Parity", "cat-0", None, computed_columns, None
+    )
+    assert category["type"] == "category"
+    assert category["values"] == {"1": 3, "0": 4}
+    assert list(category["values"]) == ["1", "0"]
+
+    category = select_category(
+        DGID, "Category", None, "Category", "cat-0", None, None, "{'Count'} > 3"
+    )
+    assert category["value"] == "cat-0 (5 of them)"
+
+
+def test_select_cells():
+    computed_columns = {"Parity": {"expr": "{'Count'} % 2"}}
+    where_expr = "{'Count'} != 4"
+    cells = []
+    for column_value in ["cat-0", "cat-1", "cat-missing", "cat-0"]:
+        cells.append(
+            {"type": "histogram", "columnName": "Score", "columnValue": column_value}
+        )
+        cells.append(
+            {"type": "category", "columnName": "Parity", "columnValue": column_value}
+        )
+        cells.append(
+            {"type": "description", "columnName": "Count", "columnValue": column_value}
+        )
+    results = select_cells(
+        DGID, "Category", None, cells, None, computed_columns, where_expr
+    )
+    select = {
+        "histogram": select_histogram,
+        "category": select_category,
+        "description": select_description,
+    }
+    for cell, result in zip(cells, results):
+        assert result == select[cell["type"]](
+            DGID,
+            "Category",
+            None,
+            cell["columnName"],
+            cell["columnValue"],
+            None,
+            computed_columns,
+            where_expr,
+        )
+
+
+def test_group_predicate_pushdown():
+    conn = get_database_connection(DGID)
+    cur = conn.cursor()
+    computed_columns = {"Parity": {"expr": "{'Count'} % 2"}}
+    plan = get_query_plan(conn, DGID, computed_columns, "{'Count'} != 4")
+    metadata, columns, select_expr_as, databases = plan.unpack()
+    group_by_expr = metadata["Parity"]["field_expr"]
+    old_sql = (
+        "SELECT value FROM (SELECT %s, %s AS cc0, GROUP_CONCAT(column_3) as value"
+        " FROM datagrid WHERE %s GROUP BY cc0) WHERE cc0 is {value}"
+    ) % (", ".join(select_expr_as), group_by_expr, plan.where_sql)
+    for column_value in ["0", "1", "2", "NULL"]:
+        old = cur.execute(old_sql.replace("{value}", column_value)).fetchall()
+        new = get_group_by_rows(
+            cur,
+            "cc0",
+            group_by_expr,
+            "column_3",
+            "column_3",
+            column_value,
+            plan.where_sql,
+            databases,
+            select_expr_as,
+            False,
+        )
+        old_values = sorted(old[0][0].split(",")) if old else []
+        new_values = sorted(new[0][0].split(",")) if new[0][0] else []
+        assert old_values == new_values
+
+    assert push_down_group_predicate("1", "column_1", ["'a'", "NULL"]) == (
+        "(1) AND ((column_1) IS 'a' OR (column_1) IS NULL)"
+    )
+
+
+def test_projection():
+    select_expr_as = get_projection(
+        ["column_1", "column_2", "column_3", "column_2 * 2 AS cc0", "cc0 + 1 AS cc1"],
+        ["cc1 > 3", None],
+    )
+    assert select_expr_as == ["column_2", "column_2 * 2 AS cc0", "cc0 + 1 AS cc1"]
+
+    computed_columns = {
+        "Double": {"expr": "{'Count'} * 2"},
+        "Above": {"expr": "{'Score'} > AVG({'Score'})"},
+    }
+    conn = get_database_connection(DGID)
+    plan = get_query_plan(conn, DGID, computed_columns, "{'Double'} > 10")
+    select_expr_as, databases = plan.project()
+    assert select_expr_as == ["column_3", "(column_3 * 2) AS cc0"]
+    assert databases == ["datagrid"]
+    select_expr_as, databases = plan.project("cc1")
+    assert select_expr_as == [
+        "column_2",
+        "column_3",
+        "(column_3 * 2) AS cc0",
+        "column_2 > %r AS cc1"
+        % conn.execute("SELECT AVG(column_2) FROM datagrid").fetchone()[0],
+    ]
+
+    count, categories = conn.execute(
+        "SELECT SUM(column_3 * 2 > 10), COUNT(DISTINCT column_1) FROM datagrid"
+    ).fetchone()
+    assert select_query_count(DGID, None, computed_columns, "{'Double'} > 10") == count
+    assert select_query_count(DGID, "Category", computed_columns, None) == categories
+    assert verify_where(DGID, computed_columns, "{'Double'} > 10")["valid"]
+    assert not verify_where(DGID, {"Bad": {"expr": "{'Count'} + "}}, None)["valid"]
+
+
+def test_aggregate_constants():
+    computed_columns = {
+        "Z": {"expr": "({'Score'} - AVG({'Score'})) / STDEV({'Score'})"}
+    }
+    conn = get_database_connection(DGID)
+    plan = get_query_plan(conn, DGID, computed_columns, "{'Score'} == MAX({'Score'})")
+    assert "SELECT" not in plan.where_sql
+    assert "SELECT" not in plan.select_expr_as[-1]
+    assert (
+        select_query_count(DGID, None, computed_columns, "{'Score'} == MAX({'Score'})")
+        == 1
+    )
+
+
+def test_list_comprehension_compiled_once():
+    gen = '[{"label": "a", "score": 0.9}, {"label": "b", "score": 0.1}]'
+    x = "x[&#39;label&#39;]"
+    ifs = "x[&#39;score&#39;] > 0.5"
+    compile_list_comprehension.cache_clear()
+    for i in range(3):
+        assert ListComprehension(x, "x", gen, ifs) == "['a']"
+    assert ListComprehension(x, "x", gen, "") == "['a','b']"
+    info = compile_list_comprehension.cache_info()
+    assert info.misses == 2 and info.hits == 2
+
+
+def test_saved_histogram(tmp_path):
+    dgid = str(tmp_path / "histogram.datagrid")
+    dg = kg.DataGrid(columns=["Score"])
+    dg.extend([[(i * 7) % 100 / 3] for i in range(500)] + [[None]])
+    dg.save(dgid)
+
+    saved = select_histogram(dgid, None, None, "Score", None, None, None, None)
+    scanned = select_histogram(dgid, None, None, "Score", None, None, None, "1 == 1")
+    assert saved["bins"] == scanned["bins"]
+    assert saved["labels"] == scanned["labels"]
+    for key in ["count", "min", "max", "mean", "std", "sum"]:
+        assert saved["statistics"][key] == pytest.approx(scanned["statistics"][key])
+    # The quantiles are approximate:
+    for key in ["25%", "50%", "75%"]:
+        assert saved["statistics"][key] == pytest.approx(
+            scanned["statistics"][key], abs=1
+        )
+    assert "quantiles" not in select_metadata(dgid)["Score"]["other"]
+
+
+def test_saved_categories(tmp_path):
+    dgid = str(tmp_path / "categories.datagrid")
+    dg = kg.DataGrid(columns=["Few", "Many"])
+    dg.extend(
+        [["label-%s" % (i % 5), "value-%s" % i] for i in range(500)] + [[None, None]]
+    )
+    dg.save(dgid)
+
+    def category(column, where_expr=None):
+        return select_category(dgid, None, None, column, None, None, None, where_expr)
+
+    assert category("Few") == category("Few", "1 == 1")
+    # The number of unique values is estimated, or counted exactly:
+    assert category("Many")["value"].startswith("501 values, ")
+    kg.DataGrid(dgid).compute_statistics(["Many"], exact=True)
+    assert category("Many") == category("Many", "1 == 1")
+    assert "top" not in select_metadata(dgid)["Few"]["other"]
+
+
+def test_result_set():
+    computed_columns = {"Double": {"expr": "{'Count'} * 2"}}
+    where_expr = "{'Double'} > 10"
+    RESULT_SET_CACHE.clear()
+
+    def page(offset, sort_by=None, sort_desc=False):
+        return select_query_page(
+            DGID,
+            offset=offset,
+            group_by=None,
+            sort_by=sort_by,
+            sort_desc=sort_desc,
+            where=None,
+            limit=5,
+            select_columns=["Count", "Double"],
+            computed_columns=computed_columns,
+            where_expr=where_expr,
+        )["rows"]
+
+    total = select_query_count(DGID, None, computed_columns, where_expr)
+    conn = get_database_connection(DGID)
+    expected = [
+        row[0]
+        for row in conn.execute(
+            "SELECT column_3 FROM datagrid WHERE column_3 * 2 > 10 ORDER BY column_3 DESC"
+        )
+    ]
+    assert total == len(expected)
+
+    rows = []
+    for offset in range(0, total, 5):
+        rows.extend(page(offset, "Count", True))
+    assert [row["Count"] for row in rows] == expected
+    assert all(row["Double"] == row["Count"] * 2 for row in rows)
+    # One for the count, and one sorted by Count:
+    assert RESULT_SET_CACHE.stats()["size"] == 2
+
+    assert [row["Count"] for row in page(0)] == sorted(expected)[:5]
+    assert RESULT_SET_CACHE.stats()["size"] == 2
+    assert page(total) == []
+
+    # Unfiltered sorted pages use ORDER BY ... LIMIT/OFFSET:
+    rows = select_query_page(
+        DGID,
+        offset=0,
+        group_by=None,
+        sort_by="Count",
+        sort_desc=True,
+        where=None,
+        limit=5,
+        select_columns=["Count"],
+        computed_columns=None,
+    )["rows"]
+    expected = [
+        row[0]
+        for row in conn.execute(
+            "SELECT column_3 FROM datagrid ORDER BY column_3 DESC LIMIT 5"
+        )
+    ]
+    assert [row["Count"] for row in rows] == expected
+    assert RESULT_SET_CACHE.stats()["size"] == 2
+
+
+def test_keyset_pagination(tmp_path):
+    filename = str(tmp_path / "keyset.datagrid")
+    dg = kg.DataGrid(name="Keyset", columns=["Name", "Score"])
+    for i in range(23):
+        dg.append(["row-%s" % i, None if i % 5 == 0 else float(i % 4)])
+    dg.save(filename)
+
+    for sort_desc in [False, True]:
+        non_null = [i for i in range(23) if i % 5 != 0]
+        nulls = [i for i in range(23) if i % 5 == 0]
+        non_null.sort(key=lambda i: -(i % 4) if sort_desc else i % 4)
+        expected = non_null + nulls if sort_desc else nulls + non_null
+
+        names = []
+        cursor = ""
+        while cursor is not None:
+            result = select_query_page(
+                filename,
+                offset=0,
+                group_by=None,
+                sort_by="Score",
+                sort_desc=sort_desc,
+                where=None,
+                limit=4,
+                select_columns=["Name"],
+                computed_columns=None,
+                cursor=cursor,
+            )
+            names.extend(row["Name"] for row in result["rows"])
+            cursor = result["cursor"]
+        assert names == ["row-%s" % i for i in expected]
+
+    # Also from DataGrid.select():
+    dg = kg.DataGrid.read_datagrid(filename)
+    rows, cursor = dg.select(
+        "{'Score'} > 1", sort_by="Score", limit=3, return_cursor=True
+    )
+    selected = rows
+    while cursor is not None:
+        rows, cursor = dg.select(
+            "{'Score'} > 1",
+            sort_by="Score",
+            limit=3,
+            cursor=cursor,
+            return_cursor=True,
+        )
+        selected.extend(rows)
+    assert selected == dg.select("{'Score'} > 1", sort_by="Score")
+
+
+def test_keyset_pagination_errors():
+    def page(cursor, group_by=None, limit=5):
+        return select_query_page(
+            DGID,
+            offset=0,
+            group_by=group_by,
+            sort_by="Score",
+            sort_desc=False,
+            where=None,
+            limit=limit,
+            select_columns=["Score"],
+            computed_columns=None,
+            cursor=cursor,
+        )
+
+    with pytest.raises(ValueError, match="group_by"):
+        page("", group_by="Category")
+    with pytest.raises(ValueError, match="limit"):
+        page("", limit=None)
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        page("not-a-cursor")
+
+    flask_server = pytest.importorskip("kangas.server.flask_server")
+    client = flask_server.application.test_client()
+    response = client.get(
+        "/datagrid/query-page",
+        query_string={"dgid": DGID, "cursor": "", "groupBy": "Category"},
+    )
+    assert response.status_code == 400
+    assert b"group_by" in response.data
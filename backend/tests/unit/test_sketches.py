@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+######################################################
+#     _____                  _____      _     _      #
+#    (____ \       _        |  ___)    (_)   | |     #
+#     _   \ \ ____| |_  ____| | ___ ___ _  _ | |     #
+#    | |  | )/ _  |  _)/ _  | |(_  / __) |/ || |     #
+#    | |__/ ( ( | | | ( ( | | |__| | | | ( (_| |     #
+#    |_____/ \_||_|___)\_||_|_____/|_| |_|\____|     #
+#                                                    #
+#    Copyright (c) 2023-2024 Kangas Development Team #
+#    All rights reserved                             #
+######################################################
+
+import json
+import random
+
+import numpy as np
+import pytest
+
+from kangas.datatypes.sketches import HyperLogLog, QuantileSketch, TopK
+
+
+def test_quantile_sketch_exact():
+    sketch = QuantileSketch()
+    for value in [3, 1, 2, 4]:
+        sketch.update(value)
+    assert sketch.quantiles([0.25, 0.5, 0.75]) == [1.75, 2.5, 3.25]
+    assert QuantileSketch().quantiles([0.5]) == [None]
+
+
+def test_quantile_sketch_merge():
+    random.seed(42)
+    values = [random.random() for i in range(20000)]
+    first = QuantileSketch()
+    second = QuantileSketch()
+    for value in values[:10000]:
+        first.update(value)
+    for value in values[10000:]:
+        second.update(value)
+    first.merge(QuantileSketch.from_dict(json.loads(json.dumps(second.to_dict()))))
+
+    assert first.n == 20000
+    expected = np.quantile(values, [0.1, 0.5, 0.9])
+    for estimate, value in zip(first.quantiles([0.1, 0.5, 0.9]), expected):
+        assert abs(estimate - value) < 0.02
+
+
+def test_hyperloglog_merge():
+    first = HyperLogLog()
+    second = HyperLogLog()
+    for i in range(30000):
+        first.update("value-%s" % i)
+    for i in range(20000, 50000):
+        second.update("value-%s" % i)
+    assert first.count() == pytest.approx(30000, rel=0.05)
+    first.merge(HyperLogLog.from_dict(json.loads(json.dumps(second.to_dict()))))
+    assert first.count() == pytest.approx(50000, rel=0.05)
+
+    small = HyperLogLog()
+    for value in ["a", "b", "c", "a"]:
+        small.update(value)
+    assert small.count() == 3
+
+
+def test_top_k():
+    top = TopK(k=3)
+    for value in ["a", "b", "a", "c", "a", "b"]:
+        top.update(value)
+    assert top.exact
+    assert top.most_common(2) == [("a", 3), ("b", 2)]
+
+    random.seed(42)
+    values = ["a"] * 1000 + ["b"] * 500 + ["v%s" % i for i in range(2000)]
+    random.shuffle(values)
+    first = TopK(k=3)
+    second = TopK(k=3)
+    for value in values[:1750]:
+        first.update(value)
+    for value in values[1750:]:
+        second.update(value)
+    first.merge(TopK.from_dict(json.loads(json.dumps(second.to_dict()))))
+    assert not first.exact
+    assert first.n == len(values)
+    # Counts are low by at most n / (k + 1):
+    assert [value for value, count in first.most_common(2)] == ["a", "b"]
+    assert 1000 - len(values) / 4 <= first.counts["a"] <= 1000
+
+
+def test_quantile_sketch_from_values():
+    random.seed(42)
+    values = np.array([random.random() for i in range(20000)])
+    sketch = QuantileSketch.from_values(values)
+    assert sketch.n == 20000
+    expected = np.quantile(values, [0.1, 0.5, 0.9])
+    for estimate, value in zip(sketch.quantiles([0.1, 0.5, 0.9]), expected):
+        assert abs(estimate - value) < 0.02
+    small = QuantileSketch.from_values(np.array([3, 1, 2, 4]))
+    assert small.quantiles([0.25, 0.5, 0.75]) == [1.75, 2.5, 3.25]